@@ -1,14 +1,21 @@
 import os
 import json
-import sqlite3
 import urllib3
 import requests
-import time
-import google.generativeai as genai
-from docx import Document
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import asyncio
+import hashlib
+from doc_cache import load_docx
+from file_manifest import file_sha256
+from quote_index import QuoteIndex
+from doc_sections import split_sections, merge_points
 from colorama import init, Fore
-from google.api_core import retry
+import time
+from llm_backends import GeminiBackend, OllamaBackend, FakeBackend
+from llm_scheduler import LLMScheduler
+from llm_cache import LLMCache
+from insights_db import init_db, load_status, claim_documents, InsightsWriter
+from tdoc_meta import sniff_doc_type
+from tier_queue import TierQueue
 
 init(autoreset=True)
 # ==========================================
@@ -38,55 +45,80 @@ MODEL_NAME = "gemini-2.5-flash"
 
 DOC_FOLDER = "E:/000_3GPP_Download/tdocs/RAN1_123" # 指向你下载好的文件夹
 DB_NAME = "ran1_knowledge_cloud.db" # 新数据库名
-MAX_WORKERS = 1 # Google 免费层级限制并发，建议 2-5 之间
-
-# 配置 API
-genai.configure(api_key=API_KEY, transport="rest")
-
-# --- 数据库初始化 (一对多结构) ---
-def init_db():
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    # 注意：这里的 id 是自增主键，filename 不再唯一
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS document_insights (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            filename TEXT,
-            vendor TEXT,
-            topic TEXT,             -- 新增：具体的讨论话题
-            stance TEXT,
-            key_argument TEXT,
-            proposed_parameter TEXT,
-            evidence_quote TEXT,
-            is_verified BOOLEAN,
-            analysis_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    conn.commit()
-    return conn
+
+# 每次处理多少篇：None 为全部；调试时可以设成 10 先跑几篇看看效果
+LIMIT = None
+
+# 后端: "gemini" 为云端 API；"ollama" 为本地模型 (同 chat.py)；
+#       "fake" 为本地假后端 (模拟配额和 429，用来调试调度器，不花钱)
+BACKEND = "gemini"
+
+# --- 本地 Ollama 配置 (BACKEND = "ollama" 时生效) ---
+OLLAMA_MODEL = "qwen2.5:14b"
+OLLAMA_HOST = None        # None 为默认 http://localhost:11434
+OLLAMA_PARALLEL = 4       # 并发请求数，需与服务端 OLLAMA_NUM_PARALLEL 一致
+OLLAMA_KEEP_ALIVE = "30m" # 模型常驻时间，避免请求间隙被卸载
+
+# 配额 (按你的 API 档位填写)，调度器按令牌桶匀速放行，不再每次盲等 5 秒
+RPM_LIMIT = 10        # 每分钟请求数
+TPM_LIMIT = 250_000   # 每分钟 token 数
+MAX_CONCURRENCY = 4   # 并发上限，调度器从 1 开始按成功率自动爬升，遇到 429 减半
+
+# 响应缓存模式: on / record / replay / off (默认取环境变量 DEEPSPEC_LLM_CACHE)
+# replay 只读缓存，可以离线全速回放整条分析流程
+LLM_CACHE_MODE = os.environ.get("DEEPSPEC_LLM_CACHE", "on")
+
+# 长文档 (FLS 汇总、主席笔记) 不再截断：超过 SECTION_CHARS 就按段落切成多段并行分析，再合并去重
+SECTION_CHARS = 30000     # 每段最多字符数 (单次调用的输入规模，与之前的截断长度一致)
+SECTION_OVERLAP = 1500    # 相邻两段重叠的字符数，避免跨段的提案被切断
+MAX_SECTIONS = 20         # 单篇最多分析多少段 (成本保护)，超出部分不分析，只体现在覆盖率上
+
+# 文档层级优先级 (README 2.1 上帝视角优先)：按权重平滑轮询分配分析名额，
+# 主席笔记最先出结果，其次 FLS；普通 TDoc 仍保证拿到 weight / 总权重 的吞吐，不会被饿死
+TIER_WEIGHTS = {"Report": 6, "FLS": 3, "TDoc": 1}
+
+# 多个分析进程可以同时跑：别的进程标记 running 且在这么多分钟内的文档先跳过
+RUNNING_STALE_MINUTES = 30
+
+def make_backend():
+    if BACKEND == "fake":
+        return FakeBackend(rpm=RPM_LIMIT, tpm=TPM_LIMIT)
+    if BACKEND == "ollama":
+        return OllamaBackend(OLLAMA_MODEL, host=OLLAMA_HOST, keep_alive=OLLAMA_KEEP_ALIVE)
+    return GeminiBackend(MODEL_NAME, API_KEY)
+
+def make_scheduler(backend, cache):
+    if BACKEND == "ollama":
+        # 本地没有配额，直接按服务端并行度满载
+        return LLMScheduler(backend, max_concurrency=OLLAMA_PARALLEL,
+                            initial_concurrency=OLLAMA_PARALLEL, cache=cache)
+    return LLMScheduler(backend, rpm=RPM_LIMIT, tpm=TPM_LIMIT,
+                        max_concurrency=MAX_CONCURRENCY, cache=cache)
 
 # --- 读取 Docx ---
-def read_docx(file_path):
+def read_paragraphs(file_path):
+    """返回 [(段落文本, 是否标题), ...]，过滤掉太短的行 (标题保留)。"""
     try:
-        doc = Document(file_path)
-        full_text = [p.text for p in doc.paragraphs if len(p.text) > 10]
-        # Gemini 1.5 Flash 上下文很大，可以直接丢进去 3-5万字没问题
-        # 这里限制一下只是为了节省流量，30000字符通常够了
-        return "\n".join(full_text)[:30000]
+        doc = load_docx(file_path)
     except Exception:
         return None
+    paragraphs = []
+    for p in doc["paragraphs"]:
+        is_heading = "heading" in p["style"].lower()
+        if len(p["text"]) > 10 or (is_heading and p["text"].strip()):
+            paragraphs.append((p["text"], is_heading))
+    return paragraphs
+
+def read_docx(file_path):
+    paragraphs = read_paragraphs(file_path)
+    if paragraphs is None:
+        return None
+    return "\n".join(text for text, _ in paragraphs)
 
 # --- 云端分析核心函数 ---
-@retry.Retry() # 自动重试机制，应对网络波动
-def analyze_with_gemini(text, filename):
-    print(f"{Fore.CYAN}[{filename}] 正在连接 Google API...", end="\r") # 增加调试打印
-    
-    # --- 核心修改 2: 强制使用 REST 协议 ---
-    # 这能解决 99% 的“卡住”问题
-    model = genai.GenerativeModel(MODEL_NAME)
-    
+def build_prompt(text, filename):
     # 强制让模型输出 JSON 数组
-    prompt = f"""
+    return f"""
     You are a 3GPP RAN1 Standard Expert. 
     Analyze the following TDoc text from file '{filename}'.
     
@@ -107,119 +139,240 @@ def analyze_with_gemini(text, filename):
     Text content:
     {text}
     """
-    
+
+# Prompt 模板的指纹：改了 Prompt 措辞就自动变化，已分析的文档会按新 Prompt 重跑
+PROMPT_VERSION = hashlib.sha256(build_prompt("{text}", "{filename}").encode("utf-8")).hexdigest()[:12]
+
+def model_key(backend):
+    # 状态表、启动横幅和吞吐统计都用后端实际的模型名 (fake 后端是 fake-model，不是 MODEL_NAME)
+    return f"{backend.name}:{backend.model_name}"
+
+async def analyze_with_llm(scheduler, text, filename):
+    # 限流、并发、429 退避和重试都由调度器负责；返回 LLMResult 或 None
     try:
-        # 设置响应类型为 JSON，Gemini 专属功能
-        response = model.generate_content(
-            prompt,
-            generation_config={"response_mime_type": "application/json"}
-        )
-        print(f"{Fore.BLUE}[{filename}] API 响应成功！      ") # 空格是为了覆盖之前的打印
-        return response.text
+        result = await scheduler.call(build_prompt(text, filename))
+        print(f"{Fore.BLUE}[{filename}] API 响应成功！")
+        return result
     except Exception as e:
         print(f"{Fore.RED}API Error ({filename}): {e}")
         return None
 
 # --- 校验逻辑 ---
-def verify_and_parse(original_text, json_str):
+def verify_and_parse(original_text, json_str, quote_index=None):
+    """
+    解析模型输出，只保留 evidence_quote 能在原文中定位到的观点。
+    原文索引每篇文档只建一次 (可由调用方传入复用)，定位结果写回 quote_start / quote_end / quote_score。
+    """
     valid_records = []
     try:
         data_list = json.loads(json_str)
         # 兼容性处理：如果模型只返回了一个对象而不是数组，把它包成数组
         if isinstance(data_list, dict):
             data_list = [data_list]
+        
+        if quote_index is None:
+            quote_index = QuoteIndex(original_text)
+            
+        if not isinstance(data_list, list):
+            return valid_records
             
         for item in data_list:
+            if not isinstance(item, dict):
+                continue
             quote = item.get('evidence_quote', '')
-            if quote:
-                # 简化校验：去除空格后查找
-                clean_quote = quote.replace(" ", "").strip()[:50] # 只匹配前50个字符增加容错
-                clean_original = original_text.replace(" ", "").replace("\n", "")
-                
-                if clean_quote in clean_original:
-                    valid_records.append(item)
+            # 模型偶尔把 evidence_quote 写成数字 / 列表，这种观点没法核对原文，直接丢弃
+            if not isinstance(quote, str) or not quote:
+                continue
+            try:
+                # 整句比对，容忍空白 / 断词连字符 / 个别字符差异
+                match = quote_index.locate(quote)
+            except Exception as e:
+                print(f"{Fore.YELLOW}跳过无法定位的证据: {e!r}")
+                continue
+            if match:
+                item['quote_start'] = match['start']
+                item['quote_end'] = match['end']
+                item['quote_score'] = match['score']
+                valid_records.append(item)
     except json.JSONDecodeError:
         pass
         
     return valid_records
 
-# --- 线程工作函数 ---
-def worker(file_path, filename):
-    # 1. 读取
-    content = read_docx(file_path)
-    if not content: return None
+# --- 单篇文档处理 ---
+async def process_document(scheduler, file_path, filename):
+    """返回 (filename, points, stats)；读取或全部分段都失败时 points 为 None。"""
+    # 1. 读取 (解析放到线程里，不阻塞调度)
+    paragraphs = await asyncio.to_thread(read_paragraphs, file_path)
+    if paragraphs is None: return (filename, None, None)
+    if not paragraphs:
+        # 空文档 (或只有过短的行)：没有可分析的内容，按 0 个观点完成，不再重试
+        return (filename, [], {"sections": 0, "coverage": 1.0, "prompt_tokens": 0, "output_tokens": 0,
+                               "complete": True})
+    content = "\n".join(text for text, _ in paragraphs)
 
-    print(f"{Fore.YELLOW}[{filename}] 冷却中 (等待API配额)...")
-    time.sleep(5)
-    json_result = analyze_with_gemini(content, filename)
+    # 2. 分段 (短文档只有一段)，各段在调度器下并行分析
+    sections = split_sections(paragraphs, SECTION_CHARS, SECTION_OVERLAP)
+    analyzed = sections[:MAX_SECTIONS]
+    if len(sections) == 1:
+        calls = [analyze_with_llm(scheduler, content, filename)]
+    else:
+        calls = [analyze_with_llm(scheduler, content[s:e], f"{filename} (part {i + 1}/{len(sections)})")
+                 for i, (s, e) in enumerate(analyzed)]
+    results = await asyncio.gather(*calls)
     
-    if json_result:
-        # 3. 校验
-        valid_data = verify_and_parse(content, json_result)
-        return (filename, valid_data)
-    return None
+    ok = [r for r in results if r is not None]
+    if not ok:
+        return (filename, None, None)
 
-# --- 主程序 ---
-def main():
-    conn = init_db()
-    cursor = conn.cursor()
+    # 3. 校验 (全文索引只建一次，证据区间都是相对全文的) + 合并去重
+    def verify_all():
+        quote_index = QuoteIndex(content)
+        points = []
+        for r in ok:
+            points.extend(verify_and_parse(content, r.text, quote_index))
+        return merge_points(points)
+    valid_data = await asyncio.to_thread(verify_all)
+
+    covered = 0
+    last_end = 0
+    for (s, e), r in zip(analyzed, results):
+        if r is not None:
+            covered += max(0, e - max(s, last_end))
+            last_end = max(last_end, e)
+    stats = {
+        "sections": len(sections),
+        "coverage": covered / len(content) if content else 1.0,
+        "prompt_tokens": sum(r.prompt_tokens for r in ok),
+        "output_tokens": sum(r.output_tokens for r in ok),
+        # 实际送去分析的分段全部成功；超出 MAX_SECTIONS 的部分是有意不分析的，不算失败
+        "complete": len(ok) == len(analyzed),
+    }
+    return (filename, valid_data, stats)
+
+async def run_analysis(backend, writer, files_to_process, hashes, tiers):
+    success_count = 0
+    total_points = 0
     
-    # 获取所有 .docx 文件
-    all_files = [f for f in os.listdir(DOC_FOLDER) if f.endswith(".docx")]
+    cache = LLMCache(mode=LLM_CACHE_MODE)
+    # replay 模式所有结果都来自缓存，不需要加载模型
+    if hasattr(backend, "warmup") and LLM_CACHE_MODE != "replay":
+        print(f"{Fore.CYAN}正在加载模型 {backend.model_name} ...")
+        await asyncio.to_thread(backend.warmup)
     
-    # --- 修改点：只取前 10 个文件进行测试 ---
-    # 如果文件少于 10 个，它会自动取全部，不会报错
-    files_to_process = all_files[:10] 
+    queue = TierQueue(TIER_WEIGHTS)
+    for f in files_to_process:
+        queue.put(tiers[f], f)
     
-    print(f"{Fore.GREEN}=== 启动云端分析引擎 (Gemini Flash) ===")
-    print(f"模式: 快速验证 (测试前 10 篇)") # 提示一下当前是测试模式
-    print(f"目标文件数: {len(files_to_process)} | 并发线程: {MAX_WORKERS}")
-
-    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-        future_to_file = {
-            executor.submit(worker, os.path.join(DOC_FOLDER, f), f): f 
-            for f in files_to_process
-        }
-        
-        success_count = 0
-        total_points = 0
-        
-        for future in as_completed(future_to_file):
-            filename = future_to_file[future]
-            try:
-                result = future.result()
-                if result:
-                    name, points_list = result
-                    
-                    if points_list:
-                        # 批量入库
+    t0 = time.time()
+    async with make_scheduler(backend, cache) as scheduler:
+        async def worker():
+            nonlocal success_count, total_points
+            # 每个 worker 处理完一篇才从优先队列取下一篇，出队顺序就是处理顺序
+            while (job := queue.get()) is not None:
+                tier, name = job
+                # 刷新认领时间：排队很久的文档开始处理时不会被其他进程当成过期的 running
+                writer.submit_status(name, hashes[name], "running")
+                try:
+                    _, points_list, stats = await process_document(scheduler, os.path.join(DOC_FOLDER, name), name)
+                    if points_list is not None:
                         for pt in points_list:
-                            cursor.execute('''
-                                INSERT INTO document_insights 
-                                (filename, vendor, topic, stance, key_argument, proposed_parameter, evidence_quote, is_verified)
-                                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                            ''', (
-                                name, 
-                                pt.get('vendor'),
-                                pt.get('topic'), # 重点：现在有了具体话题
-                                pt.get('stance'),
-                                pt.get('key_argument'),
-                                pt.get('proposed_parameter'),
-                                pt.get('evidence_quote'),
-                                True
-                            ))
-                        conn.commit()
-                        print(f"{Fore.GREEN}✅ {name}: 提取到 {len(points_list)} 个观点")
-                        success_count += 1
-                        total_points += len(points_list)
+                            pt["doc_type"] = tier
+                        # 没有通过校验的观点也算处理完成，避免下次重复付费；
+                        # 送去分析的分段有失败时只记 partial，下次运行重试 (MAX_SECTIONS 截断不算失败，
+                        # 记 done，覆盖率 < 100%)
+                        state = "done" if stats["complete"] else "partial"
+                        writer.submit_document(name, hashes[name], points_list, stats, state=state)
+                        detail = (f"分段 {stats['sections']} | 覆盖 {stats['coverage'] * 100:.0f}% | "
+                                  f"tokens {stats['prompt_tokens']}+{stats['output_tokens']}")
+                        if state == "partial":
+                            print(f"{Fore.YELLOW}⚠️ [{tier}] {name}: 部分段落未分析，先保存 {len(points_list)} 个观点 "
+                                  f"(下次运行重试) | {detail}")
+                            total_points += len(points_list)
+                        elif points_list:
+                            print(f"{Fore.GREEN}✅ [{tier}] {name}: 提取到 {len(points_list)} 个观点 | {detail}")
+                            success_count += 1
+                            total_points += len(points_list)
+                        elif stats["sections"] == 0:
+                            print(f"{Fore.YELLOW}⚠️ [{tier}] {name}: 文档没有可分析的正文，记为完成")
+                        else:
+                            print(f"{Fore.YELLOW}⚠️ [{tier}] {name}: API返回有效但无通过校验的观点 | {detail}")
                     else:
-                        print(f"{Fore.YELLOW}⚠️ {name}: API返回有效但无通过校验的观点")
-                else:
-                    print(f"{Fore.RED}❌ {filename}: 分析失败")
-            except Exception as e:
-                print(f"系统异常: {e}")
+                        writer.submit_status(name, hashes[name], "failed", error="读取失败或 API 出错")
+                        print(f"{Fore.RED}❌ [{tier}] {name}: 分析失败 (下次运行会重试)")
+                except Exception as e:
+                    # 不能让认领的文档一直停在 running
+                    writer.submit_status(name, hashes[name], "failed", error=repr(e)[:200])
+                    print(f"系统异常: {e}")
+        
+        # 在途文档数 = 并发上限的两倍：调度器能吃满，排在后面的文档又不会提前占位
+        await asyncio.gather(*(worker() for _ in range(scheduler.concurrency.maximum * 2)))
+    
+    # 吞吐指标：同一批语料分别用云端 / 本地跑，对比这两行即可
+    elapsed = max(time.time() - t0, 1e-6)
+    print(f"{Fore.CYAN}吞吐 [{model_key(backend)}]: {len(files_to_process) / elapsed * 3600:.1f} docs/hour, "
+          f"{scheduler.total_tokens / elapsed:.1f} tokens/s (端到端，含 Prompt)")
+    if hasattr(backend, "stats"):
+        print(backend.stats())
+    
+    return success_count, total_points
 
+# --- 主程序 ---
+def main():
+    conn = init_db(DB_NAME)
+    backend = make_backend()
+    key = model_key(backend)
+    
+    # 获取所有 .docx 文件
+    all_files = sorted(f for f in os.listdir(DOC_FOLDER) if f.endswith(".docx"))
+    
+    # 断点续传：内容、模型、Prompt 都没变且已完成的文档直接跳过
+    status = load_status(conn)
+    hashes = {}
+    files_to_process = []
+    skipped = 0
+    busy = 0
+    for f in all_files:
+        hashes[f] = file_sha256(os.path.join(DOC_FOLDER, f))
+        st = status.get(f)
+        same_input = st and st["content_hash"] == hashes[f] \
+            and st["model"] == key and st["prompt_version"] == PROMPT_VERSION
+        if same_input and st["state"] == "done":
+            skipped += 1
+            continue
+        if same_input and st["state"] == "running" and (st["age"] or 0) < RUNNING_STALE_MINUTES * 60:
+            busy += 1 # 另一个分析进程正在处理
+            continue
+        files_to_process.append(f)
+    
+    # 分层：高权重层排在前面，LIMIT 截断时优先保留
+    tiers = {f: sniff_doc_type(os.path.join(DOC_FOLDER, f), f) for f in files_to_process}
+    files_to_process.sort(key=lambda f: -TIER_WEIGHTS[tiers[f]])
+    if LIMIT:
+        files_to_process = files_to_process[:LIMIT]
+    # 整批一次性认领 (running)：排在队列后面的文档也不会被同时启动的其他进程重复分析
+    claimed = set(claim_documents(conn, files_to_process, hashes, key, PROMPT_VERSION,
+                                  RUNNING_STALE_MINUTES * 60))
+    busy += len(files_to_process) - len(claimed)
+    files_to_process = [f for f in files_to_process if f in claimed]
     conn.close()
+    tier_counts = {t: sum(1 for f in files_to_process if tiers[f] == t) for t in TIER_WEIGHTS}
+    
+    print(f"{Fore.GREEN}=== 启动分析引擎 ({key}) ===")
+    print(f"共 {len(all_files)} 篇 | 已完成跳过 {skipped} 篇 | 其他进程处理中 {busy} 篇 | 本次处理 {len(files_to_process)} 篇 | Prompt 版本 {PROMPT_VERSION}")
+    print("分层: " + " | ".join(f"{t} {n} 篇 (权重 {TIER_WEIGHTS[t]})" for t, n in tier_counts.items()))
+    if BACKEND == "ollama":
+        print(f"本地模式: 并发 {OLLAMA_PARALLEL} | keep_alive {OLLAMA_KEEP_ALIVE}")
+    else:
+        print(f"配额: {RPM_LIMIT} RPM / {TPM_LIMIT} TPM | 并发上限: {MAX_CONCURRENCY}")
+
+    # 所有写入都走单独的写线程，批量提交
+    writer = InsightsWriter(DB_NAME, key, PROMPT_VERSION)
+    try:
+        success_count, total_points = asyncio.run(run_analysis(backend, writer, files_to_process, hashes, tiers))
+    finally:
+        writer.close()
+    print(f"数据库写入: {writer.rows_written} 行 / {writer.transactions} 个事务")
     print("="*40)
     print(f"分析完成！共处理 {success_count} 个文件，入库 {total_points} 个技术观点。")
     print(f"数据库: {DB_NAME}")
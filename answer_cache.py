@@ -0,0 +1,151 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+import numpy as np
+from file_manifest import load_manifest
+
+# === 语义回答缓存 ===
+# 同一个问题换个说法 ("DMRS 怎么定义的" / "DMRS是怎么定义的?") 不再重新生成几十秒的回答：
+#   1. 问题向量与缓存里的问题余弦相似度 >= THRESHOLD；
+#   2. 本次检索到的切片 ID 指纹与当时完全一致 (上下文一样，回答才可以复用)；
+#   3. 知识库版本一致：各集合清单里的 version 任一变化 (重新入库)，旧回答全部作废。
+# 向量以 float32 存进 SQLite，启动时载入内存，查找是一次矩阵乘法。
+
+CACHE_DIR = os.environ.get("DEEPSPEC_CACHE_DIR", "./.deepspec_cache")
+CACHE_PATH = os.path.join(CACHE_DIR, "answers.sqlite")
+CACHE_MODE = os.environ.get("DEEPSPEC_ANSWER_CACHE", "on") # on / off
+THRESHOLD = 0.92      # 问题相似度下限 (MiniLM 余弦)
+MAX_ENTRIES = 5000    # 超出后按最近使用时间淘汰
+
+def kb_version(db_path, collection_names):
+    """各集合清单版本号拼成的字符串，任一集合重新入库都会变。"""
+    versions = {}
+    for name in sorted(collection_names):
+        manifest = load_manifest(os.path.join(db_path, f"{name}_manifest.json"))
+        versions[name] = manifest["version"]
+    return json.dumps(versions, sort_keys=True)
+
+def fingerprint(model, chunk_ids):
+    raw = json.dumps([model, sorted(chunk_ids)], ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+def _normalize(vec):
+    v = np.asarray(vec, dtype=np.float32)
+    n = np.linalg.norm(v)
+    return v / n if n else v
+
+class SemanticAnswerCache:
+    """
+    用法:
+        cache = SemanticAnswerCache()
+        hit = cache.lookup(query_vec, fp, kb)   # -> {"query", "answer", "similarity"} 或 None
+        cache.put(query, query_vec, fp, kb, answer)
+    """
+
+    def __init__(self, path=CACHE_PATH, mode=CACHE_MODE, threshold=THRESHOLD, max_entries=MAX_ENTRIES):
+        if mode not in ("on", "off"):
+            raise ValueError(f"未知的缓存模式: {mode}")
+        self.mode = mode
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._kb = None
+        self._ids = []
+        self._fps = []
+        self._matrix = np.zeros((0, 0), dtype=np.float32)
+        self._conn = None
+        if mode == "off":
+            return
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS answers (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                kb_version TEXT,
+                fingerprint TEXT,
+                query TEXT,
+                embedding BLOB,
+                answer TEXT,
+                created_at REAL,
+                last_used REAL,
+                hits INTEGER DEFAULT 0
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_answers_last_used ON answers(last_used)")
+        self._conn.commit()
+
+    def _sync(self, kb):
+        """知识库版本变了：删除旧版本的回答，重新载入内存矩阵。调用方持锁。"""
+        if kb == self._kb:
+            return
+        stale = self._conn.execute("DELETE FROM answers WHERE kb_version != ?", (kb,)).rowcount
+        self._conn.commit()
+        if stale and self._kb is not None:
+            print(f"知识库已更新，作废 {stale} 条缓存回答")
+        rows = self._conn.execute("SELECT id, fingerprint, embedding FROM answers").fetchall()
+        self._ids = [r[0] for r in rows]
+        self._fps = [r[1] for r in rows]
+        self._matrix = np.stack([np.frombuffer(r[2], dtype=np.float32) for r in rows]) if rows \
+            else np.zeros((0, 0), dtype=np.float32)
+        self._kb = kb
+
+    def lookup(self, query_vec, fp, kb):
+        if self.mode == "off":
+            return None
+        q = _normalize(query_vec)
+        with self._lock:
+            self._sync(kb)
+            best = None
+            if len(self._ids):
+                sims = self._matrix @ q
+                # 相似度从高到低，找第一个上下文指纹也一致的
+                for i in np.argsort(-sims):
+                    if sims[i] < self.threshold:
+                        break
+                    if self._fps[i] == fp:
+                        best = (self._ids[i], float(sims[i]))
+                        break
+            if best is None:
+                self.misses += 1
+                return None
+            row = self._conn.execute("SELECT query, answer FROM answers WHERE id = ?", (best[0],)).fetchone()
+            self._conn.execute("UPDATE answers SET last_used = ?, hits = hits + 1 WHERE id = ?", (time.time(), best[0]))
+            self._conn.commit()
+        self.hits += 1
+        return {"query": row[0], "answer": row[1], "similarity": best[1]}
+
+    def put(self, query, query_vec, fp, kb, answer):
+        if self.mode == "off" or not answer:
+            return
+        q = _normalize(query_vec)
+        now = time.time()
+        with self._lock:
+            self._sync(kb)
+            cur = self._conn.execute("""
+                INSERT INTO answers (kb_version, fingerprint, query, embedding, answer, created_at, last_used)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, (kb, fp, query, q.tobytes(), answer, now, now))
+            self._ids.append(cur.lastrowid)
+            self._fps.append(fp)
+            self._matrix = np.vstack([self._matrix, q]) if len(self._matrix) else q[None, :]
+            if len(self._ids) > self.max_entries:
+                self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        # 淘汰最久没用的 10%，然后重新载入内存矩阵
+        n = len(self._ids) - int(self.max_entries * 0.9)
+        self._conn.execute("""
+            DELETE FROM answers WHERE id IN (SELECT id FROM answers ORDER BY last_used LIMIT ?)
+        """, (n,))
+        kb, self._kb = self._kb, None
+        self._sync(kb)
+
+    def stats(self):
+        return f"回答缓存 ({self.mode}): 命中 {self.hits} / 未命中 {self.misses}"
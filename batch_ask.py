@@ -0,0 +1,171 @@
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from colorama import init, Fore
+from embed_cache import get_embedding_function
+from llm_cache import LLMCache
+from answer_cache import SemanticAnswerCache, kb_version, fingerprint
+from context_packer import pack_context
+from chat import (DB_PATH, MODEL_NAME, LLM_CACHE_MODE, SEARCH_WORKERS, open_collections, open_lexical,
+                  lexical_only, parse_filters, retrieve_batch, build_prompt, generate_answer)
+
+init(autoreset=True)
+
+# === 批量问答 ===
+# 每次会议跑一遍固定的问题清单，不再一个个敲进 chat.py：
+#   1. 问题按 EMBED_BATCH 一批编码 (一次模型前向)；
+#   2. 相同过滤条件的问题一起检索，每个集合一次 query 带全部向量；
+#   3. 生成并发受 GEN_CONCURRENCY 限制 (与 Ollama 的 OLLAMA_NUM_PARALLEL 保持一致)；
+#   4. 每个回答写一行 JSONL：答案、引用来源、各阶段耗时。
+# 编码 / 检索是整批完成的，记录里的 embed / search 是按批均摊到每个问题的耗时。
+
+# === 配置 ===
+QUESTIONS_FILE = "./questions.txt"        # 每行一个问题 (# 开头为注释)；也可以是 {"id", "question"} 的 JSONL
+OUTPUT_FILE = "./batch_answers.jsonl"
+DEFAULT_FILTERS = ""                      # 追加到每个问题后的过滤条件，例如 "meeting:RAN1#123"
+EMBED_BATCH = 64                          # 每批编码的问题数
+GEN_CONCURRENCY = 2                       # 同时生成的回答数
+
+def load_questions(path):
+    """返回 [{"id", "question"}, ...]。"""
+    questions = []
+    with open(path, "r", encoding="utf-8") as f:
+        for n, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            if line.startswith("{"):
+                item = json.loads(line)
+                questions.append({"id": str(item.get("id", n)), "question": item["question"]})
+            else:
+                questions.append({"id": str(n), "question": line})
+    return questions
+
+def source_summary(blocks):
+    sources = []
+    for block in blocks:
+        meta = block["metadata"]
+        src = {"filename": meta.get("filename"), "chunks": block["ids"], "rank": block["rank"]}
+        for key in ("section", "type", "vendor", "meeting", "agenda"):
+            if meta.get(key):
+                src[key] = meta[key]
+        sources.append(src)
+    return sources
+
+def answer_one(item, llm_cache, answer_cache, kb):
+    """生成单个回答 (在线程池里运行)，返回写入 JSONL 的记录。"""
+    timings = item["timings"]
+    t0 = time.perf_counter()
+    spec_hits, tdoc_hits = item["hits"]
+    record = {"id": item["id"], "question": item["raw"], "filters": item["where"]}
+
+    fp = fingerprint(MODEL_NAME, [h["id"] for h in spec_hits + tdoc_hits])
+    cached = answer_cache.lookup(item["embedding"], fp, kb) if item["embedding"] is not None else None
+    spec_blocks, tdoc_blocks, pack_stats = pack_context(spec_hits, tdoc_hits)
+    timings["pack"] = time.perf_counter() - t0
+    record["sources"] = {"spec": source_summary(spec_blocks), "tdoc": source_summary(tdoc_blocks)}
+    record["context"] = pack_stats
+
+    if cached:
+        record["answer"] = cached["answer"]
+        record["cached"] = {"query": cached["query"], "similarity": round(cached["similarity"], 4)}
+        timings["ttft"] = timings["generate"] = 0.0
+    else:
+        prompt = build_prompt(item["query"], spec_blocks, tdoc_blocks)
+        t1 = time.perf_counter()
+        parts = []
+        try:
+            for piece in generate_answer(prompt, llm_cache):
+                if "ttft" not in timings:
+                    timings["ttft"] = time.perf_counter() - t1
+                parts.append(piece)
+        except Exception as e:
+            record["error"] = repr(e)
+        timings["generate"] = time.perf_counter() - t1
+        record["answer"] = "".join(parts)
+        if parts and "error" not in record and item["embedding"] is not None:
+            answer_cache.put(item["query"], item["embedding"], fp, kb, record["answer"])
+    record["timings"] = {k: round(v, 4) for k, v in timings.items() if k != "collections"}
+    return record
+
+def run_batch():
+    print(f"{Fore.CYAN}=== DeepSpec 批量问答 ===")
+    questions = load_questions(QUESTIONS_FILE)
+    if not questions:
+        print(f"{Fore.RED}问题清单为空: {QUESTIONS_FILE}")
+        return
+
+    import chromadb
+    client = chromadb.PersistentClient(path=DB_PATH)
+    ef = get_embedding_function("all-MiniLM-L6-v2")
+    llm_cache = LLMCache(mode=LLM_CACHE_MODE)
+    answer_cache = SemanticAnswerCache()
+    coll_specs, coll_tdocs = open_collections(client, ef)
+    lexical = open_lexical([coll_specs] + coll_tdocs)
+    kb = kb_version(DB_PATH, [coll_specs.name] + [c.name for c in coll_tdocs])
+    print(f"{len(questions)} 个问题 | TDoc 集合: {', '.join(c.name for c in coll_tdocs)} | 生成并发 {GEN_CONCURRENCY}")
+
+    t_start = time.perf_counter()
+    items = []
+    for q in questions:
+        raw = f"{q['question']} {DEFAULT_FILTERS}".strip()
+        query, where = parse_filters(raw)
+        items.append({"id": q["id"], "raw": q["question"], "query": query, "where": where,
+                      "embedding": None, "timings": {}})
+
+    # 1. 批量编码 (编号类问题只查倒排索引，不编码；有集合没建倒排索引时照常编码)
+    targets = [coll_specs] + coll_tdocs
+    to_embed = [it for it in items if not lexical_only(it["query"], lexical, targets)]
+    for i in range(0, len(to_embed), EMBED_BATCH):
+        batch = to_embed[i:i + EMBED_BATCH]
+        t0 = time.perf_counter()
+        vectors = ef([it["query"] for it in batch])
+        share = (time.perf_counter() - t0) / len(batch)
+        for it, vec in zip(batch, vectors):
+            it["embedding"] = vec
+            it["timings"]["embed"] = share
+    t_embed = time.perf_counter() - t_start
+
+    # 2. 按过滤条件分组批量检索
+    groups = {}
+    for it in items:
+        groups.setdefault(json.dumps(it["where"], sort_keys=True), []).append(it)
+    with ThreadPoolExecutor(max_workers=SEARCH_WORKERS) as executor:
+        for group in groups.values():
+            results, timings = retrieve_batch([it["query"] for it in group], [it["embedding"] for it in group],
+                                              coll_specs, coll_tdocs, executor, lexical, group[0]["where"])
+            share = timings["search"] / len(group)
+            for it, hits in zip(group, results):
+                it["hits"] = hits
+                it["timings"]["search"] = share
+    t_retrieve = time.perf_counter() - t_start - t_embed
+    print(f"编码 {t_embed:.2f}s + 检索 {t_retrieve:.2f}s ({len(groups)} 组过滤条件)，开始生成...")
+
+    # 3. 有界并发生成，完成一个写一行
+    written = errors = cached = 0
+    ttfts = []
+    with open(OUTPUT_FILE, "w", encoding="utf-8") as out, ThreadPoolExecutor(max_workers=GEN_CONCURRENCY) as pool:
+        futures = [pool.submit(answer_one, it, llm_cache, answer_cache, kb) for it in items]
+        for future in as_completed(futures):
+            record = future.result()
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+            out.flush()
+            written += 1
+            errors += "error" in record
+            cached += "cached" in record
+            if "ttft" in record["timings"] and "cached" not in record:
+                ttfts.append(record["timings"]["ttft"])
+            status = f"{Fore.RED}失败" if "error" in record else ("缓存" if "cached" in record else
+                                                                  f"{record['timings']['generate']:.1f}s")
+            print(f"[{written}/{len(items)}] {record['id']}: {status}")
+
+    elapsed = time.perf_counter() - t_start
+    avg_ttft = sum(ttfts) / len(ttfts) if ttfts else 0.0
+    print("=" * 40)
+    print(f"{Fore.GREEN}完成 {written} 个问题，用时 {elapsed:.1f}s ({written / elapsed * 60:.1f} 题/分钟) | "
+          f"回答缓存命中 {cached} | 失败 {errors} | 平均首字 {avg_ttft:.2f}s")
+    print(llm_cache.stats())
+    print(f"结果: {OUTPUT_FILE}")
+
+if __name__ == "__main__":
+    run_batch()
@@ -1,49 +1,182 @@
-import chromadb
-import ollama
-from chromadb.utils import embedding_functions
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from embed_cache import get_embedding_function
+from llm_cache import LLMCache, CacheMiss
+from answer_cache import SemanticAnswerCache, kb_version, fingerprint
+from lexical_index import LexicalIndex, lexical_path, is_identifier_query, rrf_fuse
+from tdoc_meta import DOC_TYPES, VENDOR_MAPPING, vendor_key, normalize_meeting
+from context_packer import pack_context, format_pack_stats
 from colorama import init, Fore
 
 init(autoreset=True)
 
 DB_PATH = "./ran1_knowledge_base"
-MODEL_NAME = "qwen2.5:14b" 
+MODEL_NAME = "qwen2.5:14b"
+LLM_CACHE_MODE = os.environ.get("DEEPSPEC_LLM_CACHE", "on") # on / record / replay / off
 
-def chat_loop():
-    print(f"{Fore.CYAN}=== DeepSpec 全栈专家系统 (Spec + TDoc) ===")
-    
-    client = chromadb.PersistentClient(path=DB_PATH)
-    ef = embedding_functions.SentenceTransformerEmbeddingFunction(model_name="all-MiniLM-L6-v2")
-    
-    # 获取两个集合
-    try:
-        coll_specs = client.get_collection(name="ran1_specs", embedding_function=ef)
-        coll_tdocs = client.get_collection(name="ran1_docs", embedding_function=ef)
-    except:
-        print(f"{Fore.RED}错误：请确保你已经分别运行了 indexer.py (TDoc) 和 indexer_specs.py (Spec)！")
-        return
+# === 检索配置 ===
+# 问题只编码一次，拿同一个向量并发查所有集合；以后按会议拆出 ran1_docs_RAN1_124 之类的集合会被自动发现，
+# 检索耗时取决于最慢的那个集合，而不是集合数之和。
+# 每个集合旁边有 BM25 倒排索引 (indexer 同步维护)：向量和字面两路结果按 RRF 融合；
+# 纯编号类问题 ("7.4.1.1.2"、"R1-2501234") 只查倒排，不编码问题向量。
+SPEC_COLLECTION = "ran1_specs"
+TDOC_COLLECTION_PREFIX = "ran1_docs"
+SPEC_RESULTS = 3
+TDOC_RESULTS = 5      # 所有 TDoc 集合合并后按距离取前几条
+SEARCH_WORKERS = 8    # 并发查询集合的线程数
+CANDIDATE_FACTOR = 2  # 每路先取 n_results 的几倍候选，融合后再截断
 
-    while True:
-        query = input(f"\n{Fore.YELLOW}请提问 (e.g. 38.211里DMRS怎么定义的? 各家想怎么改?): {Fore.RESET}")
-        if query.lower() in ["exit", "quit"]: break
-        
-        print(f"{Fore.CYAN}🔍 1. 正在查阅 3GPP 法律条文 (Specs)...")
-        res_specs = coll_specs.query(query_texts=[query], n_results=3)
-        
-        print(f"{Fore.CYAN}🔍 2. 正在查阅 厂商提案 (TDocs)...")
-        res_tdocs = coll_tdocs.query(query_texts=[query], n_results=5)
-        
-        # 组装上下文
-        context_str = "【Part 1: 现有标准定义 (Ground Truth)】\n"
-        for doc in res_specs['documents'][0]:
-            context_str += f"{doc}\n---\n"
-            
-        context_str += "\n【Part 2: 本次会议的提案与争议 (Debate)】\n"
-        for i, doc in enumerate(res_tdocs['documents'][0]):
-            fname = res_tdocs['metadatas'][0][i]['filename']
-            context_str += f"Source: {fname}\nContent: {doc}\n---\n"
-
-        # 让模型综合
-        prompt = f"""
+# 问题里可以带过滤条件 (只作用于 TDoc 集合，Spec 没有这些元数据)：
+#   vendor:Huawei,ZTE  meeting:RAN1#123  type:FLS  agenda:9.1.1
+# 翻译成 Chroma 的 where，先按元数据缩小范围再做向量检索
+_FILTER = re.compile(r"(?<!\S)(vendor|meeting|type|agenda)\s*[:：=]\s*(\S+)", re.I)
+_MEETING_VALUE = re.compile(r"^(?:RAN)?(\d)[#_\s-]*(\d+(?:bis|e)?)$", re.I)
+
+def open_collections(client, ef):
+    """返回 (spec 集合, [TDoc 集合...])，缺集合时抛异常。"""
+    # chromadb >= 0.6 的 list_collections 只返回名字，老版本返回 Collection 对象
+    names = sorted(getattr(c, "name", c) for c in client.list_collections())
+    coll_specs = client.get_collection(name=SPEC_COLLECTION, embedding_function=ef)
+    coll_tdocs = [client.get_collection(name=n, embedding_function=ef)
+                  for n in names if n.startswith(TDOC_COLLECTION_PREFIX)]
+    if not coll_tdocs:
+        raise ValueError(f"没有找到 {TDOC_COLLECTION_PREFIX}* 集合")
+    return coll_specs, coll_tdocs
+
+def open_lexical(collections):
+    """{集合名: LexicalIndex}，还没建倒排索引的集合跳过 (只走向量检索)。"""
+    lexical = {}
+    for c in collections:
+        path = lexical_path(DB_PATH, c.name)
+        if os.path.exists(path):
+            lexical[c.name] = LexicalIndex(path, c.name)
+    return lexical
+
+def lexical_only(query, lexical, collections):
+    """
+    纯编号类问题能不能只查倒排索引、省掉一次编码：要求每个目标集合都有倒排索引，
+    否则没有索引的集合什么都查不到，还是要编码走向量检索。
+    """
+    return is_identifier_query(query) and all(c.name in lexical for c in collections)
+
+def parse_filters(query):
+    """返回 (去掉过滤条件后的问题, Chroma where 或 None)。"""
+    conditions = []
+    for key, value in _FILTER.findall(query):
+        key = key.lower()
+        values = [v for v in value.split(",") if v]
+        if key == "vendor":
+            vendors = list(dict.fromkeys(VENDOR_MAPPING.get(v.lower(), v) for v in values))
+            conditions.append({"$or": [{vendor_key(v): True} for v in vendors]} if len(vendors) > 1
+                              else {vendor_key(vendors[0]): True})
+            continue
+        if key == "meeting":
+            values = [normalize_meeting(*m.groups()) if (m := _MEETING_VALUE.match(v)) else v for v in values]
+        elif key == "type":
+            types = {t.lower(): t for t in DOC_TYPES}
+            values = [types.get(v.lower(), v) for v in values]
+        conditions.append({key: values[0]} if len(values) == 1 else {key: {"$in": values}})
+    clean = " ".join(_FILTER.sub(" ", query).split())
+    if not conditions:
+        return clean, None
+    return clean, conditions[0] if len(conditions) == 1 else {"$and": conditions}
+
+def _query(collection, query_embeddings, n_results, where=None):
+    """一次 collection.query 查多个向量，返回 ([每个向量的 hit 列表], 耗时秒)。"""
+    t0 = time.perf_counter()
+    res = collection.query(query_embeddings=query_embeddings, n_results=n_results, where=where)
+    results = []
+    for ids, docs, metas, dists in zip(res["ids"], res["documents"], res["metadatas"], res["distances"]):
+        results.append([{"id": i, "document": d, "metadata": m or {}, "distance": dist, "collection": collection.name}
+                        for i, d, m, dist in zip(ids, docs, metas, dists)])
+    return results, time.perf_counter() - t0
+
+def _lexical_query(lexical, queries, n_results, where=None):
+    t0 = time.perf_counter()
+    results = [lexical.search(q, n_results, where) for q in queries]
+    return results, time.perf_counter() - t0
+
+def embed_query(ef, query):
+    """问题只编码一次，检索和回答缓存共用这个向量。返回 (向量, 耗时秒)。"""
+    t0 = time.perf_counter()
+    query_embedding = ef([query])[0]
+    return query_embedding, time.perf_counter() - t0
+
+def retrieve_batch(queries, query_embeddings, coll_specs, coll_tdocs, executor, lexical=None, where=None):
+    """
+    同一组过滤条件下的多个问题一起检索：每个集合只调用一次 collection.query (带全部问题向量)，
+    各集合并发；倒排索引按问题逐个查。query_embeddings 里为 None 的问题 (编号查询) 只走倒排索引。
+    返回 ([(spec_hits, tdoc_hits), ...], timings)，timings 是整批的耗时。
+    """
+    lexical = lexical or {}
+    timings = {"collections": {}}
+    t1 = time.perf_counter()
+    vec_idx = [i for i, e in enumerate(query_embeddings) if e is not None]
+    vectors = [query_embeddings[i] for i in vec_idx]
+    jobs = []
+    targets = [("spec", coll_specs, SPEC_RESULTS, None)] + [("tdoc", c, TDOC_RESULTS, where) for c in coll_tdocs]
+    for group, coll, n, coll_where in targets:
+        if vectors:
+            jobs.append((group, "vector", coll.name,
+                         executor.submit(_query, coll, vectors, n * CANDIDATE_FACTOR, coll_where)))
+        if coll.name in lexical:
+            jobs.append((group, "bm25", f"{coll.name}[bm25]",
+                         executor.submit(_lexical_query, lexical[coll.name], queries, n * CANDIDATE_FACTOR, coll_where)))
+
+    merged = [{(g, k): [] for g in ("spec", "tdoc") for k in ("vector", "bm25")} for _ in queries]
+    for group, kind, label, future in jobs:
+        per_query, timings["collections"][label] = future.result()
+        owners = vec_idx if kind == "vector" else range(len(queries))
+        for i, hits in zip(owners, per_query):
+            merged[i][(group, kind)].extend(hits)
+
+    results = []
+    for m in merged:
+        for (group, kind), hits in m.items():
+            if kind == "vector":
+                hits.sort(key=lambda h: h["distance"])
+            else:
+                hits.sort(key=lambda h: -h["bm25"])
+        results.append((rrf_fuse([m[("spec", "vector")], m[("spec", "bm25")]], SPEC_RESULTS),
+                        rrf_fuse([m[("tdoc", "vector")], m[("tdoc", "bm25")]], TDOC_RESULTS)))
+    timings["search"] = time.perf_counter() - t1
+    return results, timings
+
+def retrieve(query, query_embedding, coll_specs, coll_tdocs, executor, lexical=None, where=None):
+    """
+    并发查询 Spec 和全部 TDoc 集合：向量 (query_embedding 为 None 时跳过) + 倒排索引 (lexical 里有的集合)。
+    where 为 TDoc 元数据过滤条件 (parse_filters 的结果)，Spec 不过滤。
+    同一组内多个集合的向量结果按距离合并、字面结果按 BM25 合并，两路再做 RRF 融合。
+    返回 (spec_hits, tdoc_hits, timings)；hit 为 {"id", "document", "metadata", "collection", "rrf",
+    以及 "distance" / "bm25"}，timings 为检索耗时 (秒)，collections 里是每一路各自的查询耗时。
+    """
+    results, timings = retrieve_batch([query], [query_embedding], coll_specs, coll_tdocs, executor, lexical, where)
+    spec_hits, tdoc_hits = results[0]
+    return spec_hits, tdoc_hits, timings
+
+def build_prompt(query, spec_blocks, tdoc_blocks):
+    """spec_blocks / tdoc_blocks 为 context_packer.pack_context 打包后的片段。"""
+    # 组装上下文
+    context_str = "【Part 1: 现有标准定义 (Ground Truth)】\n"
+    for block in spec_blocks:
+        # 章节面包屑存在 metadata 里，不在切片正文中
+        section = block["metadata"].get('section', '')
+        context_str += f"【Context: {section}】\n{block['text']}\n---\n"
+
+    context_str += "\n【Part 2: 本次会议的提案与争议 (Debate)】\n"
+    for block in tdoc_blocks:
+        meta = block["metadata"]
+        source = meta.get('filename', '')
+        # 厂商 / 会议 / 层级一起给模型，方便它按厂商归纳观点
+        tags = [meta[k] for k in ("vendor", "meeting", "type") if meta.get(k) and meta.get(k) != "Unknown"]
+        if tags:
+            source += f" ({' | '.join(tags)})"
+        context_str += f"Source: {source}\nContent: {block['text']}\n---\n"
+
+    # 让模型综合
+    return f"""
         你是一位 3GPP 标准架构师。请根据以下资料回答问题。
         
         【资料结构】：
@@ -61,14 +194,113 @@ def chat_loop():
         【参考资料】：
         {context_str}
         """
-        
-        print(f"{Fore.GREEN}🤖 Qwen 正在思考...")
-        stream = ollama.chat(model=MODEL_NAME, messages=[{'role': 'user', 'content': prompt}], stream=True)
-        
-        print(f"{Fore.WHITE}", end="")
-        for chunk in stream:
-            print(chunk['message']['content'], end="", flush=True)
+
+def generate_answer(prompt, cache):
+    """
+    流式生成回答，逐段 yield 文本。
+    同一 Prompt (问题 + 检索到的资料都一样) 直接回放缓存里的回答。
+    """
+    key = LLMCache.make_key("ollama", MODEL_NAME, {"stream": True}, prompt)
+    hit = cache.get(key) # replay 模式未命中抛 CacheMiss
+    if hit:
+        yield hit[0]
+        return
+
+    import ollama # 只有真正调用模型时才 import，缓存命中 / stub 模式不需要
+    stream = ollama.chat(model=MODEL_NAME, messages=[{'role': 'user', 'content': prompt}], stream=True)
+    parts = []
+    for chunk in stream:
+        piece = chunk['message']['content']
+        parts.append(piece)
+        yield piece
+    cache.put(key, "ollama", MODEL_NAME, "".join(parts))
+
+def format_timings(timings):
+    ms = lambda s: f"{s * 1000:.0f}ms"
+    per_coll = ", ".join(f"{k} {ms(v)}" for k, v in timings["collections"].items())
+    embed = ms(timings["embed"]) if timings.get("embed") is not None else "跳过 (编号查询)"
+    line = f"⏱ 编码 {embed} | 检索 {ms(timings['search'])} ({per_coll})"
+    if "cache" in timings:
+        line += f" | 回答缓存 {ms(timings['cache'])}"
+    if "ttft" in timings:
+        line += f" | 首字 {ms(timings['ttft'])}"
+    if "total" in timings:
+        line += f" | 总计 {timings['total']:.1f}s"
+    return line
+
+def chat_loop():
+    print(f"{Fore.CYAN}=== DeepSpec 全栈专家系统 (Spec + TDoc) ===")
+
+    import chromadb # chromadb import 很慢，放到真正打开知识库时
+    client = chromadb.PersistentClient(path=DB_PATH)
+    ef = get_embedding_function("all-MiniLM-L6-v2")
+    cache = LLMCache(mode=LLM_CACHE_MODE)
+    answer_cache = SemanticAnswerCache()
+
+    # 获取 Spec 集合和所有 TDoc 集合
+    try:
+        coll_specs, coll_tdocs = open_collections(client, ef)
+    except Exception:
+        print(f"{Fore.RED}错误：请确保你已经分别运行了 indexer.py (TDoc) 和 indexer_specs.py (Spec)！")
+        return
+    print(f"TDoc 集合: {', '.join(c.name for c in coll_tdocs)}")
+    lexical = open_lexical([coll_specs] + coll_tdocs)
+    if len(lexical) <= len(coll_tdocs):
+        print(f"{Fore.YELLOW}部分集合还没有倒排索引，重新运行 indexer 后即可启用混合检索。")
+
+    executor = ThreadPoolExecutor(max_workers=SEARCH_WORKERS)
+    while True:
+        raw_query = input(f"\n{Fore.YELLOW}请提问 (e.g. 38.211里DMRS怎么定义的? 各家想怎么改? 可加 vendor:Huawei meeting:RAN1#123 type:FLS): {Fore.RESET}")
+        if raw_query.lower() in ["exit", "quit"]: break
+        query, where = parse_filters(raw_query)
+        if where:
+            print(f"{Fore.CYAN}过滤条件: {where}")
+
+        t0 = time.perf_counter()
+        print(f"{Fore.CYAN}🔍 正在并发查阅 3GPP 法律条文 (Specs) 和 厂商提案 (TDocs)...")
+        # 纯编号类问题直接查倒排索引，省掉一次编码 (所有集合都有倒排索引时)
+        if lexical_only(query, lexical, [coll_specs] + coll_tdocs):
+            query_embedding, embed_time = None, None
+        else:
+            query_embedding, embed_time = embed_query(ef, query)
+        spec_hits, tdoc_hits, timings = retrieve(query, query_embedding, coll_specs, coll_tdocs, executor, lexical, where)
+        timings["embed"] = embed_time
+
+        # 相似问题 + 检索到的切片完全一致 + 知识库没重建 -> 直接给出上次的回答
+        t1 = time.perf_counter()
+        fp = fingerprint(MODEL_NAME, [h["id"] for h in spec_hits + tdoc_hits])
+        kb = kb_version(DB_PATH, [coll_specs.name] + [c.name for c in coll_tdocs])
+        cached = answer_cache.lookup(query_embedding, fp, kb) if query_embedding is not None else None
+        timings["cache"] = time.perf_counter() - t1
+
+        if cached:
+            print(f"{Fore.GREEN}⚡ 命中相似问题 (相似度 {cached['similarity']:.3f}): {cached['query']}")
+            timings["ttft"] = time.perf_counter() - t0
+            print(f"{Fore.WHITE}{cached['answer']}")
+        else:
+            # 合并相邻切片、去重，按相关度装进 token 预算
+            spec_blocks, tdoc_blocks, pack_stats = pack_context(spec_hits, tdoc_hits)
+            print(f"{Fore.CYAN}{format_pack_stats(pack_stats)}")
+            prompt = build_prompt(query, spec_blocks, tdoc_blocks)
+            print(f"{Fore.GREEN}🤖 Qwen 正在思考...")
+
+            print(f"{Fore.WHITE}", end="")
+            parts = []
+            try:
+                for piece in generate_answer(prompt, cache):
+                    if "ttft" not in timings:
+                        timings["ttft"] = time.perf_counter() - t0
+                    parts.append(piece)
+                    print(piece, end="", flush=True)
+                if query_embedding is not None:
+                    answer_cache.put(query, query_embedding, fp, kb, "".join(parts))
+            except CacheMiss as e:
+                print(f"{Fore.RED}{e}")
+        timings["total"] = time.perf_counter() - t0
         print("\n")
+        print(f"{Fore.MAGENTA}{format_timings(timings)}")
+    executor.shutdown()
+    print(answer_cache.stats())
 
 if __name__ == "__main__":
     chat_loop()
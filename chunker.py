@@ -0,0 +1,163 @@
+import re
+import math
+
+# === 按 Token 预算切片 ===
+# all-MiniLM-L6-v2 只看前 256 个 token，超出部分被静默截断，编码器白算。
+# 这里按段落 / 句子边界打包，保证每个切片都落在模型窗口内，
+# 并统计整个语料里浪费 (被截断 / 重叠重复编码) 的 token 数。
+
+TOKENIZER_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+MODEL_MAX_TOKENS = 256 # 模型窗口，含 [CLS] [SEP]
+MAX_TOKENS = MODEL_MAX_TOKENS - 2 # 每个切片正文可用的 token 数
+OVERLAP_TOKENS = 32 # 相邻切片最多重叠的 token 数 (按整句重叠)
+CHUNKER_VERSION = 1 # 切片逻辑改动时 +1，索引清单据此触发全量重建
+
+_SENTENCE_END = re.compile(r'(?<=[.!?;。！？；])\s+')
+_ROUGH_TOKEN = re.compile(r'[一-鿿]|\w+|[^\w\s]')
+
+_tokenizer = None
+_tokenizer_loaded = False
+
+def _get_tokenizer():
+    # 每个解析进程只加载一次；transformers 不可用时退化为粗略估计
+    global _tokenizer, _tokenizer_loaded
+    if not _tokenizer_loaded:
+        _tokenizer_loaded = True
+        try:
+            from transformers import AutoTokenizer
+            _tokenizer = AutoTokenizer.from_pretrained(TOKENIZER_NAME)
+            _tokenizer.model_max_length = 10 ** 9 # 只用来计数，关掉超长警告
+        except Exception:
+            _tokenizer = None
+    return _tokenizer
+
+def count_tokens_batch(texts):
+    tok = _get_tokenizer()
+    if not texts:
+        return []
+    if tok is not None:
+        return [len(ids) for ids in tok(texts, add_special_tokens=False)["input_ids"]]
+    return [_rough_count(t) for t in texts]
+
+def _rough_count(text):
+    # WordPiece 会把生僻词拆成多段，粗略乘个系数 (向上取整，分句计数之和不会低估整段)
+    return math.ceil(len(_ROUGH_TOKEN.findall(text)) * 1.2)
+
+def count_tokens(text):
+    return count_tokens_batch([text])[0]
+
+def _split_long_sentence(sentence, max_tokens):
+    """单句就超预算 (表格、公式、长枚举)：按 token 边界硬切。"""
+    tok = _get_tokenizer()
+    if tok is not None:
+        offsets = tok(sentence, add_special_tokens=False, return_offsets_mapping=True)["offset_mapping"]
+        pieces = []
+        for i in range(0, len(offsets), max_tokens):
+            window = offsets[i:i + max_tokens]
+            start = window[0][0]
+            end = offsets[i + max_tokens][0] if i + max_tokens < len(offsets) else len(sentence)
+            pieces.append(sentence[start:end].strip())
+        return [p for p in pieces if p]
+    pieces, piece, piece_tokens = [], [], 0
+    for word in sentence.split():
+        n = _rough_count(word)
+        if piece and piece_tokens + n > max_tokens:
+            pieces.append(" ".join(piece))
+            piece, piece_tokens = [], 0
+        piece.append(word)
+        piece_tokens += n
+    if piece:
+        pieces.append(" ".join(piece))
+    return pieces
+
+def new_stats():
+    return {"chunks": 0, "source_tokens": 0, "embedded_tokens": 0, "overlap_tokens": 0, "truncated_tokens": 0}
+
+def merge_stats(total, stats):
+    for k, v in stats.items():
+        total[k] = total.get(k, 0) + v
+    return total
+
+def format_stats(stats):
+    src = stats.get("source_tokens", 0) or 1
+    wasted = stats.get("overlap_tokens", 0) + stats.get("truncated_tokens", 0)
+    return (f"切片 {stats.get('chunks', 0)} 个 | 原文 {stats.get('source_tokens', 0)} tokens | "
+            f"编码 {stats.get('embedded_tokens', 0)} tokens | 重叠重复 {stats.get('overlap_tokens', 0)} | "
+            f"被截断 {stats.get('truncated_tokens', 0)} | 浪费 {wasted / src * 100:.1f}%")
+
+def chunk_text(text, max_tokens=MAX_TOKENS, overlap_tokens=OVERLAP_TOKENS):
+    """
+    把文本切成不超过 max_tokens 的切片，优先在段落边界切，其次在句子边界切。
+    相邻切片重叠最后几句 (不超过 overlap_tokens)，保证跨切片的句子仍能被检索到。
+    返回 (chunks, stats)。
+    """
+    stats = new_stats()
+    paragraphs = [p.strip() for p in text.split("\n") if p.strip()]
+    if not paragraphs:
+        return [], stats
+
+    # 句子单元: (文本, token 数, 是否段落开头)
+    units = []
+    for para in paragraphs:
+        sentences = [s for s in _SENTENCE_END.split(para) if s.strip()]
+        for j, (s, n) in enumerate(zip(sentences, count_tokens_batch(sentences))):
+            if n > max_tokens:
+                pieces = _split_long_sentence(s, max_tokens)
+                for k, (piece, m) in enumerate(zip(pieces, count_tokens_batch(pieces))):
+                    units.append((piece, m, j == 0 and k == 0))
+            else:
+                units.append((s, n, j == 0))
+    stats["source_tokens"] = sum(n for _, n, _ in units)
+
+    # 每个段落开头单元对应的整段 token 数，用来决定是否在段落边界切
+    para_tokens = {}
+    start = 0
+    for i in range(1, len(units) + 1):
+        if i == len(units) or units[i][2]:
+            para_tokens[start] = sum(n for _, n, _ in units[start:i])
+            start = i
+
+    chunks = []
+    current = [] # 当前切片里的单元
+    current_tokens = 0
+    carried, carried_tokens = 0, 0 # 当前切片开头从上一片带过来的重叠单元
+
+    def emit():
+        nonlocal current, current_tokens, carried, carried_tokens
+        body = ""
+        for s, _, para_start in current:
+            body += ("\n" if para_start and body else (" " if body else "")) + s
+        chunks.append(body)
+        stats["embedded_tokens"] += current_tokens
+        stats["overlap_tokens"] += carried_tokens
+        # 从末尾往前取整句作为下一片的开头 (至少留一个新单元，保证前进)
+        tail, tail_tokens = [], 0
+        for unit in reversed(current):
+            if tail_tokens + unit[1] > overlap_tokens or len(tail) + 1 >= len(current):
+                break
+            tail.insert(0, unit)
+            tail_tokens += unit[1]
+        current, current_tokens = tail, tail_tokens
+        carried, carried_tokens = len(tail), tail_tokens
+
+    for i, (s, n, para_start) in enumerate(units):
+        # 新段落放不下、而当前切片的新内容已经过半：在段落边界切
+        if para_start and current_tokens - carried_tokens >= max_tokens // 2 \
+                and current_tokens + para_tokens[i] > max_tokens:
+            emit()
+        if current_tokens + n > max_tokens:
+            if len(current) > carried:
+                emit()
+            if current_tokens + n > max_tokens:
+                # 重叠句 + 新句子仍然超预算，放弃重叠
+                current, current_tokens, carried, carried_tokens = [], 0, 0, 0
+        current.append((s, n, para_start))
+        current_tokens += n
+    if len(current) > carried:
+        emit()
+
+    stats["chunks"] = len(chunks)
+    # 实际编码时超出模型窗口的部分 (按拼接后的文本复核一次)
+    for n in count_tokens_batch(chunks):
+        stats["truncated_tokens"] += max(0, n - MAX_TOKENS)
+    return chunks, stats
@@ -1,6 +1,7 @@
 import os
 import shutil
-from docx import Document
+from doc_cache import load_docx
+from tdoc_meta import extract_vendors
 import sys
 import io 
 import re
@@ -14,38 +15,12 @@ dest_dir = 'E:\\000_3GPP_Download\\3GPP_TSGR1_121_Vendor_point'     # 存放分
 # source_dir = 'E:\\000_3GPP_Download\\3GPP_TSGR_108'  # 存放原始Word文档的文件夹
 # dest_dir = 'E:\\000_3GPP_Download\\3GPP_TSGR_108_Vendor_point'     # 存放分类后的文档的文件夹
 
-# 2. 定义用于匹配“Source:”的正则表达式
-source_pattern = re.compile(r'Source:\s*(.+)', re.IGNORECASE)
+# 2. “Source:”正则和厂商映射表在 tdoc_meta.py 里，索引器和这里共用同一套规则
 
 # 3. 定义文件名匹配的正则表达式
 filename_pattern = re.compile(r'^R1-\d{7}\s*-?.*$', re.IGNORECASE)
 # filename_pattern = re.compile(r'^RP-?\d{6}\s*-?.*$', re.IGNORECASE)
 
-# 4. 从图片中提取的静态厂商列表（全部小写）
-# 这是所有有效厂商的“原始”列表
-raw_vendors_from_image = [
-    'huawei', 'ericsson', 'nokia', 'zte', 'catt', 'samsung',
-    'qualcomm', 'mediatek', 'intel', 'nvidia',
-    'apple', 'oppo', 'vivo', 'xiaomi','telstra ',
-    'ntt dcm', 'cmcc', 'vdf', 'dt'
-]
-# 5. 构建厂商名称的映射表
-# 键是所有可能的名称（小写），值是标准化后的文件夹名
-vendor_mapping = {}
-
-# 自动填充映射表，确保所有静态列表中的厂商都能被正确处理
-for vendor in raw_vendors_from_image:
-    # 标准化为文件夹名（首字母大写，移除空格）
-    standardized_name = vendor.title().replace(' ', '')
-    # 建立小写名称到标准化名称的映射
-    vendor_mapping[vendor] = standardized_name
-
-# 手动添加别名或其他不规范的名称到映射表
-# 确保所有别名都是小写，并映射到正确的标准化名称
-vendor_mapping['hisilicon'] = 'Huawei'
-vendor_mapping['nttdcm'] = 'NttDcm'
-vendor_mapping['china mobile'] = 'CMCC' # 举例，如果文档中出现China Mobile
-
 # 6. 定义一个用于清理非法字符的函数
 def sanitize_filename(name):
     """
@@ -72,29 +47,14 @@ def process_documents_with_static_list(source_folder, dest_folder):
             found_vendors = set()
 
             try:
-                doc = Document(file_path)
-                
-                content = ""
-                for i, para in enumerate(doc.paragraphs):
-                    if i >= 10:
-                        break
-                    content += para.text + " "
-                
-                match = source_pattern.search(content)
+                doc = load_docx(file_path)
                 
-                if match:
-                    vendors_str = match.group(1)
-                    vendor_names = re.findall(r'[a-zA-Z0-9]+', vendors_str)
-                    
-                    for vendor_name in vendor_names:
-                        vendor_name_lower = vendor_name.lower()
-                        
-                        final_vendor_name = vendor_mapping.get(vendor_name_lower)
-                        
-                        if final_vendor_name:
-                            found_vendors.add(final_vendor_name)
-                        else:
-                            print(f"警告: 在文档 '{filename}' 中发现未知的厂商或格式错误: '{vendor_name}'。")
+                # 只看前 10 段里的 Source 行
+                lines = [para["text"] for para in doc["paragraphs"][:10]]
+                vendors, unknown = extract_vendors(lines)
+                found_vendors.update(vendors)
+                for vendor_name in unknown:
+                    print(f"警告: 在文档 '{filename}' 中发现未知的厂商或格式错误: '{vendor_name}'。")
 
             except Exception as e:
                 print(f"处理文档 '{filename}' 时出错: {e}")
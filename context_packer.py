@@ -0,0 +1,113 @@
+from llm_scheduler import estimate_tokens
+
+# === 上下文打包 ===
+# 检索结果原样拼进 Prompt 有三个问题：同一文件相邻切片按整句重叠 (chunker.OVERLAP_TOKENS)，同一句话出现两遍；
+# 同一段文字可能出现在多个集合 / 多个切片里；Prompt 没有上限，本地模型 prefill 越来越慢。
+# 这里先把同一文件 (Spec 还要同一章节) 里编号相邻的切片拼接成一段并去掉重叠部分，
+# 再丢掉被已选内容完全包含的片段，最后按相关度 (检索排名) 往 token 预算里装，装不下的跳过。
+
+CONTEXT_BUDGET = 3000 # 参考资料部分的 token 上限 (Prompt 模板和问题另算)
+MIN_OVERLAP = 20      # 拼接时至少重叠这么多字符才认为是切片重叠
+
+def _norm(text):
+    return " ".join(text.split()).lower()
+
+def _join(a, b):
+    """把 b 接到 a 后面，去掉 a 结尾与 b 开头的重叠部分。"""
+    # 用 b 的开头去 a 的尾部找候选位置，再确认 a 从该位置到结尾正好是 b 的前缀
+    probe = b[:MIN_OVERLAP]
+    pos = a.find(probe, max(0, len(a) - len(b)))
+    while pos >= 0:
+        tail = a[pos:]
+        if len(tail) >= MIN_OVERLAP and b.startswith(tail):
+            return a + b[len(tail):]
+        pos = a.find(probe, pos + 1)
+    return a + "\n" + b
+
+def _group_key(hit):
+    meta = hit["metadata"]
+    return hit.get("collection"), meta.get("filename"), meta.get("section")
+
+def _merge_adjacent(hits):
+    """
+    同组 (集合 + 文件 + 章节) 内 part 编号连续的切片合并成一段。
+    返回 block 列表: {"text", "metadata", "ids", "rank"}，rank 取组成切片里最靠前的检索排名。
+    """
+    groups = {}
+    for rank, hit in enumerate(hits):
+        groups.setdefault(_group_key(hit), []).append((hit["metadata"].get("part"), rank, hit))
+    blocks = []
+    merged = 0
+    for items in groups.values():
+        items.sort(key=lambda x: (x[0] is None, x[0] if x[0] is not None else 0))
+        current = None
+        for part, rank, hit in items:
+            if current and part is not None and current["last_part"] is not None and part == current["last_part"] + 1:
+                current["text"] = _join(current["text"], hit["document"])
+                current["ids"].append(hit["id"])
+                current["rank"] = min(current["rank"], rank)
+                current["last_part"] = part
+                merged += 1
+                continue
+            current = {"text": hit["document"], "metadata": hit["metadata"], "ids": [hit["id"]],
+                       "rank": rank, "last_part": part}
+            blocks.append(current)
+    for block in blocks:
+        block.pop("last_part")
+    return blocks, merged
+
+def pack_context(spec_hits, tdoc_hits, budget=CONTEXT_BUDGET, count_tokens=estimate_tokens):
+    """
+    返回 (spec_blocks, tdoc_blocks, stats)。
+    block 为 {"text", "metadata", "ids", "rank"}，各组内按相关度排序；
+    stats 为 {"raw_tokens", "packed_tokens", "saved_tokens", "merged", "duplicates", "over_budget"}。
+    """
+    raw_tokens = sum(count_tokens(h["document"]) for h in spec_hits + tdoc_hits)
+    spec_blocks, merged_spec = _merge_adjacent(spec_hits)
+    tdoc_blocks, merged_tdoc = _merge_adjacent(tdoc_hits)
+
+    # Spec 和 TDoc 按各自列表里的相对排名交错装入，两边都能分到预算
+    candidates = [("spec", b, b["rank"] / max(1, len(spec_hits))) for b in spec_blocks] + \
+                 [("tdoc", b, b["rank"] / max(1, len(tdoc_hits))) for b in tdoc_blocks]
+    candidates.sort(key=lambda c: c[2])
+
+    selected = {"spec": [], "tdoc": []}
+    seen = [] # 已选片段的归一化文本
+    used = 0
+    duplicates = over_budget = 0
+    for group, block, _ in candidates:
+        norm = _norm(block["text"])
+        if any(norm in s for s in seen):
+            duplicates += 1
+            continue
+        cost = count_tokens(block["text"])
+        if used + cost > budget:
+            over_budget += 1
+            continue
+        # 新片段完整包含了之前选中的片段：旧的作废，退还预算
+        for g in selected:
+            for old in [b for b in selected[g] if _norm(b["text"]) in norm]:
+                selected[g].remove(old)
+                used -= count_tokens(old["text"])
+                duplicates += 1
+        seen = [_norm(b["text"]) for g in selected for b in selected[g]] + [norm]
+        selected[group].append(block)
+        used += cost
+
+    for g in selected:
+        selected[g].sort(key=lambda b: b["rank"])
+    stats = {
+        "raw_tokens": raw_tokens,
+        "packed_tokens": used,
+        "saved_tokens": raw_tokens - used,
+        "merged": merged_spec + merged_tdoc,
+        "duplicates": duplicates,
+        "over_budget": over_budget,
+    }
+    return selected["spec"], selected["tdoc"], stats
+
+def format_pack_stats(stats):
+    saved = stats["saved_tokens"]
+    rate = saved / stats["raw_tokens"] * 100 if stats["raw_tokens"] else 0.0
+    return (f"📦 参考资料 {stats['packed_tokens']} tokens (原始 {stats['raw_tokens']}，节省 {saved}，{rate:.0f}%) | "
+            f"合并相邻切片 {stats['merged']} 处 | 去重 {stats['duplicates']} 段 | 超预算跳过 {stats['over_budget']} 段")
@@ -0,0 +1,73 @@
+import os
+import json
+import gzip
+from docx import Document
+from file_manifest import file_sha256
+
+# === 解析结果持久缓存 ===
+# 同一份 .docx / .pdf 会被 analyzer、indexer、indexer_spec、classify_docs、PDF 整理脚本反复打开。
+# 这里按文件内容哈希缓存解析结果 (段落文本 + 样式 + 页眉)，一份文档一辈子只解析一次；
+# 文件被改名 / 移动后哈希不变，缓存照样命中。
+
+CACHE_DIR = os.environ.get("DEEPSPEC_CACHE_DIR", "./.deepspec_cache")
+PARSER_VERSION = 1 # 解析逻辑改动时 +1，旧缓存自动失效
+
+def _cache_path(kind, digest):
+    return os.path.join(CACHE_DIR, f"{kind}_v{PARSER_VERSION}", digest[:2], f"{digest}.json.gz")
+
+def _read_cache(path):
+    try:
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _write_cache(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # 多个解析进程可能同时写同一份缓存，各写各的临时文件再原子替换
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+def _parse_docx(file_path):
+    doc = Document(file_path)
+    paragraphs = []
+    for para in doc.paragraphs:
+        style = para.style.name if para.style is not None else ""
+        paragraphs.append({"text": para.text, "style": style})
+    headers = []
+    for section in doc.sections:
+        for para in section.header.paragraphs:
+            if para.text.strip():
+                headers.append(para.text)
+    return {"paragraphs": paragraphs, "headers": headers}
+
+def load_docx(file_path):
+    """
+    读取 .docx 的解析结果 (优先走缓存)。
+    返回 {"sha256": ..., "paragraphs": [{"text": ..., "style": ...}, ...], "headers": [...]}
+    解析失败时抛出原始异常，由调用方决定怎么处理。
+    """
+    digest = file_sha256(file_path)
+    path = _cache_path("docx", digest)
+    data = _read_cache(path)
+    if data is None:
+        data = _parse_docx(file_path)
+        data["sha256"] = digest
+        _write_cache(path, data)
+    return data
+
+def load_pdf_first_page(file_path):
+    """读取 PDF 第一页的文本 (优先走缓存)，空 PDF 返回 None。"""
+    import fitz  # PyMuPDF，只有 PDF 整理脚本需要
+
+    digest = file_sha256(file_path)
+    path = _cache_path("pdf", digest)
+    data = _read_cache(path)
+    if data is None:
+        with fitz.open(file_path) as doc:
+            data = {"sha256": digest, "page_count": len(doc),
+                    "first_page": doc[0].get_text() if len(doc) else None}
+        _write_cache(path, data)
+    return data["first_page"]
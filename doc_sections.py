@@ -0,0 +1,78 @@
+# === 长文档分段 / 分段结果合并 ===
+# 长文档 (FLS 汇总、主席笔记) 按段落切成若干相互重叠的段分别分析，各段的观点再按证据区间合并去重。
+# 只依赖标准库，分析器之外 (测试、其他脚本) 也可以直接 import。
+
+def split_sections(paragraphs, max_chars, overlap):
+    """
+    把段落打包成若干段，每段不超过 max_chars，优先在标题处断开。
+    返回 [(start, end), ...]，是全文 ("\n" 连接) 中的字符区间，相邻区间重叠约 overlap 个字符。
+    单个段落超过 max_chars (大表格、没有分段的正文) 时按 max_chars 切成相互重叠的窗口，不丢内容。
+    """
+    pieces = [] # (start, end, 是否标题)
+    pos = 0
+    step = max(1, max_chars - overlap)
+    for text, is_heading in paragraphs:
+        end = pos + len(text)
+        if len(text) <= max_chars:
+            pieces.append((pos, end, is_heading))
+        else:
+            win = pos
+            while True:
+                pieces.append((win, min(win + max_chars, end), is_heading and win == pos))
+                if win + max_chars >= end:
+                    break
+                win += step
+        pos = end + 1
+    total = max(0, pos - 1)
+    if total <= max_chars:
+        return [(0, total)]
+
+    sections = []
+    first = 0 # 当前段的第一个片段
+    while first < len(pieces):
+        sec_start = pieces[first][0]
+        last = first
+        # 尽量多装片段
+        while last + 1 < len(pieces) and pieces[last + 1][1] - sec_start <= max_chars:
+            last += 1
+        # 后半段里如果有标题，就在最后一个标题前断开
+        if last + 1 < len(pieces):
+            for k in range(last, first, -1):
+                if pieces[k][2] and pieces[k][0] - sec_start >= max_chars // 2:
+                    last = k - 1
+                    break
+        sec_end = pieces[last][1]
+        sections.append((sec_start, sec_end))
+        if last + 1 >= len(pieces):
+            break
+        # 下一段从末尾往回 overlap 个字符处的片段开始
+        nxt = last + 1
+        while nxt - 1 > first and sec_end - pieces[nxt - 1][0] <= overlap:
+            nxt -= 1
+        first = nxt
+    return sections
+
+def merge_points(points):
+    """
+    合并各段的观点并去重：证据区间重叠过半，或话题 + 立场 + 论点完全相同，视为同一观点，
+    保留证据匹配度更高的那条。
+    """
+    def norm(v):
+        return " ".join(str(v or "").lower().split())
+
+    merged = []
+    for pt in sorted(points, key=lambda p: -(p.get("quote_score") or 0)):
+        dup = False
+        for kept in merged:
+            a0, a1 = pt["quote_start"], pt["quote_end"]
+            b0, b1 = kept["quote_start"], kept["quote_end"]
+            overlap = min(a1, b1) - max(a0, b0)
+            if overlap > 0.5 * min(a1 - a0, b1 - b0) or \
+                    (norm(pt.get("topic")), norm(pt.get("stance")), norm(pt.get("key_argument"))) == \
+                    (norm(kept.get("topic")), norm(kept.get("stance")), norm(kept.get("key_argument"))):
+                dup = True
+                break
+        if not dup:
+            merged.append(pt)
+    merged.sort(key=lambda p: p["quote_start"])
+    return merged
@@ -1,13 +1,14 @@
 import os
-import requests
 import zipfile
 import shutil
-from bs4 import BeautifulSoup
-from urllib.parse import urljoin
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from tqdm import tqdm
 import time
 import urllib3
+from http_session import HttpClient
+from file_manifest import load_manifest, save_manifest
+from meeting_sync import sync_manifest_path, parse_listing, diff_listing
+from zip_extract import ExtractStats, extract_archive, spooled_buffer, SPOOL_MAX
 
 # 禁用安全请求警告
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
@@ -24,24 +25,25 @@ SAVE_DIR = "E:/000_3GPP_Download/tdocs/RAN1_123"
 # 并发线程数 (建议 5-10，太高可能会被 3GPP 服务器封 IP)
 MAX_WORKERS = 8
 
+# 增量同步：对比目录页上的大小 / 修改时间和本地同步清单，只下载新增或有变化的 zip
+# 设为 False 则像以前一样全部重新下载 (清单照样更新)
+SYNC_MODE = True
+SAVE_EVERY = 50 # 每完成多少个文件保存一次同步清单
+
 # ----------------
 
+# 所有线程共用一个 Session：连接池大小 = 线程数，连接复用，失败自动退避重试
+HTTP = HttpClient(pool_size=MAX_WORKERS, verify=False)
+EXTRACT_STATS = ExtractStats()
+
 def get_zip_links(url):
-    """解析页面，获取所有 zip 文件的链接"""
+    """解析页面，获取所有 zip 文件的条目 [{"name", "url", "size", "modified"}]"""
     print(f"正在分析页面: {url} ...")
     try:
         # 3GPP 服务器有时响应慢，设置超时
-        response = requests.get(url, timeout=30, verify=False) # 加上 verify=False
+        response = HTTP.get(url, timeout=30)
         response.raise_for_status()
-        soup = BeautifulSoup(response.text, 'html.parser')
-        
-        links = []
-        for a_tag in soup.find_all('a', href=True):
-            href = a_tag['href']
-            # 只下载 zip 文件，忽略其他链接
-            if href.lower().endswith('.zip'):
-                full_url = urljoin(url, href)
-                links.append(full_url)
+        links = parse_listing(response.text, url)
         
         print(f"✅ 找到 {len(links)} 个文档。")
         return links
@@ -49,52 +51,46 @@ def get_zip_links(url):
         print(f"❌ 获取页面失败: {e}")
         return []
 
-def process_file(url, save_dir):
+def process_file(entry, save_dir):
     """
-    单个文件的处理逻辑：下载 -> 解压 -> 删除压缩包
+    单个文件的处理逻辑：下载 -> 校验解压 (只保留 docx/doc/pdf) -> 删除压缩包
+    小 zip 下载进内存缓冲区直接解压，不落盘；大 zip 下载到 .part (可续传) 再解压
+    返回 (成功与否, 信息, 成功时写回同步清单的记录)
     """
-    filename = url.split('/')[-1]
+    filename = entry["name"]
     zip_path = os.path.join(save_dir, filename)
-    
-    # 简单的去重判断：
-    # 如果对应解压后的 docx/doc/pdf 已经存在，就不下载了
-    # 注意：这里假设 zip 包里的文件名和 zip 本身类似（R1-xxxxx.zip -> R1-xxxxx.docx）
-    # 为了保险，我们还是下载，除非 zip 包本身还在
-    
-    base_name = os.path.splitext(filename)[0]
-    # 检查目录下是否已经有同名的 docx/zip，如果有，可能说明已经下过了
-    # (这一步根据需求可精细化，这里为了简单，不做强力去重，覆盖下载)
+    part_path = zip_path + ".part"
 
     try:
-        # 1. 下载
-        response = requests.get(url, stream=True, timeout=60, verify=False) # 加上 verify=False
-        if response.status_code != 200:
-            return False, f"HTTP Error {response.status_code}"
-        
-        with open(zip_path, 'wb') as f:
-            for chunk in response.iter_content(chunk_size=8192):
-                f.write(chunk)
-        
-        # 2. 解压
+        # 1. 下载 (非 200/206 抛 HTTPError，由下面的 except 处理)
+        # 2. 解压并校验 (CRC + 落盘大小)，每个文件原子写入
         try:
-            with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-                # 3GPP 的 zip 包有时候里面是一个文件夹，有时候直接是文件
-                # 我们直接解压到当前目录
-                zip_ref.extractall(save_dir)
-        except zipfile.BadZipFile:
-            os.remove(zip_path) # 坏的文件删掉
-            return False, "文件损坏 (Bad Zip)"
+            if (entry["size"] or 0) > SPOOL_MAX or os.path.exists(part_path):
+                # 中断后留下的 .part 下次用 Range 请求接着下
+                HTTP.download(entry["url"], part_path, timeout=60, resume=True)
+                os.replace(part_path, zip_path)
+                extracted = extract_archive(zip_path, save_dir, EXTRACT_STATS)
+            else:
+                with spooled_buffer(save_dir) as buf:
+                    size = HTTP.download_to(entry["url"], buf, timeout=60)
+                    extracted = extract_archive(buf, save_dir, EXTRACT_STATS, in_memory=size <= SPOOL_MAX)
+        except zipfile.BadZipFile as e:
+            if os.path.exists(zip_path):
+                os.remove(zip_path) # 坏的文件删掉
+            return False, f"文件损坏 ({e})", None
         
         # 3. 清理 (删除 zip)
-        os.remove(zip_path)
+        if os.path.exists(zip_path):
+            os.remove(zip_path)
         
-        return True, "Success"
+        record = {"size": entry["size"], "modified": entry["modified"], "status": "done", "extracted": extracted}
+        return True, "Success", record
 
     except Exception as e:
-        # 出错了也要尝试清理残余的 zip
+        # 下载中断时保留 .part 供下次续传；已下完但没处理完的 zip 删掉
         if os.path.exists(zip_path):
             os.remove(zip_path)
-        return False, str(e)
+        return False, str(e), None
 
 def main():
     if not os.path.exists(SAVE_DIR):
@@ -102,29 +98,46 @@ def main():
         print(f"创建目录: {SAVE_DIR}")
 
     # 1. 获取链接列表
-    zip_links = get_zip_links(TARGET_URL)
-    if not zip_links:
+    listing = get_zip_links(TARGET_URL)
+    if not listing:
         return
 
+    manifest_path = sync_manifest_path(SAVE_DIR)
+    manifest = load_manifest(manifest_path)
+    if SYNC_MODE:
+        zip_links, unchanged, gone = diff_listing(listing, manifest)
+        print(f"同步清单: {unchanged} 个已是最新，{len(zip_links)} 个需要下载" +
+              (f"，{len(gone)} 个已从服务器目录消失 (本地保留)" if gone else ""))
+        if not zip_links:
+            print("没有新文件，已是最新。")
+            return
+    else:
+        zip_links = listing
+
     print(f"开始下载并处理，使用 {MAX_WORKERS} 个线程并发...")
-    print("注意：下载 -> 自动解压 -> 自动删除ZIP")
+    print("注意：下载 -> 自动解压 (只保留 docx/doc/pdf) -> 自动删除ZIP")
 
     # 2. 多线程下载
     # 使用 tqdm 显示进度条
     with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
         # 提交所有任务
-        future_to_url = {executor.submit(process_file, url, SAVE_DIR): url for url in zip_links}
+        future_to_entry = {executor.submit(process_file, entry, SAVE_DIR): entry for entry in zip_links}
         
         success_count = 0
         fail_count = 0
         
         # 进度条
-        for future in tqdm(as_completed(future_to_url), total=len(zip_links), unit="file"):
-            url = future_to_url[future]
+        for future in tqdm(as_completed(future_to_entry), total=len(zip_links), unit="file"):
+            entry = future_to_entry[future]
+            url = entry["url"]
             try:
-                success, msg = future.result()
+                success, msg, record = future.result()
                 if success:
                     success_count += 1
+                    # 只有校验解压成功的文件才记入清单
+                    manifest["files"][entry["name"]] = record
+                    if success_count % SAVE_EVERY == 0:
+                        save_manifest(manifest_path, manifest)
                 else:
                     fail_count += 1
                     # 可以取消注释下面这行来查看具体失败原因
@@ -133,11 +146,17 @@ def main():
                 fail_count += 1
                 tqdm.write(f"异常: {url} -> {e}")
 
+    if success_count:
+        manifest["version"] += 1
+    save_manifest(manifest_path, manifest)
+
     print("\n" + "="*30)
     print(f"处理完成！")
     print(f"成功: {success_count}")
     print(f"失败: {fail_count}")
     print(f"文件保存在: {os.path.abspath(SAVE_DIR)}")
+    print(HTTP.stats())
+    print(EXTRACT_STATS.format())
     print("="*30)
 
 if __name__ == "__main__":
@@ -1,5 +1,5 @@
 import os
-import requests
+import json
 import zipfile
 import time
 import re
@@ -8,11 +8,22 @@ from bs4 import BeautifulSoup
 from urllib.parse import urljoin, unquote
 import urllib3
 import random
+from http_session import HttpClient
+from zip_extract import ExtractStats, extract_archive, spooled_buffer, SPOOL_MAX
+from listing_cache import ListingCache
+from spec_version import parse_spec_zip, select_versions, format_version
 
 # ================= 配置区域 =================
 BASE_URL = "https://www.3gpp.org/ftp/Specs/archive/38_series/"
 DOWNLOAD_ROOT = "./3GPP_38_Series_Docs_Only"
 MAX_WORKERS = 8  # 建议 4-10 之间，太高会被服务器 Ban
+# 版本选择 (版本号按 3GPP 编码解析，不按字符串排序)：
+#   RELEASE = None                  每个协议的最新版本
+#   RELEASE = 18                    Rel-18 里最新的版本
+#   RELEASE = 19, ALL_VERSIONS=True Rel-19 的全部版本
+# 非 ALL_VERSIONS 模式下新版本解压出文件后，.versions.json 里记录的旧版本文件会被删除
+RELEASE = None
+ALL_VERSIONS = False
 HEADERS = {
     'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
 }
@@ -21,30 +32,73 @@ HEADERS = {
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 VERIFY_SSL = False 
 
-def get_soup(url, retries=3):
-    """请求网页并返回Soup对象 (带重试机制)"""
-    for i in range(retries):
-        try:
-            response = requests.get(url, headers=HEADERS, verify=VERIFY_SSL, timeout=30)
-            response.raise_for_status()
-            return BeautifulSoup(response.text, 'html.parser')
-        except Exception:
-            if i == retries - 1: return None
-            time.sleep(1) # 等一秒重试
-    return None
-
-def unzip_and_clean(zip_path, extract_to):
-    """解压并删除压缩包"""
+# 所有线程共用一个 Session：连接池大小 = 线程数，连接复用，失败按指数退避 + 抖动自动重试
+HTTP = HttpClient(pool_size=MAX_WORKERS, headers=HEADERS, verify=VERIFY_SSL)
+EXTRACT_STATS = ExtractStats()
+# 目录页带 ETag / Last-Modified 缓存，没变化的协议目录只花一个 304
+LISTINGS = ListingCache()
+VERSIONS_FILE = ".versions.json" # 每个协议文件夹里记录已下载的版本 zip
+
+def get_soup(url):
+    """请求网页并返回Soup对象 (重试由 HTTP 会话负责，目录页走条件请求缓存)"""
     try:
-        if not zipfile.is_zipfile(zip_path):
-            os.remove(zip_path)
-            return False
-        with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-            zip_ref.extractall(extract_to)
-        os.remove(zip_path)
-        return True
+        return BeautifulSoup(LISTINGS.fetch(HTTP, url, timeout=30), 'html.parser')
     except Exception:
-        return False
+        return None
+
+def load_versions(folder):
+    path = os.path.join(folder, VERSIONS_FILE)
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_versions(folder, versions):
+    path = os.path.join(folder, VERSIONS_FILE)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(versions, f, ensure_ascii=False, indent=1)
+    os.replace(path + ".tmp", path)
+
+def already_have(folder, versions, filename):
+    """这个版本下过了：记录里有，或者文件夹里已有同名 (38211-i40.docx 之类) 的文件 (兼容以前下载的)"""
+    if filename in versions:
+        return True
+    stem = os.path.splitext(filename)[0].lower()
+    return any(os.path.splitext(f)[0].lower() == stem for f in os.listdir(folder) if f != VERSIONS_FILE)
+
+def prune_superseded(folder, versions, selected):
+    """
+    删除不再被选中的旧版本 (非 ALL_VERSIONS 模式下调用)：.versions.json 里记录的旧版本 zip，
+    删掉它解压出的文件，并从记录里去掉。只删记录里的文件，文件夹里其他文件 (手工放的、以前没有记录的下载) 不动。
+    选中的版本必须都在记录里且解压出了文件才删，否则什么都不做。返回删除的文件数。
+    """
+    keep = {e["filename"] for e in selected}
+    if not all(versions.get(name) for name in keep):
+        return 0 # 新版本没有到位 (下载失败、zip 里没有文档、或是以前没有记录的下载)，旧版本先留着
+    kept_files = {os.path.normcase(f) for name in keep for f in versions[name]}
+    stale = []
+    for name in [n for n in versions if n not in keep]:
+        stale.extend(versions.pop(name))
+    removed = 0
+    for rel in set(stale):
+        path = os.path.join(folder, rel)
+        if os.path.normcase(rel) in kept_files or not os.path.isfile(path):
+            continue
+        os.remove(path)
+        removed += 1
+    return removed
+
+def download_and_extract(url, extract_to):
+    """下载 zip 到内存缓冲区 (大文件自动落盘) 并只解压 docx/doc/pdf，zip 本身不写进下载目录"""
+    try:
+        with spooled_buffer(extract_to) as buf:
+            size = HTTP.download_to(url, buf, timeout=120)
+            return extract_archive(buf, extract_to, EXTRACT_STATS, in_memory=size <= SPOOL_MAX)
+    except zipfile.BadZipFile:
+        return None
 
 def process_single_spec(task_info):
     """
@@ -58,48 +112,59 @@ def process_single_spec(task_info):
     time.sleep(random.uniform(0.1, 1.0))
 
     try:
-        # 1. 目标文件夹检查
+        # 1. 目标文件夹
         target_folder = os.path.join(DOWNLOAD_ROOT, spec_name)
         if not os.path.exists(target_folder):
             os.makedirs(target_folder)
-        
-        # 如果已存在文件，直接跳过
-        if len(os.listdir(target_folder)) > 0:
-            return f"[{spec_name}] 跳过 (已存在)"
 
-        # 2. 获取文件列表
+        # 2. 获取文件列表 (目录页没变时是 304，用缓存)
         soup = get_soup(spec_url)
         if not soup:
             return f"[{spec_name}] 失败 (无法访问目录)"
 
-        zip_links = []
+        entries = []
         for link in soup.find_all('a'):
             href = link.get('href')
-            if href and href.lower().endswith('.zip'):
-                zip_links.append(href)
-        
-        if not zip_links:
-            return f"[{spec_name}] 跳过 (无 zip 文件)"
-
-        # 3. 排序取最新
-        zip_links.sort()
-        latest_href = zip_links[-1]
-        latest_filename = unquote(latest_href.split('/')[-1])
-        full_url = urljoin(spec_url, latest_href)
-        local_zip_path = os.path.join(target_folder, latest_filename)
-
-        # 4. 下载
-        with requests.get(full_url, headers=HEADERS, stream=True, verify=VERIFY_SSL, timeout=120) as r:
-            r.raise_for_status()
-            with open(local_zip_path, 'wb') as f:
-                for chunk in r.iter_content(chunk_size=8192):
-                    f.write(chunk)
+            if not href:
+                continue
+            entry = parse_spec_zip(unquote(href.split('/')[-1]))
+            if entry:
+                entry["url"] = urljoin(spec_url, href)
+                entries.append(entry)
         
-        # 5. 解压
-        if unzip_and_clean(local_zip_path, target_folder):
-            return f"[{spec_name}] 成功下载: {latest_filename}"
-        else:
-            return f"[{spec_name}] 解压失败"
+        if not entries:
+            return f"[{spec_name}] 跳过 (无版本 zip 文件)"
+
+        # 3. 按版本号 / Release 挑选，已经下过的版本跳过
+        selected = select_versions(entries, RELEASE, ALL_VERSIONS)
+        if not selected:
+            return f"[{spec_name}] 跳过 (没有 Rel-{RELEASE} 的版本)"
+        versions = load_versions(target_folder)
+        todo = [e for e in selected if not already_have(target_folder, versions, e["filename"])]
+
+        # 4. 下载 + 解压
+        done, failed = [], []
+        for entry in todo:
+            extracted = download_and_extract(entry["url"], target_folder)
+            if extracted is None:
+                failed.append(entry["filename"])
+                continue
+            versions[entry["filename"]] = extracted
+            done.append(format_version(entry["version"]) + ("" if extracted else " (zip 里没有文档)"))
+
+        # 5. 只保留选中的版本：新版本都解压出文件了才删旧版本，否则旧文件留着
+        removed = 0
+        recorded = set(versions)
+        if not ALL_VERSIONS and not failed:
+            removed = prune_superseded(target_folder, versions, selected)
+        if done or set(versions) != recorded:
+            save_versions(target_folder, versions)
+        note = f" (删除旧版本文件 {removed} 个)" if removed else ""
+        if failed:
+            return f"[{spec_name}] 解压失败: {', '.join(failed)}" + (f" (成功: {', '.join(done)})" if done else "")
+        if not done:
+            return f"[{spec_name}] 跳过 (已是最新: {format_version(selected[-1]['version'])}){note}"
+        return f"[{spec_name}] 成功下载: {', '.join(done)}{note}"
 
     except Exception as e:
         return f"[{spec_name}] 异常: {str(e)[:50]}"
@@ -174,6 +239,9 @@ def main():
 
     print("-" * 50)
     print("所有下载任务已完成！")
+    print(HTTP.stats())
+    print(EXTRACT_STATS.format())
+    print(LISTINGS.stats())
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,173 @@
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+import numpy as np
+
+# === Embedding 缓存 ===
+# 以 (模型名, 切片文本哈希) 为键，把向量以 float32 二进制存进 SQLite。
+# 切片参数改动只影响个别文件、各文档共有的模板段落、TDoc 与 Spec 两个集合里的相同文本，
+# 都只需要编码一次；超过容量上限时按最近使用时间淘汰。
+# 缓存未命中的文本优先交给常驻 Embedding 进程 (embed_server.py) 编码，没有运行时才在本进程加载模型；
+# chromadb 只在创建 Embedding 函数时 import，sentence_transformers / torch 只在真正需要本地模型时才 import。
+
+EMBED_MODEL = "all-MiniLM-L6-v2"
+CACHE_DIR = os.environ.get("DEEPSPEC_CACHE_DIR", "./.deepspec_cache")
+CACHE_PATH = os.path.join(CACHE_DIR, "embeddings.sqlite")
+MAX_CACHE_MB = 1024 # 缓存上限 (MB)，MiniLM 384 维约 1.6KB/条，1GB 约 65 万条
+USE_WORKER = os.environ.get("DEEPSPEC_EMBED_WORKER", "on") == "on" # off: 总是进程内加载模型
+
+class _CachedEmbedding:
+    """
+    包一层 SentenceTransformerEmbeddingFunction，先查缓存，只对没见过的文本调用模型。
+    模型本身懒加载：全部命中时 (例如 no-op 重新入库、重复提问) 连模型都不用加载。
+    """
+
+    def __init__(self, model_name=EMBED_MODEL, cache_path=CACHE_PATH, max_mb=MAX_CACHE_MB, prefer_worker=USE_WORKER):
+        self.model_name = model_name
+        self.max_bytes = max_mb * 1024 * 1024
+        self.prefer_worker = prefer_worker
+        self.backend = None   # "worker" / "local"，模型没用到时为 None
+        self.load_time = 0.0  # 连接常驻进程或加载本地模型的耗时
+        self._inner = None
+        self._lock = threading.Lock()
+        self._model_lock = threading.Lock()
+        os.makedirs(os.path.dirname(cache_path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(cache_path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS embeddings (
+                key BLOB PRIMARY KEY,
+                vec BLOB,
+                last_used INTEGER
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_emb_last_used ON embeddings(last_used)")
+        self._conn.commit()
+        self._rows = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        self.hits = 0
+        self.misses = 0
+
+    def _model(self):
+        with self._model_lock:
+            if self._inner is None:
+                t0 = time.perf_counter()
+                if self.prefer_worker:
+                    from embed_server import connect, RemoteEmbedding
+                    conn = connect()
+                    if conn is not None:
+                        self._inner, self.backend = RemoteEmbedding(conn, self.model_name), "worker"
+                if self._inner is None:
+                    from chromadb.utils import embedding_functions
+                    self._inner = embedding_functions.SentenceTransformerEmbeddingFunction(model_name=self.model_name)
+                    self.backend = "local"
+                self.load_time = time.perf_counter() - t0
+            return self._inner
+
+    def _encode(self, texts):
+        from embed_server import WorkerUnavailable
+        try:
+            return self._model()(texts)
+        except WorkerUnavailable as e:
+            # 常驻进程中途退出：本次运行剩下的部分改为进程内编码
+            print(f"{e}，改为进程内加载模型")
+            with self._model_lock:
+                self._inner = None
+                self.prefer_worker = False
+            return self._model()(texts)
+
+    def _key(self, text):
+        return hashlib.sha256(f"{self.model_name}\0{text}".encode("utf-8")).digest()
+
+    def __call__(self, input):
+        texts = list(input)
+        keys = [self._key(t) for t in texts]
+        now = int(time.time())
+
+        found = {}
+        with self._lock:
+            unique = list(set(keys))
+            for i in range(0, len(unique), 500):
+                part = unique[i:i + 500]
+                rows = self._conn.execute(
+                    f"SELECT key, vec FROM embeddings WHERE key IN ({','.join('?' * len(part))})", part
+                ).fetchall()
+                found.update(rows)
+            if found:
+                self._conn.executemany("UPDATE embeddings SET last_used=? WHERE key=?",
+                                       [(now, k) for k in found])
+                self._conn.commit()
+
+        # 同一批里重复的文本也只编码一次
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found and key not in missing:
+                missing[key] = text
+        self.hits += len(texts) - len(missing)
+        self.misses += len(missing)
+
+        if missing:
+            vectors = self._encode(list(missing.values()))
+            new_rows = []
+            for key, vec in zip(missing, vectors):
+                blob = np.asarray(vec, dtype=np.float32).tobytes()
+                found[key] = blob
+                new_rows.append((key, blob, now))
+            with self._lock:
+                self._conn.executemany("INSERT OR REPLACE INTO embeddings (key, vec, last_used) VALUES (?, ?, ?)",
+                                       new_rows)
+                self._conn.commit()
+                self._rows += len(new_rows)
+                self._evict(len(new_rows[0][1]))
+
+        return [np.frombuffer(found[k], dtype=np.float32).tolist() for k in keys]
+
+    def _evict(self, vec_bytes):
+        # 每行大约 = 向量 + 键 + 索引开销；超限时一次淘汰最久未用的 10%，避免频繁删除
+        limit = self.max_bytes // (vec_bytes + 64)
+        if self._rows <= limit:
+            return
+        n = self._rows - int(limit * 0.9)
+        self._conn.execute("""
+            DELETE FROM embeddings WHERE key IN (
+                SELECT key FROM embeddings ORDER BY last_used LIMIT ?
+            )
+        """, (n,))
+        self._conn.commit()
+        self._rows = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def stats(self):
+        total = self.hits + self.misses
+        rate = self.hits / total * 100 if total else 0.0
+        if self.backend == "worker":
+            model = f"常驻进程 (连接 {self.load_time * 1000:.0f}ms)"
+        elif self.backend == "local":
+            model = f"进程内加载 ({self.load_time:.1f}s)"
+        else:
+            model = "未加载"
+        return f"Embedding 缓存: 命中 {self.hits} / 编码 {self.misses} (命中率 {rate:.1f}%) | 模型: {model}"
+
+_embedding_class = None
+
+def _cached_embedding_class():
+    """继承 chromadb 的 EmbeddingFunction 接口，但 chromadb 推迟到第一次创建 Embedding 函数时才 import。"""
+    global _embedding_class
+    if _embedding_class is None:
+        from chromadb.api.types import EmbeddingFunction
+
+        class CachedEmbeddingFunction(_CachedEmbedding, EmbeddingFunction):
+            __doc__ = _CachedEmbedding.__doc__
+
+        _embedding_class = CachedEmbeddingFunction
+    return _embedding_class
+
+def __getattr__(name):
+    # 兼容 from embed_cache import CachedEmbeddingFunction
+    if name == "CachedEmbeddingFunction":
+        return _cached_embedding_class()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def get_embedding_function(model_name=EMBED_MODEL):
+    """indexer / indexer_spec / chat 统一从这里拿 Embedding 函数。"""
+    return _cached_embedding_class()(model_name=model_name)
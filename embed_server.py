@@ -0,0 +1,238 @@
+import os
+import sys
+import time
+import queue
+import threading
+import subprocess
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Listener, Client
+
+# === 常驻 Embedding 进程 ===
+# indexer / indexer_spec / chat / batch_ask 每次启动都要 import torch + 加载 SentenceTransformer，白等好几秒。
+# 这个进程把模型加载一次常驻内存，其他工具经本地套接字发编码请求 (embed_cache 里的 CachedEmbeddingFunction
+# 缓存未命中时优先走这里，连不上就退回进程内加载模型，行为不变)。
+#   - 地址: Linux / macOS 用 Unix 套接字 (EMBED_SOCKET)，Windows 用本机 TCP 端口 (EMBED_PORT)；
+#   - 每个连接一个线程收请求，编码由单个批处理线程完成：同一时刻多个工具的请求拼成一批，一次模型前向；
+#   - 模型按名字懒加载并常驻，启动时预加载 EMBED_MODEL；
+#   - 连接认证用随机密钥：服务端首次启动时生成，存在 EMBED_KEY_FILE (权限 0600)，客户端从同一文件读取，
+#     只有能读这个文件的用户才能连上 (Windows 的 TCP 端口尤其需要)。DEEPSPEC_EMBED_AUTHKEY 可以覆盖。
+# 用法: python embed_server.py          (常驻服务)
+#       DEEPSPEC_EMBED_MODE=bench python embed_server.py   (对比冷启动 / 常驻两种方式的首次编码耗时)
+
+# === 配置 ===
+EMBED_MODEL = "all-MiniLM-L6-v2"
+CACHE_DIR = os.environ.get("DEEPSPEC_CACHE_DIR", "./.deepspec_cache")
+EMBED_SOCKET = os.path.join(CACHE_DIR, "embed.sock")
+EMBED_PORT = int(os.environ.get("DEEPSPEC_EMBED_PORT", "8766"))
+EMBED_KEY_FILE = os.path.join(CACHE_DIR, "embed.key")
+EMBED_TIMEOUT = 120      # 客户端等一次编码结果的最长时间 (秒)，超时退回进程内编码
+MODE = os.environ.get("DEEPSPEC_EMBED_MODE", "serve") # serve / bench
+MAX_BATCH = 512          # 合并后一次送进模型的文本数上限
+BENCH_TEXTS = 32         # bench 模式每次编码的文本数
+
+def server_address():
+    if sys.platform == "win32":
+        return ("127.0.0.1", EMBED_PORT)
+    return os.path.abspath(EMBED_SOCKET)
+
+def load_authkey(create=False):
+    """
+    读取连接密钥。create=True (服务端) 时密钥文件不存在就生成 32 字节随机密钥，以 0600 权限创建；
+    客户端读不到密钥返回 None。
+    """
+    env = os.environ.get("DEEPSPEC_EMBED_AUTHKEY")
+    if env:
+        return env.encode("utf-8")
+    try:
+        with open(EMBED_KEY_FILE, "rb") as f:
+            return f.read() or None
+    except FileNotFoundError:
+        if not create:
+            return None
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    try:
+        fd = os.open(EMBED_KEY_FILE, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        # 另一个服务端进程刚刚生成
+        with open(EMBED_KEY_FILE, "rb") as f:
+            return f.read() or None
+    key = os.urandom(32)
+    with os.fdopen(fd, "wb") as f:
+        f.write(key)
+    return key
+
+def connect(timeout=0.5):
+    """连接常驻进程，返回 Connection；没有运行或读不到密钥时返回 None (调用方退回进程内编码)。"""
+    address = server_address()
+    if isinstance(address, str) and not os.path.exists(address):
+        return None
+    authkey = load_authkey()
+    if authkey is None:
+        return None
+    try:
+        conn = Client(address, authkey=authkey)
+        conn.send(("ping",))
+        if not conn.poll(timeout):
+            conn.close()
+            return None
+        status, _ = conn.recv()
+        return conn if status == "ok" else None
+    except (OSError, EOFError, AuthenticationError):
+        return None
+
+class WorkerUnavailable(ConnectionError):
+    pass
+
+class RemoteEmbedding:
+    """常驻进程的客户端，接口与 SentenceTransformerEmbeddingFunction 相同: encoder(texts) -> 向量列表。"""
+
+    def __init__(self, conn, model_name, timeout=EMBED_TIMEOUT):
+        self._conn = conn
+        self.model_name = model_name
+        self.timeout = timeout
+        self._lock = threading.Lock()
+
+    def __call__(self, texts):
+        with self._lock:
+            try:
+                self._conn.send(("encode", self.model_name, list(texts)))
+                ready = self._conn.poll(self.timeout)
+                if ready:
+                    status, payload = self._conn.recv()
+            except (EOFError, OSError) as e:
+                raise WorkerUnavailable(f"常驻 Embedding 进程断开: {e!r}")
+            if not ready:
+                # 迟到的结果会和下一个请求错位，这个连接直接作废
+                self._conn.close()
+                raise WorkerUnavailable(f"常驻 Embedding 进程 {self.timeout}s 内没有返回")
+        if status != "ok":
+            raise RuntimeError(f"常驻 Embedding 进程编码失败: {payload}")
+        return payload
+
+class EmbedServer:
+    def __init__(self, preload=(EMBED_MODEL,)):
+        self._models = {}
+        self._requests = queue.Queue()
+        self.served = 0
+        self.batches = 0
+        for name in preload:
+            t0 = time.perf_counter()
+            self._model(name)
+            print(f"模型 {name} 加载完成，用时 {time.perf_counter() - t0:.1f}s")
+
+    def _model(self, name):
+        # 只在批处理线程 (和启动时) 调用，不需要加锁
+        if name not in self._models:
+            from chromadb.utils import embedding_functions
+            self._models[name] = embedding_functions.SentenceTransformerEmbeddingFunction(model_name=name)
+        return self._models[name]
+
+    def _batch_loop(self):
+        import numpy as np
+        while True:
+            pending = [self._requests.get()]
+            size = len(pending[0]["texts"])
+            # 把此刻已经排队的请求一起编码
+            while size < MAX_BATCH:
+                try:
+                    req = self._requests.get_nowait()
+                except queue.Empty:
+                    break
+                pending.append(req)
+                size += len(req["texts"])
+            by_model = {}
+            for req in pending:
+                by_model.setdefault(req["model"], []).append(req)
+            for name, reqs in by_model.items():
+                texts = [t for req in reqs for t in req["texts"]]
+                try:
+                    vectors = np.asarray(self._model(name)(texts), dtype=np.float32)
+                    result = None
+                except Exception as e:
+                    vectors, result = [], ("error", repr(e))
+                pos = 0
+                for req in reqs:
+                    n = len(req["texts"])
+                    req["result"] = result or ("ok", vectors[pos:pos + n])
+                    pos += n
+                    req["done"].set()
+                self.batches += 1
+                self.served += len(texts)
+
+    def _handle(self, conn):
+        with conn:
+            while True:
+                try:
+                    msg = conn.recv()
+                except (EOFError, OSError):
+                    return
+                if msg[0] == "ping":
+                    conn.send(("ok", {"models": list(self._models), "served": self.served, "batches": self.batches}))
+                elif msg[0] == "encode":
+                    _, name, texts = msg
+                    req = {"model": name, "texts": list(texts), "done": threading.Event()}
+                    self._requests.put(req)
+                    req["done"].wait()
+                    try:
+                        conn.send(req["result"])
+                    except OSError:
+                        return # 客户端等超时已经断开
+                else:
+                    conn.send(("error", f"未知请求: {msg[0]}"))
+
+    def serve_forever(self):
+        address = server_address()
+        authkey = load_authkey(create=True)
+        if isinstance(address, str):
+            if connect() is not None:
+                print(f"常驻 Embedding 进程已在运行: {address}")
+                return
+            if os.path.exists(address):
+                os.remove(address) # 上次异常退出留下的套接字文件
+            os.makedirs(os.path.dirname(address), exist_ok=True)
+        threading.Thread(target=self._batch_loop, daemon=True).start()
+        with Listener(address, authkey=authkey) as listener:
+            print(f"常驻 Embedding 进程已启动: {address}")
+            while True:
+                try:
+                    conn = listener.accept()
+                except (OSError, EOFError, AuthenticationError):
+                    continue # 认证失败、握手中途断开等，忽略这个连接
+                threading.Thread(target=self._handle, args=(conn,), daemon=True).start()
+
+# 在独立子进程里测一次 "拿到 Embedding 函数 + 编码一批没见过的文本" 的耗时，两种方式都不走 SQLite 缓存
+_BENCH_CHILD = """
+import sys, time
+t0 = time.perf_counter()
+from embed_cache import CachedEmbeddingFunction
+ef = CachedEmbeddingFunction(cache_path=sys.argv[1], prefer_worker=(sys.argv[2] == "worker"))
+ef([f"benchmark sentence {i} {t0}" for i in range(int(sys.argv[3]))])
+print(f"{time.perf_counter() - t0:.3f} {ef.backend}")
+"""
+
+def benchmark(rounds=3):
+    import tempfile
+    print(f"=== 首次编码耗时 (新进程，import + 加载 / 连接 + 编码 {BENCH_TEXTS} 条) ===")
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for mode in ("local", "worker"):
+            for i in range(rounds):
+                out = subprocess.run([sys.executable, "-c", _BENCH_CHILD, os.path.join(tmp, f"{mode}{i}.sqlite"),
+                                      mode, str(BENCH_TEXTS)], capture_output=True, text=True,
+                                     cwd=os.path.dirname(os.path.abspath(__file__)))
+                if out.returncode != 0:
+                    print(out.stderr.strip().splitlines()[-1] if out.stderr.strip() else "子进程失败")
+                    break
+                secs, backend = out.stdout.split()[-2:]
+                results.setdefault(backend, []).append(float(secs))
+    for backend, times in results.items():
+        label = "常驻进程 (warm)" if backend == "worker" else "进程内加载 (cold)"
+        print(f"{label}: 平均 {sum(times) / len(times):.2f}s，最快 {min(times):.2f}s ({len(times)} 次)")
+    if "worker" not in results:
+        print("没有连上常驻进程，先运行 python embed_server.py 再测 warm 启动")
+
+if __name__ == "__main__":
+    if MODE == "bench":
+        benchmark()
+    else:
+        EmbedServer().serve_forever()
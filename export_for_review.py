@@ -7,9 +7,10 @@ DB_NAME = "ran1_knowledge_cloud.db"
 OUTPUT_FILE = "RAN1_Review_Report.xlsx"
 
 def export_to_excel():
-    conn = sqlite3.connect(DB_NAME)
+    # 数据库是 WAL 模式，分析进程还在写入时也可以导出；遇到短暂写锁最多等 30 秒
+    conn = sqlite3.connect(DB_NAME, timeout=30)
     
-    # 提取关键字段，按厂商和话题排序
+    # 提取关键字段，按厂商和话题排序 (走 idx_insights_topic_vendor 索引，不再全表排序)
     query = """
     SELECT 
         filename,
@@ -0,0 +1,89 @@
+import os
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+
+# === 增量索引清单 (Manifest) ===
+# 记录每个已入库文件的 大小 / mtime / 内容哈希，
+# 索引脚本据此只处理新增或改动过的文件，删除已移除文件的切片。
+# 格式: {"version": 3, "files": {"R1-2501234.docx": {"path": ..., "size": ..., "mtime": ..., "sha256": ...}}}
+# version 每次集合内容变化时 +1，下游 (例如 chat 的缓存) 可以用它判断知识库是否被重建过。
+
+# 进程内记住算过的哈希：同一个文件在一次运行里会被好几处 (清单、页眉嗅探、解析缓存) 要哈希，
+# 按 (路径, 大小, mtime, inode) 记忆，文件被改写后键就变了，会重新计算
+HASH_MEMO_SIZE = 4096
+_hash_memo = OrderedDict()
+_hash_lock = threading.Lock()
+
+def file_sha256(file_path, block_size=1 << 20):
+    st = os.stat(file_path)
+    key = (os.path.abspath(file_path), st.st_size, st.st_mtime_ns, st.st_ino)
+    with _hash_lock:
+        digest = _hash_memo.get(key)
+        if digest is not None:
+            _hash_memo.move_to_end(key)
+            return digest
+    h = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            h.update(block)
+    digest = h.hexdigest()
+    with _hash_lock:
+        _hash_memo[key] = digest
+        if len(_hash_memo) > HASH_MEMO_SIZE:
+            _hash_memo.popitem(last=False)
+    return digest
+
+def load_manifest(manifest_path):
+    empty = {"version": 0, "files": {}}
+    if not os.path.exists(manifest_path):
+        return empty
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        # 清单损坏等同于没有清单，调用方会按全量重建处理
+        return empty
+    data.setdefault("version", 0)
+    data.setdefault("files", {})
+    return data
+
+def save_manifest(manifest_path, manifest):
+    # 先写临时文件再原子替换，防止中途崩溃留下半个 JSON
+    tmp_path = manifest_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_path, manifest_path)
+
+def diff_folder(folder, manifest, suffix):
+    """
+    对比文件夹与清单，返回 (changed, removed)。
+    changed: [(filename, entry)] 新增或内容有变化的文件，entry 是入库成功后应写回清单的记录
+    removed: [filename]          清单里有、磁盘上已经不存在的文件
+    先比较 size + mtime，只有不一致时才算哈希，所以 no-op 重跑只需要 stat。
+    只是被 touch 过 (内容哈希不变) 的文件会直接在清单里更新 stat，不算 changed。
+    """
+    known = manifest["files"]
+    changed = []
+    seen = set()
+
+    for filename in sorted(os.listdir(folder)):
+        if not filename.endswith(suffix):
+            continue
+        seen.add(filename)
+        path = os.path.join(folder, filename)
+        st = os.stat(path)
+        old = known.get(filename)
+        if old and old["size"] == st.st_size and old["mtime"] == st.st_mtime:
+            continue
+
+        entry = {"path": os.path.abspath(path), "size": st.st_size, "mtime": st.st_mtime,
+                 "sha256": file_sha256(path)}
+        if old and old.get("sha256") == entry["sha256"]:
+            known[filename] = entry
+            continue
+        changed.append((filename, entry))
+
+    removed = [f for f in known if f not in seen]
+    return changed, removed
@@ -0,0 +1,158 @@
+import os
+import time
+import random
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# === 共享 HTTP 会话 ===
+# 下载脚本原来每个 URL 一次 requests.get：每个小 zip 都要重新握手 TLS，3GPP 服务器又慢，连接建立的时间比下载还长。
+# 这里每个下载脚本共用一个 Session：
+#   - 每个主机一个连接池，大小 = 下载线程数 (pool_block=True，线程多于连接时排队等连接，不临时新建)；
+#   - 连接失败 / 读超时 / 429 / 5xx 由 urllib3 自动重试，指数退避并加随机抖动，避免所有线程同时重试；
+#     服务器给了 Retry-After 时以它为准；
+#   - 记录每个请求的首字节时间、下载耗时、重试次数和新建连接数，结束时打印；
+#   - download(resume=True) 支持断点续传：已有的部分文件用 Range 请求补齐，If-Range 带上次响应的
+#     ETag / Last-Modified (存在 "{path}.validator")，服务器上的文件变了会回 200 整个重下。
+
+RETRIES = 4             # 单个请求最多重试次数
+BACKOFF = 1.0           # 退避基数 (秒)：1, 2, 4, 8 ... 再乘以 [0.5, 1.0) 的抖动
+BACKOFF_MAX = 30        # 单次退避上限 (秒)
+RETRY_STATUS = (429, 500, 502, 503, 504)
+POOL_HOSTS = 4          # 缓存连接池的主机数
+CHUNK_SIZE = 64 * 1024  # 流式下载每次写盘的字节数
+
+class JitteredRetry(Retry):
+    """指数退避加抖动：第 n 次重试等待 BACKOFF * 2^(n-1) * [0.5, 1.0)。"""
+
+    def get_backoff_time(self):
+        base = super().get_backoff_time()
+        return min(BACKOFF_MAX, base * random.uniform(0.5, 1.0))
+
+class HttpClient:
+    """
+    用法:
+        HTTP = HttpClient(pool_size=MAX_WORKERS, verify=False)
+        html = HTTP.get(url, timeout=30).text
+        HTTP.download(zip_url, local_path)
+        print(HTTP.stats())
+    """
+
+    def __init__(self, pool_size, headers=None, verify=True, retries=RETRIES, backoff=BACKOFF):
+        self.session = requests.Session()
+        self.session.verify = verify
+        if headers:
+            self.session.headers.update(headers)
+        retry = JitteredRetry(total=retries, backoff_factor=backoff, status_forcelist=RETRY_STATUS,
+                              raise_on_status=False, respect_retry_after_header=True)
+        self._adapter = HTTPAdapter(pool_connections=POOL_HOSTS, pool_maxsize=pool_size, pool_block=True,
+                                    max_retries=retry)
+        self.session.mount("https://", self._adapter)
+        self.session.mount("http://", self._adapter)
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.retries = 0
+        self.downloads = 0
+        self.bytes = 0
+        self.resumed_bytes = 0
+        self._ttfb = 0.0
+        self._responses = 0
+        self._download_time = 0.0
+
+    def get(self, url, timeout=30, **kwargs):
+        """session.get 的包装，记录首字节时间和重试次数；网络异常照常抛出。"""
+        try:
+            r = self.session.get(url, timeout=timeout, **kwargs)
+        except requests.RequestException:
+            with self._lock:
+                self.requests += 1
+                self.errors += 1
+            raise
+        history = getattr(getattr(r.raw, "retries", None), "history", ())
+        with self._lock:
+            self.requests += 1
+            self.retries += len(history)
+            self._ttfb += r.elapsed.total_seconds()
+            self._responses += 1
+            if r.status_code >= 400:
+                self.errors += 1
+        return r
+
+    def download(self, url, path, timeout=60, resume=False):
+        """
+        流式下载到 path，非 2xx 抛 requests.HTTPError。返回本次写入的字节数。
+        resume=True 时 path 是可以续传的部分文件：中断后再次调用只下载剩下的部分。
+        """
+        t0 = time.perf_counter()
+        validator_path = path + ".validator"
+        start = os.path.getsize(path) if resume and os.path.exists(path) else 0
+        headers = {}
+        if start:
+            validator = None
+            if os.path.exists(validator_path):
+                with open(validator_path, "r", encoding="utf-8") as f:
+                    validator = f.read().strip()
+            if validator:
+                headers = {"Range": f"bytes={start}-", "If-Range": validator}
+            else:
+                start = 0 # 无法确认服务器上的文件没变，从头下载
+        with self.get(url, stream=True, timeout=timeout, headers=headers) as r:
+            if r.status_code == 416 and start:
+                # 部分文件已经是完整的 (上次下完但没来得及改名)
+                r.close()
+                os.remove(validator_path)
+                return 0
+            r.raise_for_status()
+            if r.status_code != 206:
+                start = 0 # 服务器忽略了 Range 或文件已变化，整个重下
+            if resume:
+                validator = r.headers.get("ETag") or r.headers.get("Last-Modified")
+                if validator:
+                    with open(validator_path, "w", encoding="utf-8") as f:
+                        f.write(validator)
+            with open(path, "ab" if start else "wb") as f:
+                size = self._write_body(r, f)
+        if resume and os.path.exists(validator_path):
+            os.remove(validator_path)
+        self._record_download(size, start, t0)
+        return size
+
+    def download_to(self, url, fileobj, timeout=60):
+        """流式下载写进已打开的文件对象 (例如 SpooledTemporaryFile)，不续传。返回写入的字节数。"""
+        t0 = time.perf_counter()
+        with self.get(url, stream=True, timeout=timeout) as r:
+            r.raise_for_status()
+            size = self._write_body(r, fileobj)
+        self._record_download(size, 0, t0)
+        return size
+
+    def _write_body(self, r, f):
+        size = 0
+        for chunk in r.iter_content(chunk_size=CHUNK_SIZE):
+            f.write(chunk)
+            size += len(chunk)
+        return size
+
+    def _record_download(self, size, resumed, t0):
+        with self._lock:
+            self.downloads += 1
+            self.bytes += size
+            self.resumed_bytes += resumed
+            self._download_time += time.perf_counter() - t0
+
+    def new_connections(self):
+        """各主机连接池累计新建的连接数 (越接近线程数越好)。"""
+        pools = self._adapter.poolmanager.pools
+        with pools.lock:
+            keys = list(pools.keys())
+        return sum(getattr(pools.get(k), "num_connections", 0) for k in keys)
+
+    def stats(self):
+        ttfb = self._ttfb / max(1, self._responses) * 1000
+        conns = self.new_connections()
+        reuse = (1 - conns / self.requests) * 100 if self.requests else 0.0
+        return (f"HTTP: 请求 {self.requests} | 新建连接 {conns} (复用率 {reuse:.0f}%) | 重试 {self.retries} | "
+                f"失败 {self.errors} | 平均首字节 {ttfb:.0f}ms | 下载 {self.downloads} 个文件 {self.bytes / 1e6:.1f}MB, "
+                f"平均 {self._download_time / max(1, self.downloads):.2f}s/个 | 续传省下 {self.resumed_bytes / 1e6:.1f}MB")
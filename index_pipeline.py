@@ -0,0 +1,172 @@
+import os
+import time
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from tqdm import tqdm
+
+# === 流式入库流水线 ===
+# 解析 (多进程) -> 有界队列 -> 批量 Embedding (线程) -> 有界队列 -> 单写入线程 collection.add (+ 倒排索引)
+# 每一级都有上限：解析最多 parse_workers * 2 个文件在途，队列满了上游就阻塞等待 (背压)，
+# 内存占用不会随会议规模增长，解析和 Embedding 也能同时跑满。
+
+PARSE_WORKERS = max(1, (os.cpu_count() or 2) - 1) # 解析进程数
+EMBED_BATCH = 256   # 每次送进 Embedding 模型的切片数
+QUEUE_SIZE = 32     # 解析结果队列长度 (单位: 文件)
+
+_DONE = object()
+
+class PipelineError(RuntimeError):
+    pass
+
+def _put(q, item, failed):
+    # 下游挂了就别一直阻塞在满队列上
+    while True:
+        if failed.is_set():
+            raise PipelineError("下游阶段已失败")
+        try:
+            q.put(item, timeout=0.5)
+            return
+        except queue.Full:
+            continue
+
+def _get(q, failed):
+    while True:
+        try:
+            return q.get(timeout=0.5)
+        except queue.Empty:
+            if failed.is_set():
+                raise PipelineError("其他阶段已失败")
+
+def _embed_stage(parsed_q, write_q, ef, embed_batch, failed, errors):
+    ids, docs, metas, finished = [], [], [], []
+
+    def emit():
+        nonlocal ids, docs, metas, finished
+        embeddings = ef(docs) if docs else []
+        _put(write_q, (ids, docs, metas, embeddings, finished), failed)
+        ids, docs, metas, finished = [], [], [], []
+
+    try:
+        while True:
+            item = _get(parsed_q, failed)
+            if item is _DONE:
+                break
+            filename, f_ids, f_docs, f_metas = item
+            for cid, doc, meta in zip(f_ids, f_docs, f_metas):
+                ids.append(cid)
+                docs.append(doc)
+                metas.append(meta)
+                if len(ids) >= embed_batch:
+                    emit()
+            # 文件的最后一个切片已进入当前 batch，该 batch 写入后文件即完成
+            finished.append(filename)
+        if ids or finished:
+            emit()
+    except PipelineError:
+        pass
+    except Exception as e:
+        errors.append(e)
+        failed.set()
+    finally:
+        try: write_q.put(_DONE, timeout=5)
+        except queue.Full: pass
+
+def _write_stage(write_q, collection, lexical, on_files_done, stats, failed, errors):
+    try:
+        while True:
+            item = _get(write_q, failed)
+            if item is _DONE:
+                break
+            ids, docs, metas, embeddings, finished = item
+            if ids:
+                collection.add(ids=ids, documents=docs, metadatas=metas, embeddings=embeddings)
+                if lexical is not None:
+                    lexical.add(ids, docs, metas)
+                stats["chunks"] += len(ids)
+            if finished and on_files_done:
+                on_files_done(finished)
+    except PipelineError:
+        pass
+    except Exception as e:
+        errors.append(e)
+        failed.set()
+
+def run_index_pipeline(jobs, parse_fn, collection, ef, on_files_done=None,
+                       parse_workers=None, embed_batch=None, queue_size=None, lexical=None):
+    """
+    jobs:          [(filename, path), ...]
+    parse_fn:      parse_fn(filename, path) -> (ids, docs, metas, chunk_stats)，在子进程里执行，必须是模块级函数
+    on_files_done: on_files_done([filename, ...])，一批切片写入后回调，参数是已完整入库的文件
+    lexical:       lexical_index.LexicalIndex，与向量集合同批写入 (可选)
+    返回 (写入的切片数, 各文件 chunk_stats 的累加)。
+    """
+    parse_workers = parse_workers or PARSE_WORKERS
+    embed_batch = embed_batch or EMBED_BATCH
+    queue_size = queue_size or QUEUE_SIZE
+
+    parsed_q = queue.Queue(maxsize=queue_size)
+    write_q = queue.Queue(maxsize=2)
+    failed = threading.Event()
+    errors = []
+    stats = {"chunks": 0}
+    parse_failed = []
+    chunk_stats = {}
+
+    embedder = threading.Thread(target=_embed_stage, name="embed",
+                                args=(parsed_q, write_q, ef, embed_batch, failed, errors), daemon=True)
+    writer = threading.Thread(target=_write_stage, name="writer",
+                              args=(write_q, collection, lexical, on_files_done, stats, failed, errors), daemon=True)
+    embedder.start()
+    writer.start()
+
+    t0 = time.time()
+    pending_jobs = iter(jobs)
+    in_flight = {}
+    try:
+        with ProcessPoolExecutor(max_workers=parse_workers) as pool, tqdm(total=len(jobs), unit="file") as bar:
+            def submit_more():
+                while len(in_flight) < parse_workers * 2:
+                    job = next(pending_jobs, None)
+                    if job is None:
+                        return
+                    in_flight[pool.submit(parse_fn, *job)] = job[0]
+
+            submit_more()
+            while in_flight and not failed.is_set():
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    filename = in_flight.pop(future)
+                    try:
+                        f_ids, f_docs, f_metas, f_stats = future.result()
+                    except Exception as e:
+                        # 单个文件解析失败不影响整体，不进清单，下次运行会重试
+                        tqdm.write(f"解析失败: {filename} -> {e}")
+                        parse_failed.append(filename)
+                        bar.update(1)
+                        continue
+                    for k, v in f_stats.items():
+                        chunk_stats[k] = chunk_stats.get(k, 0) + v
+                    _put(parsed_q, (filename, f_ids, f_docs, f_metas), failed)
+                    bar.update(1)
+                submit_more()
+            for future in in_flight:
+                future.cancel()
+    except PipelineError:
+        pass # 真正的错误已记录在 errors 里
+    finally:
+        try: _put(parsed_q, _DONE, failed)
+        except PipelineError: pass
+        embedder.join()
+        writer.join()
+
+    if errors:
+        raise PipelineError(f"入库流水线失败: {errors[0]!r}") from errors[0]
+
+    elapsed = time.time() - t0
+    print(f"流水线: {len(jobs)} 份文档 / {stats['chunks']} 个切片，用时 {elapsed:.1f}s "
+          f"({len(jobs) / max(elapsed, 1e-6):.1f} 文档/s，解析进程 {parse_workers}，Embedding 批量 {embed_batch})")
+    if parse_failed:
+        print(f"解析失败 {len(parse_failed)} 份 (未记入清单，下次运行重试): {', '.join(parse_failed[:10])}"
+              + (" ..." if len(parse_failed) > 10 else ""))
+    return stats["chunks"], chunk_stats
@@ -1,99 +1,117 @@
 import os
-import chromadb
-from chromadb.utils import embedding_functions
-from docx import Document
-from tqdm import tqdm
+from doc_cache import load_docx
 from colorama import init, Fore
+from file_manifest import load_manifest, save_manifest, diff_folder
+from index_pipeline import run_index_pipeline
+from embed_cache import get_embedding_function
+from chunker import chunk_text, format_stats, new_stats, CHUNKER_VERSION
+from tdoc_meta import tdoc_metadata, META_VERSION
+from lexical_index import LexicalIndex, lexical_path, LEXICAL_VERSION
 
 init(autoreset=True)
 
 # === 配置 ===
 DOC_FOLDER = "./tdocs/RAN1_123"
 DB_PATH = "./ran1_knowledge_base" # 向量数据库路径
-CHUNK_SIZE = 800  # 每个切片约 800 字符 (一段话左右)
-OVERLAP = 100     # 重叠，防止切断句子
+COLLECTION_NAME = "ran1_docs"
+MANIFEST_PATH = os.path.join(DB_PATH, f"{COLLECTION_NAME}_manifest.json") # 增量索引清单
+CHUNK_TOKENS = 254  # 每个切片的 token 预算 (all-MiniLM-L6-v2 窗口 256，减去 [CLS]/[SEP])
+OVERLAP_TOKENS = 32 # 相邻切片按整句重叠，防止切断句子
+PARSE_WORKERS = None # 解析进程数，None = CPU 核数 - 1
+EMBED_BATCH = 256    # 每批 Embedding 的切片数
 
 def read_docx(file_path):
-    try:
-        doc = Document(file_path)
-        # 清洗：去掉太短的行，保留核心文本
-        text = "\n".join([p.text.strip() for p in doc.paragraphs if len(p.text.strip()) > 10])
-        return text
-    except:
-        return ""
+    # 解析失败 (文件损坏 / 读不了) 直接抛出：流水线会报告这个文件并且不记入清单，下次运行重试；
+    # 不能当成空文档返回 0 个切片，否则它会被当作已入库，再也不会重试
+    doc = load_docx(file_path)
+    # 清洗：去掉太短的行，保留核心文本
+    text = "\n".join([p["text"].strip() for p in doc["paragraphs"] if len(p["text"].strip()) > 10])
+    return text
 
-def split_text(text, chunk_size, overlap):
-    chunks = []
-    start = 0
-    while start < len(text):
-        end = min(start + chunk_size, len(text))
-        chunks.append(text[start:end])
-        start += (chunk_size - overlap)
-    return chunks
+def parse_tdoc(filename, file_path):
+    """
+    解析 + 切片单个 TDoc (在解析子进程中运行)。
+    返回 (ids, docs, metas, chunk_stats)。
+    """
+    # 文档级元数据：层级 (文件名 + Title / Source 嗅探)、厂商、会议、议题号，与分析器 / classify_docs 共用 tdoc_meta
+    doc_meta = tdoc_metadata(file_path, filename, DOC_FOLDER)
+    
+    content = read_docx(file_path)
+    # 按段落 / 句子边界切到模型窗口以内，不再按字符硬切
+    chunks, stats = chunk_text(content, CHUNK_TOKENS, OVERLAP_TOKENS) if content else ([], new_stats())
+    
+    ids = [f"{filename}_part{i}" for i in range(len(chunks))]
+    metas = [dict(doc_meta, filename=filename, part=i) for i in range(len(chunks))]
+    return ids, chunks, metas, stats
 
 def build_index():
-    print(f"{Fore.CYAN}=== DeepSpec RAG: 构建全量知识库 ===")
+    print(f"{Fore.CYAN}=== DeepSpec RAG: 增量构建知识库 ===")
     
     # 1. 初始化 ChromaDB (本地向量库)
+    os.makedirs(DB_PATH, exist_ok=True)
+    import chromadb # 只在主进程 import：解析子进程会重新 import 本模块，不必付这份代价
     client = chromadb.PersistentClient(path=DB_PATH)
     
-    # 使用轻量级 Embedding 模型 (不用跑 Ollama，速度快)
-    ef = embedding_functions.SentenceTransformerEmbeddingFunction(
-        model_name="all-MiniLM-L6-v2" # 或者 "paraphrase-multilingual-MiniLM-L12-v2" 支持多语言
-    )
+    # 使用轻量级 Embedding 模型 (不用跑 Ollama，速度快)，带内容哈希缓存，文本没变就不重新编码
+    ef = get_embedding_function("all-MiniLM-L6-v2") # 或者 "paraphrase-multilingual-MiniLM-L12-v2" 支持多语言
     
-    # 创建集合 (如果存在先删除，确保干净)
-    try: client.delete_collection("ran1_docs")
-    except: pass
-    collection = client.create_collection(name="ran1_docs", embedding_function=ef)
+    # 集合不再每次删除重建，只按清单做增量更新
+    collection = client.get_or_create_collection(name=COLLECTION_NAME, embedding_function=ef)
+    manifest = load_manifest(MANIFEST_PATH)
+    # 同名的倒排索引 (BM25)，和向量集合同步增量更新
+    lexical = LexicalIndex(lexical_path(DB_PATH, COLLECTION_NAME), COLLECTION_NAME)
+    # 切片方式、元数据规则或分词规则变了，旧切片全部作废；倒排索引文件丢了也要全量补建
+    if manifest.get("chunker") != CHUNKER_VERSION or manifest.get("meta") != META_VERSION \
+            or manifest.get("lexical") != LEXICAL_VERSION or (manifest["files"] and lexical.count() == 0):
+        manifest["files"] = {}
+        manifest["chunker"] = CHUNKER_VERSION
+        manifest["meta"] = META_VERSION
+        manifest["lexical"] = LEXICAL_VERSION
+    if not manifest["files"]:
+        lexical.reset()
     
-    files = [f for f in os.listdir(DOC_FOLDER) if f.endswith(".docx")]
-    print(f"扫描到 {len(files)} 份文档，准备入库...")
+    # 清单丢失但集合里已有数据：无法判断哪些切片过期，只能全量重建一次
+    if not manifest["files"] and collection.count() > 0:
+        print(f"{Fore.YELLOW}未找到索引清单，集合将全量重建...")
+        client.delete_collection(COLLECTION_NAME)
+        collection = client.create_collection(name=COLLECTION_NAME, embedding_function=ef)
     
-    batch_ids = []
-    batch_docs = []
-    batch_metas = []
+    changed, removed = diff_folder(DOC_FOLDER, manifest, ".docx")
+    print(f"新增/变化 {len(changed)} 份，已删除 {len(removed)} 份，其余保持不变。")
     
-    total_chunks = 0
+    # 集合内容即将变化，先递增版本号 (中途崩溃也不会让下游误以为没变)
+    if changed or removed:
+        manifest["version"] += 1
     
-    for filename in tqdm(files):
-        # 简单分类
-        doc_type = "TDoc"
-        if "report" in filename.lower() or "minutes" in filename.lower(): doc_type = "Report"
-        elif "summary" in filename.lower(): doc_type = "FLS"
-        
-        # 提取厂商 (简单规则，文件名通常包含厂商)
-        vendor = "Unknown"
-        # 这里可以加更多规则提取厂商...
-        
-        content = read_docx(os.path.join(DOC_FOLDER, filename))
-        if not content: continue
-        
-        chunks = split_text(content, CHUNK_SIZE, OVERLAP)
-        
-        for i, chunk in enumerate(chunks):
-            chunk_id = f"{filename}_part{i}"
-            
-            batch_ids.append(chunk_id)
-            batch_docs.append(chunk)
-            batch_metas.append({
-                "filename": filename,
-                "type": doc_type,
-                "part": i
-            })
-            
-            # 批量写入 (每 500 条写一次)
-            if len(batch_ids) >= 500:
-                collection.add(documents=batch_docs, ids=batch_ids, metadatas=batch_metas)
-                total_chunks += len(batch_ids)
-                batch_ids, batch_docs, batch_metas = [], [], []
-
-    # 写入剩余的
-    if batch_ids:
-        collection.add(documents=batch_docs, ids=batch_ids, metadatas=batch_metas)
-        total_chunks += len(batch_ids)
+    # 2. 清理已删除文件，以及变化文件旧版本 (或上次中断时写了一半) 的切片
+    stale = removed + [filename for filename, _ in changed]
+    for i in range(0, len(stale), 500):
+        collection.delete(where={"filename": {"$in": stale[i:i + 500]}})
+    lexical.delete_files(stale)
+    for filename in removed:
+        manifest["files"].pop(filename, None)
+    save_manifest(MANIFEST_PATH, manifest)
+    
+    if not changed:
+        print(f"{Fore.GREEN}✅ 知识库已是最新，无需重新入库。")
+        return
+    
+    # 3. 解析 -> 切片 -> Embedding -> 写入 流水线
+    # 文件的切片全部写入后才记入清单，中途中断的文件下次会重新处理
+    entries = dict(changed)
+    
+    def on_files_done(filenames):
+        for name in filenames:
+            manifest["files"][name] = entries[name]
+        save_manifest(MANIFEST_PATH, manifest)
+    
+    jobs = [(filename, os.path.join(DOC_FOLDER, filename)) for filename, _ in changed]
+    total_chunks, chunk_stats = run_index_pipeline(jobs, parse_tdoc, collection, ef, on_files_done,
+                                      parse_workers=PARSE_WORKERS, embed_batch=EMBED_BATCH, lexical=lexical)
         
-    print(f"{Fore.GREEN}✅ 入库完成！共索引了 {total_chunks} 个文本切片。")
+    print(f"{Fore.GREEN}✅ 增量入库完成！本次索引了 {total_chunks} 个文本切片，集合共 {collection.count()} 个。")
+    print(format_stats(chunk_stats))
+    print(ef.stats())
     print(f"知识库保存在: {DB_PATH}")
 
 if __name__ == "__main__":
@@ -1,9 +1,11 @@
 import os
-import chromadb
-from chromadb.utils import embedding_functions
-from docx import Document
-from tqdm import tqdm
+from doc_cache import load_docx
 from colorama import init, Fore
+from file_manifest import load_manifest, save_manifest, diff_folder
+from index_pipeline import run_index_pipeline
+from embed_cache import get_embedding_function
+from chunker import chunk_text, format_stats, merge_stats, new_stats, CHUNKER_VERSION
+from lexical_index import LexicalIndex, lexical_path, LEXICAL_VERSION
 import re
 
 init(autoreset=True)
@@ -12,6 +14,10 @@ init(autoreset=True)
 SPEC_FOLDER = "./specs"  # 请新建这个文件夹，把 38.211, 38.212 等放进去
 DB_PATH = "./ran1_knowledge_base"
 COLLECTION_NAME = "ran1_specs" # 专门存 Spec，和 TDoc 分开
+MANIFEST_PATH = os.path.join(DB_PATH, f"{COLLECTION_NAME}_manifest.json")
+PARSE_WORKERS = None # 解析进程数，None = CPU 核数 - 1 (Spec 文件大，解析是主要瓶颈)
+EMBED_BATCH = 256
+CHUNK_TOKENS = 254 # 每个切片的 token 预算 (all-MiniLM-L6-v2 窗口 256)
 
 def clean_text(text):
     return re.sub(r'\s+', ' ', text).strip()
@@ -19,11 +25,12 @@ def clean_text(text):
 def parse_spec_structure(file_path):
     """
     智能解析 Spec 结构，保留章节层级 (Breadcrumbs)。
+    返回 [(面包屑, 章节正文), ...]，切片交给 chunker。
     """
-    doc = Document(file_path)
+    doc = load_docx(file_path)
     filename = os.path.basename(file_path)
     
-    chunks = []
+    sections = []
     # 标题栈：['TS 38.211', '5. Physical Resources', '5.1 Antenna ports']
     header_stack = [filename] 
     current_content = []
@@ -31,11 +38,11 @@ def parse_spec_structure(file_path):
     # 3GPP 标题的特征正则 (例如 "5.1.2", "6.3.1.4")
     heading_pattern = re.compile(r'^\d+(\.\d+)*\s+')
 
-    for para in doc.paragraphs:
-        text = clean_text(para.text)
+    for para in doc["paragraphs"]:
+        text = clean_text(para["text"])
         if not text: continue
         
-        style_name = para.style.name.lower()
+        style_name = para["style"].lower()
         
         # 判断是否为标题 (通过 Word 样式 或 正则特征)
         is_heading = 'heading' in style_name or heading_pattern.match(text)
@@ -45,17 +52,7 @@ def parse_spec_structure(file_path):
             if current_content:
                 # 拼接面包屑：[38.211] > [5. Phy] > [5.1 Antenna]
                 context_str = " > ".join(header_stack)
-                full_body = "\n".join(current_content)
-                
-                # 如果内容太长，还要再切一下（防止超过 Embedding 限制）
-                if len(full_body) > 1000:
-                    # 简单二分，实际可以做得更细
-                    mid = len(full_body) // 2
-                    chunks.append(f"【Context: {context_str}】\n{full_body[:mid]}")
-                    chunks.append(f"【Context: {context_str}】\n{full_body[mid:]}")
-                else:
-                    chunks.append(f"【Context: {context_str}】\n{full_body}")
-                
+                sections.append((context_str, "\n".join(current_content)))
                 current_content = []
 
             # 2. 更新标题栈
@@ -72,9 +69,25 @@ def parse_spec_structure(file_path):
     # 处理最后一段
     if current_content:
         context_str = " > ".join(header_stack)
-        chunks.append(f"【Context: {context_str}】\n" + "\n".join(current_content))
+        sections.append((context_str, "\n".join(current_content)))
         
-    return chunks
+    return sections
+
+def parse_spec(filename, file_path):
+    """
+    解析单个 Spec (在解析子进程中运行)，返回 (ids, docs, metas, chunk_stats)。
+    面包屑放在 metadata 的 section 字段里，不再拼进被编码的正文，省下窗口给条文本身。
+    """
+    chunks, metas = [], []
+    stats = new_stats()
+    for context_str, body in parse_spec_structure(file_path):
+        pieces, piece_stats = chunk_text(body, CHUNK_TOKENS)
+        merge_stats(stats, piece_stats)
+        for j, piece in enumerate(pieces):
+            chunks.append(piece)
+            metas.append({"filename": filename, "type": "Spec", "section": context_str, "part": j})
+    ids = [f"SPEC_{filename}_{i}" for i in range(len(chunks))]
+    return ids, chunks, metas, stats
 
 def build_spec_index():
     print(f"{Fore.CYAN}=== DeepSpec RAG: 构建标准文档库 (Structure-Aware) ===")
@@ -84,37 +97,59 @@ def build_spec_index():
         print(f"{Fore.RED}请先创建 {SPEC_FOLDER} 文件夹，并放入 Word 版 Spec (如 38211-h00.docx)")
         return
 
+    os.makedirs(DB_PATH, exist_ok=True)
+    import chromadb # 只在主进程 import：解析子进程会重新 import 本模块，不必付这份代价
     client = chromadb.PersistentClient(path=DB_PATH)
-    ef = embedding_functions.SentenceTransformerEmbeddingFunction(model_name="all-MiniLM-L6-v2")
+    ef = get_embedding_function("all-MiniLM-L6-v2")
     
-    # 重建集合
-    try: client.delete_collection(COLLECTION_NAME)
-    except: pass
-    collection = client.create_collection(name=COLLECTION_NAME, embedding_function=ef)
+    # 和 indexer.py 一样按清单增量更新，不再每次重建集合
+    collection = client.get_or_create_collection(name=COLLECTION_NAME, embedding_function=ef)
+    manifest = load_manifest(MANIFEST_PATH)
+    lexical = LexicalIndex(lexical_path(DB_PATH, COLLECTION_NAME), COLLECTION_NAME)
+    # 切片方式或分词规则变了，旧切片全部作废；倒排索引文件丢了也要全量补建
+    if manifest.get("chunker") != CHUNKER_VERSION or manifest.get("lexical") != LEXICAL_VERSION \
+            or (manifest["files"] and lexical.count() == 0):
+        manifest["files"] = {}
+        manifest["chunker"] = CHUNKER_VERSION
+        manifest["lexical"] = LEXICAL_VERSION
+    if not manifest["files"]:
+        lexical.reset()
+    if not manifest["files"] and collection.count() > 0:
+        print(f"{Fore.YELLOW}未找到索引清单，集合将全量重建...")
+        client.delete_collection(COLLECTION_NAME)
+        collection = client.create_collection(name=COLLECTION_NAME, embedding_function=ef)
     
-    files = [f for f in os.listdir(SPEC_FOLDER) if f.endswith(".docx")]
+    changed, removed = diff_folder(SPEC_FOLDER, manifest, ".docx")
+    print(f"新增/变化 {len(changed)} 份 Spec，已删除 {len(removed)} 份。")
+    if changed or removed:
+        manifest["version"] += 1
     
-    total_count = 0
-    batch_docs, batch_ids, batch_metas = [], [], []
+    stale = removed + [filename for filename, _ in changed]
+    for i in range(0, len(stale), 500):
+        collection.delete(where={"filename": {"$in": stale[i:i + 500]}})
+    lexical.delete_files(stale)
+    for filename in removed:
+        manifest["files"].pop(filename, None)
+    save_manifest(MANIFEST_PATH, manifest)
     
-    for filename in tqdm(files):
-        chunks = parse_spec_structure(os.path.join(SPEC_FOLDER, filename))
-        
-        for i, chunk in enumerate(chunks):
-            batch_docs.append(chunk)
-            batch_ids.append(f"SPEC_{filename}_{i}")
-            batch_metas.append({"filename": filename, "type": "Spec"})
-            
-            if len(batch_ids) >= 200:
-                collection.add(documents=batch_docs, ids=batch_ids, metadatas=batch_metas)
-                total_count += len(batch_ids)
-                batch_docs, batch_ids, batch_metas = [], [], []
-
-    if batch_ids:
-        collection.add(documents=batch_docs, ids=batch_ids, metadatas=batch_metas)
-        total_count += len(batch_ids)
+    if not changed:
+        print(f"{Fore.GREEN}✅ Spec 库已是最新。")
+        return
+    
+    entries = dict(changed)
+    
+    def on_files_done(filenames):
+        for name in filenames:
+            manifest["files"][name] = entries[name]
+        save_manifest(MANIFEST_PATH, manifest)
+    
+    jobs = [(filename, os.path.join(SPEC_FOLDER, filename)) for filename, _ in changed]
+    total_count, chunk_stats = run_index_pipeline(jobs, parse_spec, collection, ef, on_files_done,
+                                     parse_workers=PARSE_WORKERS, embed_batch=EMBED_BATCH, lexical=lexical)
 
     print(f"{Fore.GREEN}✅ Spec 入库完成！索引了 {total_count} 个法律条文。")
+    print(format_stats(chunk_stats))
+    print(ef.stats())
 
 if __name__ == "__main__":
     build_spec_index()
@@ -0,0 +1,227 @@
+import time
+import queue
+import sqlite3
+import threading
+
+# === document_insights 数据库 ===
+# WAL 模式：写入时读者 (export_for_review、其他分析进程) 不被阻塞；
+# 所有写操作交给单独的写线程，按批 executemany，一个事务提交多篇文档，
+# 不再每个观点一次 execute、每篇文档一次 commit。
+
+BATCH_DOCS = 20        # 攒够多少篇文档提交一次
+FLUSH_INTERVAL = 2.0   # 或者最多等几秒就提交
+BUSY_TIMEOUT_MS = 30000
+
+INSIGHT_COLUMNS = ["filename", "vendor", "topic", "stance", "key_argument", "proposed_parameter",
+                   "evidence_quote", "is_verified", "quote_start", "quote_end", "quote_score", "doc_type"]
+
+def connect(db_name):
+    conn = sqlite3.connect(db_name, timeout=BUSY_TIMEOUT_MS / 1000)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL") # WAL 下足够安全，提交快很多
+    conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+    return conn
+
+# --- 数据库初始化 (一对多结构) ---
+def init_db(db_name):
+    conn = connect(db_name)
+    cursor = conn.cursor()
+    # 注意：这里的 id 是自增主键，filename 不再唯一
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS document_insights (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            filename TEXT,
+            vendor TEXT,
+            topic TEXT,             -- 新增：具体的讨论话题
+            stance TEXT,
+            key_argument TEXT,
+            proposed_parameter TEXT,
+            evidence_quote TEXT,
+            is_verified BOOLEAN,
+            analysis_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            quote_start INTEGER,    -- 证据在原文中的字符区间 [start, end)
+            quote_end INTEGER,
+            quote_score REAL,       -- 匹配度，1.0 为逐字一致
+            doc_type TEXT           -- 文档层级 Report / FLS / TDoc
+        )
+    ''')
+    # 旧库补列
+    columns = {row[1] for row in cursor.execute("PRAGMA table_info(document_insights)")}
+    for name, col_type in [("quote_start", "INTEGER"), ("quote_end", "INTEGER"), ("quote_score", "REAL"),
+                           ("doc_type", "TEXT")]:
+        if name not in columns:
+            cursor.execute(f"ALTER TABLE document_insights ADD COLUMN {name} {col_type}")
+
+    # 重跑时按 filename 删旧行；导出时 ORDER BY topic, vendor 直接走索引
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_insights_filename ON document_insights(filename)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_insights_topic_vendor ON document_insights(topic, vendor)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_insights_vendor ON document_insights(vendor)")
+
+    # 每篇文档的处理状态：内容哈希 + 模型 + Prompt 版本都没变且 state='done' 的直接跳过
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS analysis_status (
+            filename TEXT PRIMARY KEY,
+            content_hash TEXT,
+            model TEXT,
+            prompt_version TEXT,
+            state TEXT,             -- running / done / partial / failed
+            points INTEGER,
+            error TEXT,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            sections INTEGER,       -- 长文档分成了几段
+            coverage REAL,          -- 实际送去分析的字符占全文比例
+            prompt_tokens INTEGER,
+            output_tokens INTEGER
+        )
+    ''')
+    columns = {row[1] for row in cursor.execute("PRAGMA table_info(analysis_status)")}
+    for name, col_type in [("sections", "INTEGER"), ("coverage", "REAL"),
+                           ("prompt_tokens", "INTEGER"), ("output_tokens", "INTEGER")]:
+        if name not in columns:
+            cursor.execute(f"ALTER TABLE analysis_status ADD COLUMN {name} {col_type}")
+    conn.commit()
+    return conn
+
+def load_status(conn):
+    rows = conn.execute('''
+        SELECT filename, content_hash, model, prompt_version, state,
+               (julianday('now') - julianday(updated_at)) * 86400
+        FROM analysis_status
+    ''')
+    return {r[0]: {"content_hash": r[1], "model": r[2], "prompt_version": r[3], "state": r[4], "age": r[5]}
+            for r in rows}
+
+def claim_documents(conn, files, hashes, model, prompt_version, stale_seconds):
+    """
+    在一个写事务里把 files 全部标记为 running，返回真正认领到的文件。
+    挑选待处理文件到认领之间，别的分析进程已经认领 (running 且未过期) 或完成的文件不会再认领，
+    多个进程同时启动也不会重复分析同一篇。
+    """
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        status = load_status(conn)
+        claimed = []
+        for f in files:
+            st = status.get(f)
+            same_input = st and st["content_hash"] == hashes[f] \
+                and st["model"] == model and st["prompt_version"] == prompt_version
+            if same_input and (st["state"] == "done"
+                               or st["state"] == "running" and (st["age"] or 0) < stale_seconds):
+                continue
+            claimed.append(f)
+        conn.executemany('''
+            INSERT OR REPLACE INTO analysis_status
+            (filename, content_hash, model, prompt_version, state, updated_at)
+            VALUES (?, ?, ?, ?, 'running', CURRENT_TIMESTAMP)
+        ''', [(f, hashes[f], model, prompt_version) for f in claimed])
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return claimed
+
+class InsightsWriter:
+    """
+    单写线程。分析协程只管 submit，写线程负责攒批和事务：
+        writer = InsightsWriter(DB_NAME, model, prompt_version)
+        writer.submit_status(filename, content_hash, "running")
+        writer.submit_document(filename, content_hash, points, stats)
+        writer.close()
+    """
+
+    def __init__(self, db_name, model, prompt_version, batch_docs=BATCH_DOCS, flush_interval=FLUSH_INTERVAL):
+        self.db_name = db_name
+        self.model = model
+        self.prompt_version = prompt_version
+        self.batch_docs = batch_docs
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue()
+        self._error = None
+        self.transactions = 0
+        self.rows_written = 0
+        self._thread = threading.Thread(target=self._run, name="insights-writer", daemon=True)
+        self._thread.start()
+
+    def submit_document(self, filename, content_hash, points, stats=None, state="done"):
+        """
+        一篇文档的结果：旧观点整体替换为新观点，并标记 state。stats 为分段 / 覆盖率 / token 统计。
+        送去分析的分段有失败时 state="partial"：已有观点照常入库，但不算完成，下次运行会重试。
+        """
+        self._check()
+        self._queue.put(("doc", filename, content_hash, points, dict(stats or {}, state=state)))
+
+    def submit_status(self, filename, content_hash, state, error=None):
+        self._check()
+        self._queue.put(("status", filename, content_hash, state, error))
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+        self._check()
+
+    def _check(self):
+        if self._error:
+            raise RuntimeError(f"数据库写线程已失败: {self._error!r}") from self._error
+
+    def _run(self):
+        conn = connect(self.db_name)
+        try:
+            pending = []
+            deadline = None
+            while True:
+                timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    item = "flush"
+                if item is None:
+                    break
+                if item != "flush":
+                    pending.append(item)
+                    if deadline is None:
+                        deadline = time.monotonic() + self.flush_interval
+                docs = sum(1 for p in pending if p[0] == "doc")
+                if pending and (item == "flush" or docs >= self.batch_docs or len(pending) >= self.batch_docs * 10):
+                    self._flush(conn, pending)
+                    pending, deadline = [], None
+            if pending:
+                self._flush(conn, pending)
+        except Exception as e:
+            self._error = e
+        finally:
+            conn.close()
+
+    def _flush(self, conn, items):
+        deletes, inserts, statuses = [], [], []
+        for kind, filename, content_hash, payload, extra in items:
+            if kind == "doc":
+                deletes.append((filename,))
+                for pt in payload:
+                    row = dict(pt, filename=filename, is_verified=True)
+                    inserts.append(tuple(row.get(c) for c in INSIGHT_COLUMNS))
+                statuses.append((filename, content_hash, self.model, self.prompt_version, extra["state"], len(payload), None,
+                                 extra.get("sections"), extra.get("coverage"),
+                                 extra.get("prompt_tokens"), extra.get("output_tokens")))
+            else:
+                statuses.append((filename, content_hash, self.model, self.prompt_version, payload, None, extra,
+                                 None, None, None, None))
+
+        # BEGIN IMMEDIATE：一开始就拿写锁，和其他分析进程排队而不是中途死锁
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany("DELETE FROM document_insights WHERE filename = ?", deletes)
+            conn.executemany(
+                f"INSERT INTO document_insights ({', '.join(INSIGHT_COLUMNS)}) "
+                f"VALUES ({', '.join('?' * len(INSIGHT_COLUMNS))})", inserts)
+            conn.executemany('''
+                INSERT OR REPLACE INTO analysis_status
+                (filename, content_hash, model, prompt_version, state, points, error,
+                 sections, coverage, prompt_tokens, output_tokens, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+            ''', statuses)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        self.transactions += 1
+        self.rows_written += len(inserts)
@@ -0,0 +1,166 @@
+import os
+import re
+import json
+import sqlite3
+import threading
+
+# === 倒排索引 (BM25) ===
+# all-MiniLM-L6-v2 对章节号 "7.4.1.1.2"、TDoc 编号 "R1-2501234"、RRC 参数名 "maxNrofPorts-r18" 几乎没有区分度，
+# 这些查询靠字面匹配才找得准。每个集合旁边放一个 SQLite FTS5 索引 (DB_PATH/{集合名}_lexical.sqlite)：
+#   - 入库流水线的写入线程和 collection.add 同批写入，删除 / 重建也和向量集合同步，天然增量；
+#   - 分词由这里的 tokenize 完成 (保留带点号 / 连字符的编号整体，同时拆出各部分)，FTS5 只按空格切；
+#   - 查询时与向量结果做 RRF 融合；纯编号类查询直接查倒排，不用编码问题向量。
+
+LEXICAL_VERSION = 1 # 分词规则变了就加一，索引会全量重建
+RRF_K = 60          # Reciprocal Rank Fusion 常数
+
+_TOKEN = re.compile(r"[A-Za-z0-9]+(?:[.\-_/][A-Za-z0-9]+)*")
+_SPLIT = re.compile(r"[\-_/]")
+# 纯编号类查询：TDoc 编号、章节号 / Spec 编号、RRC 风格参数名 (驼峰或 -r17 后缀)
+_IDENTIFIER = re.compile(
+    r"^(?:R\d-\d{5,7}|\d+(?:\.\d+)+|[A-Za-z][A-Za-z0-9]*-r\d{2}|[a-z]+[A-Z][A-Za-z0-9]*(?:-[A-Za-z0-9]+)*)$")
+
+def lexical_path(db_path, collection_name):
+    return os.path.join(db_path, f"{collection_name}_lexical.sqlite")
+
+def tokenize(text):
+    """小写词元列表。复合词保留整体，再补上各部分: "DMRS-based" -> dmrs-based, dmrs, based。"""
+    tokens = []
+    for m in _TOKEN.finditer(text):
+        tok = m.group(0).lower()
+        tokens.append(tok)
+        if _SPLIT.search(tok):
+            tokens.extend(p for p in _SPLIT.split(tok) if len(p) > 1)
+    return tokens
+
+def is_identifier_query(query):
+    """整个问题只由 1~3 个编号 / 参数名组成。"""
+    parts = query.strip().split()
+    return 0 < len(parts) <= 3 and all(_IDENTIFIER.match(p.strip(",;?？")) for p in parts)
+
+def rrf_fuse(result_lists, n_results, k=RRF_K):
+    """
+    Reciprocal Rank Fusion：score = sum(1 / (k + rank))，按切片 id 合并多路结果。
+    每路结果是按相关度排好序的 hit 列表，返回前 n_results 个 hit (附加 "rrf" 分数)。
+    """
+    fused = {}
+    for hits in result_lists:
+        for rank, hit in enumerate(hits):
+            entry = fused.setdefault(hit["id"], dict(hit, rrf=0.0))
+            entry["rrf"] += 1.0 / (k + rank + 1)
+            for key in ("distance", "bm25"): # 保留各路的原始分数，便于排查
+                if key in hit:
+                    entry[key] = hit[key]
+    return sorted(fused.values(), key=lambda h: -h["rrf"])[:n_results]
+
+def _where_sql(where):
+    """Chroma where 的常用子集 ({"k": v}、{"k": {"$eq" / "$in": ...}}、$and / $or) 翻译成对 metadata JSON 的 SQL 条件。"""
+    for op, joiner in (("$and", " AND "), ("$or", " OR ")):
+        if op in where:
+            parts = [_where_sql(w) for w in where[op]]
+            return joiner.join(f"({sql})" for sql, _ in parts), [p for _, params in parts for p in params]
+    conds, params = [], []
+    for key, value in where.items():
+        path = '$."' + key.replace('"', '') + '"'
+        if isinstance(value, dict):
+            (op, value), = value.items()
+            if op == "$in":
+                conds.append(f"json_extract(c.metadata, ?) IN ({', '.join('?' * len(value))})")
+                params += [path, *value]
+                continue
+            if op != "$eq":
+                raise ValueError(f"倒排索引不支持的过滤条件: {op}")
+        conds.append("json_extract(c.metadata, ?) = ?")
+        params += [path, value]
+    return " AND ".join(conds) or "1", params
+
+class LexicalIndex:
+    """
+    用法:
+        lex = LexicalIndex(lexical_path(DB_PATH, "ran1_docs"), "ran1_docs")
+        lex.add(ids, docs, metas)          # 入库流水线写入线程调用
+        lex.delete_files([filename, ...])
+        hits = lex.search("R1-2501234", 5)
+    """
+
+    def __init__(self, path, collection_name=None):
+        self.path = path
+        self.collection_name = collection_name or os.path.basename(path).replace("_lexical.sqlite", "")
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        # 写入线程和主线程共用一个连接，用锁串行化
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS chunks (
+                rowid INTEGER PRIMARY KEY,
+                id TEXT UNIQUE,
+                filename TEXT,
+                document TEXT,
+                metadata TEXT
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_chunks_filename ON chunks(filename)")
+        # 词元已经由 tokenize 切好并用空格连接，tokenchars 保证 FTS5 不会把 "7.4.1" 再切开
+        self._conn.execute("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS chunks_fts
+            USING fts5(tokens, tokenize="unicode61 tokenchars '.-_/'")
+        """)
+        self._conn.commit()
+
+    def count(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+    def add(self, ids, docs, metas):
+        rows = [(cid, (meta or {}).get("filename"), doc, json.dumps(meta or {}, ensure_ascii=False))
+                for cid, doc, meta in zip(ids, docs, metas)]
+        with self._lock:
+            # 同 id 重复写入 (上次中断后重跑) 先删旧的
+            self._delete_where("id IN (SELECT value FROM json_each(?))", (json.dumps(list(ids)),))
+            for cid, filename, doc, meta in rows:
+                cur = self._conn.execute(
+                    "INSERT INTO chunks (id, filename, document, metadata) VALUES (?, ?, ?, ?)",
+                    (cid, filename, doc, meta))
+                self._conn.execute("INSERT INTO chunks_fts (rowid, tokens) VALUES (?, ?)",
+                                   (cur.lastrowid, " ".join(tokenize(doc))))
+            self._conn.commit()
+
+    def delete_files(self, filenames):
+        with self._lock:
+            for i in range(0, len(filenames), 500):
+                batch = json.dumps(list(filenames[i:i + 500]))
+                self._delete_where("filename IN (SELECT value FROM json_each(?))", (batch,))
+            self._conn.commit()
+
+    def _delete_where(self, condition, params):
+        self._conn.execute(f"DELETE FROM chunks_fts WHERE rowid IN (SELECT rowid FROM chunks WHERE {condition})", params)
+        self._conn.execute(f"DELETE FROM chunks WHERE {condition}", params)
+
+    def reset(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM chunks_fts")
+            self._conn.execute("DELETE FROM chunks")
+            self._conn.commit()
+
+    def search(self, query, n_results, where=None):
+        """
+        BM25 排序的 hit 列表: {"id", "document", "metadata", "bm25", "collection"}，bm25 越大越相关。
+        where 与 Chroma 的 where 写法相同，按切片元数据过滤。
+        """
+        terms = sorted(set(tokenize(query)))
+        if not terms:
+            return []
+        match = " OR ".join('"' + t.replace('"', '""') + '"' for t in terms)
+        cond, params = _where_sql(where) if where else ("1", [])
+        with self._lock:
+            rows = self._conn.execute(f"""
+                SELECT c.id, c.document, c.metadata, bm25(chunks_fts) AS score
+                FROM chunks_fts JOIN chunks c ON c.rowid = chunks_fts.rowid
+                WHERE chunks_fts MATCH ? AND ({cond})
+                ORDER BY score
+                LIMIT ?
+            """, (match, *params, n_results)).fetchall()
+        # FTS5 的 bm25() 越小越相关，这里取反
+        return [{"id": r[0], "document": r[1], "metadata": json.loads(r[2]), "bm25": -r[3],
+                 "collection": self.collection_name} for r in rows]
@@ -0,0 +1,85 @@
+import os
+import time
+import sqlite3
+import threading
+
+# === 目录页缓存 (条件请求) ===
+# 每晚刷新整个 38 系列要抓几百个协议目录页，绝大多数没有变化。这里把目录页正文连同服务器给的
+# ETag / Last-Modified 存进 SQLite，下次请求带 If-None-Match / If-Modified-Since：
+# 服务器回 304 就直接用缓存正文，一个没变的目录只花一个请求头的流量。
+# 服务器两个校验头都不给时，MAX_AGE 内直接用缓存，超过再整页重新抓。
+
+CACHE_DIR = os.environ.get("DEEPSPEC_CACHE_DIR", "./.deepspec_cache")
+CACHE_PATH = os.path.join(CACHE_DIR, "listings.sqlite")
+MAX_AGE = 6 * 3600 # 没有 ETag / Last-Modified 的目录页缓存多久 (秒)
+
+class ListingCache:
+    """
+    用法:
+        cache = ListingCache()
+        html = cache.fetch(HTTP, url)   # HTTP 为 http_session.HttpClient
+        print(cache.stats())
+    """
+
+    def __init__(self, path=CACHE_PATH, max_age=MAX_AGE):
+        self.max_age = max_age
+        self.not_modified = 0
+        self.fetched = 0
+        self.fresh = 0
+        self.bytes = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS listings (
+                url TEXT PRIMARY KEY,
+                etag TEXT,
+                last_modified TEXT,
+                body TEXT,
+                fetched_at REAL
+            )
+        """)
+        self._conn.commit()
+
+    def _get(self, url):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT etag, last_modified, body, fetched_at FROM listings WHERE url = ?", (url,)).fetchone()
+
+    def _put(self, url, etag, last_modified, body):
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO listings VALUES (?, ?, ?, ?, ?)",
+                               (url, etag, last_modified, body, time.time()))
+            self._conn.commit()
+
+    def fetch(self, http, url, timeout=30):
+        """返回目录页正文；非 2xx / 304 抛 requests.HTTPError。"""
+        row = self._get(url)
+        headers = {}
+        if row:
+            etag, last_modified, body, fetched_at = row
+            if not etag and not last_modified and time.time() - fetched_at < self.max_age:
+                with self._lock:
+                    self.fresh += 1
+                return body
+            if etag:
+                headers["If-None-Match"] = etag
+            if last_modified:
+                headers["If-Modified-Since"] = last_modified
+        r = http.get(url, timeout=timeout, headers=headers)
+        if r.status_code == 304 and row:
+            with self._lock:
+                self.not_modified += 1
+            return row[2]
+        r.raise_for_status()
+        body = r.text
+        self._put(url, r.headers.get("ETag"), r.headers.get("Last-Modified"), body)
+        with self._lock:
+            self.fetched += 1
+            self.bytes += len(r.content)
+        return body
+
+    def stats(self):
+        return (f"目录页缓存: 未变化 (304) {self.not_modified} | 缓存期内 {self.fresh} | "
+                f"重新抓取 {self.fetched} ({self.bytes / 1e3:.0f}KB)")
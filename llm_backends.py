@@ -0,0 +1,152 @@
+import json
+import time
+import random
+import threading
+from collections import deque, namedtuple
+
+# === LLM 后端 ===
+# 所有后端只提供一个同步方法 generate(prompt) -> LLMResult，
+# 限流 / 并发 / 重试统一交给 llm_scheduler，后端只负责把配额错误翻译成 RateLimitError。
+
+LLMResult = namedtuple("LLMResult", ["text", "prompt_tokens", "output_tokens"])
+
+class RetryableError(Exception):
+    """网络抖动、5xx 等，可以原样重试。"""
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class RateLimitError(RetryableError):
+    """429 / 配额耗尽，调度器需要降并发并退避。"""
+
+class GeminiBackend:
+    name = "gemini"
+
+    def __init__(self, model_name, api_key, generation_config=None):
+        import google.generativeai as genai
+        from google.api_core import exceptions as gexc
+
+        genai.configure(api_key=api_key, transport="rest") # 强制 REST，解决 gRPC 卡住的问题
+        self._genai = genai
+        self._gexc = gexc
+        self.model_name = model_name
+        self.generation_config = generation_config or {"response_mime_type": "application/json"}
+
+    def generate(self, prompt):
+        model = self._genai.GenerativeModel(self.model_name)
+        try:
+            response = model.generate_content(prompt, generation_config=self.generation_config)
+        except self._gexc.TooManyRequests as e: # ResourceExhausted 是它的子类
+            raise RateLimitError(f"Gemini 配额耗尽: {e}") from e
+        except (self._gexc.ServiceUnavailable, self._gexc.InternalServerError,
+                self._gexc.DeadlineExceeded) as e:
+            raise RetryableError(f"Gemini 暂时不可用: {e}") from e
+        usage = getattr(response, "usage_metadata", None)
+        return LLMResult(
+            response.text,
+            getattr(usage, "prompt_token_count", 0) or 0,
+            getattr(usage, "candidates_token_count", 0) or 0,
+        )
+
+class OllamaBackend:
+    """
+    本地 Ollama 后端 (例如 qwen2.5:14b)。
+    - keep_alive 让模型常驻显存 / 统一内存，连续请求之间不会被卸载重载；
+    - num_ctx 按 Prompt 长度取 2 的幂，短文档不用为 32k 上下文付 KV cache 的代价；
+    - 并发请求需要服务端设置 OLLAMA_NUM_PARALLEL，并发数由调度器控制。
+    """
+    name = "ollama"
+
+    def __init__(self, model_name, host=None, keep_alive="30m", min_ctx=4096, max_ctx=32768, output_reserve=2048):
+        import ollama
+
+        self._ollama = ollama
+        self._client = ollama.Client(host=host) if host else ollama.Client()
+        self.model_name = model_name
+        self.keep_alive = keep_alive
+        self.min_ctx = min_ctx
+        self.max_ctx = max_ctx
+        self.output_reserve = output_reserve
+        self.generation_config = {"format": "json"}
+        self._lock = threading.Lock()
+        self.prompt_tokens = 0
+        self.eval_tokens = 0
+        self.prompt_seconds = 0.0
+        self.eval_seconds = 0.0
+
+    def context_size(self, prompt):
+        need = len(prompt) // 3 + self.output_reserve
+        ctx = self.min_ctx
+        while ctx < need and ctx < self.max_ctx:
+            ctx *= 2
+        return min(ctx, self.max_ctx)
+
+    def warmup(self):
+        # 空 Prompt 只加载模型，不生成内容
+        self._client.generate(model=self.model_name, prompt="", keep_alive=self.keep_alive)
+
+    def generate(self, prompt):
+        try:
+            resp = self._client.chat(
+                model=self.model_name,
+                messages=[{"role": "user", "content": prompt}],
+                format="json",
+                options={"num_ctx": self.context_size(prompt)},
+                keep_alive=self.keep_alive,
+            )
+        except self._ollama.ResponseError as e:
+            if e.status_code in (429, 503): # 服务端排队已满 (OLLAMA_MAX_QUEUE)
+                raise RateLimitError(f"Ollama 繁忙: {e}") from e
+            raise
+        except ConnectionError as e:
+            raise RetryableError(f"Ollama 连接失败: {e}") from e
+
+        prompt_tokens = resp.get("prompt_eval_count") or 0
+        output_tokens = resp.get("eval_count") or 0
+        with self._lock:
+            self.prompt_tokens += prompt_tokens
+            self.eval_tokens += output_tokens
+            self.prompt_seconds += (resp.get("prompt_eval_duration") or 0) / 1e9
+            self.eval_seconds += (resp.get("eval_duration") or 0) / 1e9
+        return LLMResult(resp["message"]["content"], prompt_tokens, output_tokens)
+
+    def stats(self):
+        # 单请求视角的速度；并发时总吞吐看调度器的统计
+        prefill = self.prompt_tokens / self.prompt_seconds if self.prompt_seconds else 0.0
+        decode = self.eval_tokens / self.eval_seconds if self.eval_seconds else 0.0
+        return f"Ollama: prefill {prefill:.0f} tokens/s, decode {decode:.1f} tokens/s (单请求)"
+
+class FakeBackend:
+    """
+    本地假后端：模拟 RPM / TPM 配额和响应延迟，超配额时抛 RateLimitError。
+    不联网、不花钱，用来验证调度器能不能把配额吃满又不被限流。
+    period 为配额窗口秒数 (默认 60)，调小可以把一分钟压缩成几秒做快速演示。
+    """
+    name = "fake"
+
+    def __init__(self, rpm=15, tpm=250_000, latency=(0.5, 2.0), output_tokens=400, period=60.0, response=None):
+        self.model_name = "fake-model"
+        self.rpm = rpm
+        self.tpm = tpm
+        self.latency = latency
+        self.output_tokens = output_tokens
+        self.period = period
+        self.response = response if response is not None else "[]"
+        self._window = deque() # (时间, token 数)
+        self._lock = threading.Lock()
+
+    def generate(self, prompt):
+        prompt_tokens = max(1, len(prompt) // 4)
+        cost = prompt_tokens + self.output_tokens
+        with self._lock:
+            now = time.monotonic()
+            while self._window and now - self._window[0][0] > self.period:
+                self._window.popleft()
+            used_tokens = sum(t for _, t in self._window)
+            if len(self._window) >= self.rpm or used_tokens + cost > self.tpm:
+                retry_after = self.period - (now - self._window[0][0]) if self._window else 1.0
+                raise RateLimitError("429 Too Many Requests (fake)", retry_after=retry_after)
+            self._window.append((now, cost))
+        time.sleep(random.uniform(*self.latency))
+        text = self.response if isinstance(self.response, str) else json.dumps(self.response, ensure_ascii=False)
+        return LLMResult(text, prompt_tokens, self.output_tokens)
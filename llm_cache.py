@@ -0,0 +1,119 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+
+# === LLM 响应缓存 (record / replay) ===
+# 键 = 后端 + 模型 + 生成参数 + 完整 Prompt 的哈希；输入没变就直接复用上次的回答，不再重复付费 / 等待。
+# 模式 (环境变量 DEEPSPEC_LLM_CACHE)：
+#   on     命中就用，未命中调用模型并写入 (默认)
+#   record 总是调用模型，用新结果覆盖缓存 (刷新录制)
+#   replay 只从缓存读，未命中直接报 CacheMiss —— 用于离线全速回放整个分析流程做基准 / 测试
+#   off    完全不用缓存
+
+CACHE_DIR = os.environ.get("DEEPSPEC_CACHE_DIR", "./.deepspec_cache")
+CACHE_PATH = os.path.join(CACHE_DIR, "llm_responses.sqlite")
+CACHE_MODE = os.environ.get("DEEPSPEC_LLM_CACHE", "on")
+MAX_CACHE_MB = 512
+MAX_AGE_DAYS = 30
+
+class CacheMiss(Exception):
+    """replay 模式下缓存里没有这条 Prompt。"""
+
+class LLMCache:
+    def __init__(self, path=CACHE_PATH, mode=CACHE_MODE, max_mb=MAX_CACHE_MB, max_age_days=MAX_AGE_DAYS):
+        if mode not in ("on", "record", "replay", "off"):
+            raise ValueError(f"未知的缓存模式: {mode}")
+        self.mode = mode
+        self.max_bytes = max_mb * 1024 * 1024
+        self.max_age = max_age_days * 86400 if max_age_days else None
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = None
+        if mode == "off":
+            return
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                backend TEXT,
+                model TEXT,
+                response TEXT,
+                prompt_tokens INTEGER,
+                output_tokens INTEGER,
+                size INTEGER,
+                created_at REAL,
+                last_used REAL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_resp_last_used ON responses(last_used)")
+        self._conn.commit()
+        if mode != "replay":
+            self._evict()
+
+    @staticmethod
+    def make_key(backend, model, config, prompt):
+        prompt_hash = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        raw = json.dumps([backend, model, config or {}, prompt_hash], sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        """返回 (response, prompt_tokens, output_tokens) 或 None；replay 模式未命中抛 CacheMiss。"""
+        if self.mode in ("off", "record"):
+            return None
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response, prompt_tokens, output_tokens, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            # replay 是离线回放，不考虑过期
+            if row and self.max_age and self.mode != "replay" and time.time() - row[3] > self.max_age:
+                row = None
+            if row:
+                self._conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (time.time(), key))
+                self._conn.commit()
+        if row:
+            self.hits += 1
+            return row[0], row[1], row[2]
+        self.misses += 1
+        if self.mode == "replay":
+            raise CacheMiss(f"replay 模式下缓存未命中: {key[:12]}")
+        return None
+
+    def put(self, key, backend, model, response, prompt_tokens=0, output_tokens=0):
+        if self.mode in ("off", "replay") or response is None:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.execute("""
+                INSERT OR REPLACE INTO responses
+                (key, backend, model, response, prompt_tokens, output_tokens, size, created_at, last_used)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, (key, backend, model, response, prompt_tokens, output_tokens,
+                  len(response.encode("utf-8")), now, now))
+            self._conn.commit()
+
+    def _evict(self):
+        # 启动时清理一次：先删过期的，再按最近使用时间把总量压到上限的 90%
+        with self._lock:
+            if self.max_age:
+                self._conn.execute("DELETE FROM responses WHERE created_at < ?", (time.time() - self.max_age,))
+            total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+            if total > self.max_bytes:
+                target = total - int(self.max_bytes * 0.9)
+                freed = 0
+                victims = []
+                for key, size in self._conn.execute("SELECT key, size FROM responses ORDER BY last_used"):
+                    victims.append((key,))
+                    freed += size
+                    if freed >= target:
+                        break
+                self._conn.executemany("DELETE FROM responses WHERE key = ?", victims)
+            self._conn.commit()
+
+    def stats(self):
+        return f"LLM 缓存 ({self.mode}): 命中 {self.hits} / 未命中 {self.misses}"
@@ -0,0 +1,209 @@
+import time
+import random
+import asyncio
+from collections import deque
+from colorama import Fore
+from llm_backends import LLMResult, RateLimitError, RetryableError
+from llm_cache import LLMCache
+
+# === 自适应限流调度器 ===
+# 1. 两个令牌桶：每分钟请求数 (RPM) 和每分钟 token 数 (TPM)，按配额匀速放行，不再盲目 sleep；
+# 2. 并发上限 AIMD：连续成功就慢慢加并发，遇到 429 立刻减半并清空令牌桶；
+# 3. 实时打印吞吐 (req/min, tokens/min, 当前并发, 429 次数)。
+# 后端调用是同步的，放在线程里跑；调度本身在 asyncio 事件循环里完成。
+
+OUTPUT_RESERVE = 2048 # 估算 TPM 时给输出预留的 token 数
+
+def estimate_tokens(text):
+    # 英文约 4 字符 / token，中文约 1.5 字符 / token，这里取偏保守的估计
+    return len(text) // 3 + 1
+
+class TokenBucket:
+    def __init__(self, rate, period=60.0, capacity=None):
+        self.capacity = capacity or rate
+        self.nominal_rate = rate / period
+        self.fill_rate = self.nominal_rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.fill_rate)
+        self.updated = now
+
+    async def acquire(self, amount=1):
+        amount = min(amount, self.capacity) # 单次请求超过桶容量时，等桶满就放行
+        while True:
+            self._refill()
+            if self.tokens >= amount:
+                self.tokens -= amount
+                return
+            await asyncio.sleep((amount - self.tokens) / self.fill_rate)
+
+    def adjust(self, delta):
+        """拿到真实用量后补扣 / 退还 (可以扣成负数，相当于欠账，后续请求自动多等)。"""
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens - delta)
+
+    def throttle(self):
+        """被 429 了：清空桶，并把速率下调 10% (配置的配额可能比真实配额高)。"""
+        self._refill()
+        self.tokens = min(self.tokens, 0)
+        self.fill_rate = max(self.nominal_rate * 0.2, self.fill_rate * 0.9)
+
+    def recover(self):
+        self.fill_rate = min(self.nominal_rate, self.fill_rate * 1.01)
+
+class AdaptiveConcurrency:
+    """AIMD 并发上限：每成功一轮 (约 limit 次) +1，被限流时减半，其他失败不改上限。"""
+
+    def __init__(self, initial=1, minimum=1, maximum=8):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.in_flight = 0
+        self._cond = asyncio.Condition()
+
+    async def acquire(self):
+        async with self._cond:
+            await self._cond.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+
+    async def release(self, succeeded=False, throttled=False):
+        async with self._cond:
+            self.in_flight -= 1
+            if throttled:
+                self.limit = max(self.minimum, self.limit / 2)
+            elif succeeded:
+                # 只有成功的调用才往上爬：5xx / 超时一直失败的后端不能把并发越推越高
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self._cond.notify_all()
+
+class LLMScheduler:
+    """
+    用法:
+        async with LLMScheduler(backend, rpm=10, tpm=250_000) as scheduler:
+            result = await scheduler.call(prompt)
+    rpm / tpm 为 None 表示不限 (例如本地 Ollama)。
+    cache 为 llm_cache.LLMCache 时先查缓存，命中的请求不占配额也不占并发。
+    """
+
+    def __init__(self, backend, rpm=None, tpm=None, max_concurrency=8, initial_concurrency=1,
+                 max_retries=6, period=60.0, report_interval=15.0, cache=None):
+        self.backend = backend
+        self.cache = cache
+        self.period = period
+        self.rpm_bucket = TokenBucket(rpm, period) if rpm else None
+        self.tpm_bucket = TokenBucket(tpm, period) if tpm else None
+        self.concurrency = AdaptiveConcurrency(initial_concurrency, 1, max_concurrency)
+        self.max_retries = max_retries
+        self.report_interval = report_interval
+        self._recent = deque() # (完成时间, token 数)
+        self._reporter = None
+        self.started = time.monotonic()
+        self.completed = 0
+        self.failed = 0
+        self.throttled = 0
+        self.cache_hits = 0
+        self.total_tokens = 0
+
+    async def __aenter__(self):
+        self.started = time.monotonic()
+        if self.report_interval:
+            self._reporter = asyncio.create_task(self._report_loop())
+        return self
+
+    async def __aexit__(self, *exc):
+        if self._reporter:
+            self._reporter.cancel()
+        print(self.summary())
+
+    async def call(self, prompt, est_tokens=None):
+        key = None
+        if self.cache:
+            key = LLMCache.make_key(self.backend.name, self.backend.model_name,
+                                    getattr(self.backend, "generation_config", None), prompt)
+            hit = self.cache.get(key) # replay 模式未命中会直接抛 CacheMiss
+            if hit:
+                self.cache_hits += 1
+                return LLMResult(*hit)
+
+        est = est_tokens or estimate_tokens(prompt) + OUTPUT_RESERVE
+        for attempt in range(self.max_retries + 1):
+            await self.concurrency.acquire()
+            throttled = succeeded = False
+            delay = None
+            try:
+                if self.rpm_bucket:
+                    await self.rpm_bucket.acquire(1)
+                if self.tpm_bucket:
+                    await self.tpm_bucket.acquire(est)
+                result = await asyncio.to_thread(self.backend.generate, prompt)
+                succeeded = True
+            except RetryableError as e:
+                throttled = isinstance(e, RateLimitError)
+                if throttled:
+                    self.throttled += 1
+                    # 配额已经用光：令牌桶清零并降速，让所有排队请求一起等
+                    for bucket in (self.rpm_bucket, self.tpm_bucket):
+                        if bucket: bucket.throttle()
+                if attempt == self.max_retries:
+                    self.failed += 1
+                    raise
+                delay = e.retry_after or min(60.0, 2 ** attempt)
+                delay *= random.uniform(0.8, 1.2)
+                print(f"{Fore.YELLOW}⏳ {e} -> {delay:.1f}s 后重试 (第 {attempt + 1} 次)")
+            except Exception:
+                self.failed += 1
+                raise
+            finally:
+                await self.concurrency.release(succeeded=succeeded, throttled=throttled)
+            if delay is not None:
+                # 先归还并发名额再退避，等待期间别的请求可以用这个名额
+                await asyncio.sleep(delay)
+                continue
+
+            used = result.prompt_tokens + result.output_tokens
+            if self.tpm_bucket and used:
+                self.tpm_bucket.adjust(used - est)
+            for bucket in (self.rpm_bucket, self.tpm_bucket):
+                if bucket: bucket.recover()
+            self.completed += 1
+            self.total_tokens += used
+            self._recent.append((time.monotonic(), used))
+            if self.cache:
+                self.cache.put(key, self.backend.name, self.backend.model_name,
+                               result.text, result.prompt_tokens, result.output_tokens)
+            return result
+
+    def throughput(self):
+        """最近一个配额窗口内的 (请求数, token 数)。"""
+        now = time.monotonic()
+        while self._recent and now - self._recent[0][0] > self.period:
+            self._recent.popleft()
+        return len(self._recent), sum(t for _, t in self._recent)
+
+    async def _report_loop(self):
+        while True:
+            await asyncio.sleep(self.report_interval)
+            reqs, tokens = self.throughput()
+            print(f"{Fore.MAGENTA}📈 完成 {self.completed} | 最近窗口 {reqs} req, {tokens} tokens | "
+                  f"并发上限 {int(self.concurrency.limit)} (在途 {self.concurrency.in_flight}) | 429 {self.throttled} 次")
+
+    def summary(self):
+        elapsed = max(time.monotonic() - self.started, 1e-6)
+        scale = self.period / elapsed
+        return (f"调度统计: 完成 {self.completed}, 缓存命中 {self.cache_hits}, 失败 {self.failed}, 429 {self.throttled} 次 | "
+                f"平均 {self.completed * scale:.1f} req/窗口, {self.total_tokens * scale:.0f} tokens/窗口 | 用时 {elapsed:.1f}s")
+
+async def _demo():
+    # 假后端配额 60 RPM，调度器故意配成 80 RPM，观察它被 429 后自动退避、稳定在配额附近
+    from llm_backends import FakeBackend
+
+    period = 6.0 # 把一分钟压缩成 6 秒
+    backend = FakeBackend(rpm=60, tpm=10 ** 9, latency=(0.05, 0.3), period=period)
+    async with LLMScheduler(backend, rpm=80, max_concurrency=16, period=period, report_interval=2.0) as scheduler:
+        await asyncio.gather(*(scheduler.call(f"fake prompt {i}") for i in range(300)))
+
+if __name__ == "__main__":
+    asyncio.run(_demo())
@@ -0,0 +1,80 @@
+import os
+import re
+from urllib.parse import urljoin, unquote
+from bs4 import BeautifulSoup
+
+# === 会议目录增量同步 ===
+# 会议期间 Docs 目录每天都在加文件，每次全量重下几千个 zip 没有必要。
+# 同步清单 (SAVE_DIR/.sync_manifest.json，格式同 file_manifest) 记录每个 zip 在目录页上的大小和修改时间：
+#   {"version": 5, "files": {"R1-2501234.zip": {"size": ..., "modified": "...", "status": "done", "extracted": [...]}}}
+# 目录页上大小 / 修改时间都没变、且上次已校验解压成功 (status == "done") 的 zip 直接跳过；
+# 只有解压并校验通过后才写 done，下载或解压中断的文件下次会重新处理 (部分文件用 Range 续传)。
+
+SYNC_MANIFEST = ".sync_manifest.json"
+
+_DATE = re.compile(r"\d{4}[/-]\d{1,2}[/-]\d{1,2}|\d{1,2}[/-]\d{1,2}[/-]\d{4}|"
+                   r"(?:[A-Za-z]+,\s*)?[A-Za-z]+\s+\d{1,2},\s*\d{4}|\d{1,2}-[A-Za-z]{3}-\d{4}")
+_TIME = re.compile(r"\d{1,2}:\d{2}(?::\d{2})?(?:\s*[AP]M)?", re.IGNORECASE)
+_SIZE = re.compile(r"(\d[\d,]*(?:\.\d+)?)\s*(bytes|[KMG]i?B|[KMG])?\b", re.IGNORECASE)
+_UNITS = {"k": 1024, "m": 1024 ** 2, "g": 1024 ** 3}
+
+def sync_manifest_path(save_dir):
+    return os.path.join(save_dir, SYNC_MANIFEST)
+
+def parse_size(text):
+    """目录页上的大小文字 ("123456" / "1,234" / "120 KB" / "1.2M") 转成字节数；找不到返回 None。"""
+    m = _SIZE.search(text)
+    if not m:
+        return None
+    value = float(m.group(1).replace(",", ""))
+    unit = (m.group(2) or "").lower()
+    return int(value * _UNITS.get(unit[:1], 1))
+
+def _entry_text(a_tag):
+    """链接所在行除文件名外的文字：表格格式取同一行的其他单元格，<pre> 格式取链接前面的文字。"""
+    row = a_tag.find_parent("tr")
+    if row is not None:
+        return " ".join(td.get_text(" ", strip=True) for td in row.find_all("td") if td.find("a") is None)
+    prev = a_tag.previous_sibling
+    return str(prev) if prev is not None and not hasattr(prev, "find_all") else ""
+
+def parse_listing(html, base_url):
+    """
+    解析 3GPP FTP 目录页，返回 [{"name", "url", "size", "modified"}]，只保留 zip。
+    size / modified 解析不出来时为 None (这样的文件每次都会按 "可能有变化" 处理)。
+    """
+    soup = BeautifulSoup(html, "html.parser")
+    entries = {}
+    for a_tag in soup.find_all("a", href=True):
+        href = a_tag["href"]
+        if not href.lower().endswith(".zip"):
+            continue
+        name = unquote(href.rstrip("/").split("/")[-1])
+        text = _entry_text(a_tag)
+        stamp = " ".join(m.group(0) for m in _DATE.finditer(text))
+        stamp = " ".join(filter(None, [stamp] + [m.group(0) for m in _TIME.finditer(text)]))
+        rest = _TIME.sub(" ", _DATE.sub(" ", text))
+        entries[name] = {"name": name, "url": urljoin(base_url, href),
+                         "size": parse_size(rest), "modified": stamp or None}
+    return list(entries.values())
+
+def diff_listing(listing, manifest):
+    """
+    返回 (todo, unchanged, gone)。
+    todo:      需要下载的条目 (新文件、大小或修改时间变了、上次没有成功完成)
+    unchanged: 跳过的文件数
+    gone:      清单里有、目录页上已经没有的文件名 (只报告，不删除本地文件)
+    """
+    known = manifest["files"]
+    todo = []
+    unchanged = 0
+    for entry in listing:
+        old = known.get(entry["name"])
+        if (old and old.get("status") == "done" and entry["size"] is not None and entry["modified"] is not None
+                and old.get("size") == entry["size"] and old.get("modified") == entry["modified"]):
+            unchanged += 1
+            continue
+        todo.append(entry)
+    names = {e["name"] for e in listing}
+    gone = [name for name in known if name not in names]
+    return todo, unchanged, gone
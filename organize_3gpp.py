@@ -1,7 +1,7 @@
 import os
 import shutil
 import re
-import fitz  # PyMuPDF
+from doc_cache import load_pdf_first_page
 
 def sanitize_folder_name(name):
     """
@@ -30,12 +30,10 @@ def organize_pdfs_by_source(folder_path):
         file_path = os.path.join(folder_path, filename)
         
         try:
-            # 打开 PDF
-            with fitz.open(file_path) as doc:
-                # 只读取第一页，通常 Source 都在第一页顶部
-                if len(doc) < 1:
-                    continue
-                text = doc[0].get_text()
+            # 只读取第一页，通常 Source 都在第一页顶部 (解析结果有缓存，重跑不再打开 PDF)
+            text = load_pdf_first_page(file_path)
+            if text is None:
+                continue
 
             # 使用正则表达式查找 Source 行
             # 匹配逻辑：找 "Source" 开头，忽略大小写，允许 "Source(s)"，匹配冒号后的内容
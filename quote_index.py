@@ -0,0 +1,93 @@
+import unicodedata
+from collections import defaultdict
+
+# === 证据原文定位 ===
+# 对整篇文档只做一次归一化 (去空白、去连字符、统一引号/全角、小写)，并建 k-gram 倒排索引。
+# 每条 evidence_quote 用它的全部 k-gram 去索引里投票找对齐位置：
+#   - 总耗时约 O(文档长度 + 各 quote 长度之和)，不再每条观点重建一次原文；
+#   - 整句参与比对，而不是只看前 50 个字符；
+#   - 先做一次精确查找 (任意长度)：逐字引用的原文直接命中，不受模板话术的影响；
+#   - 允许少量字符差异 (换行断词、模型改了个标点)，只要大部分 k-gram 对得上；
+#   - 返回在原文中的字符区间，方便人工复核时直接跳转。
+
+GRAM = 8                # k-gram 长度
+MAX_POSTINGS = 64       # 出现太多次的 gram (模板话术) 不参与投票
+SLACK = 3               # 对齐位置允许的漂移 (容忍插入/删除几个字符)
+MIN_SCORE = 0.6         # 命中的 gram 比例下限
+
+_DROP = {"-", "­", "‐", "‑", "‒", "–", "—"}
+_REPLACE = {"“": '"', "”": '"', "‘": "'", "’": "'"}
+
+def _normalize(text):
+    """返回 (归一化字符串, 每个字符在原文里的下标)。"""
+    chars, offsets = [], []
+    for i, ch in enumerate(text):
+        if ch.isspace() or ch in _DROP:
+            continue
+        ch = _REPLACE.get(ch, ch)
+        for c in unicodedata.normalize("NFKC", ch).lower():
+            if not c.isspace() and c not in _DROP:
+                chars.append(c)
+                offsets.append(i)
+    return "".join(chars), offsets
+
+class QuoteIndex:
+    def __init__(self, text):
+        self.text = text
+        self.norm, self.offsets = _normalize(text)
+        self.grams = defaultdict(list)
+        norm = self.norm
+        for i in range(len(norm) - GRAM + 1):
+            self.grams[norm[i:i + GRAM]].append(i)
+
+    def _span(self, start, length):
+        """归一化区间 -> 原文区间 [start, end)。"""
+        start = max(0, start)
+        end = min(len(self.norm), start + length)
+        if end <= start:
+            return None
+        return self.offsets[start], self.offsets[end - 1] + 1
+
+    def locate(self, quote):
+        """
+        在原文里定位 quote。
+        找到时返回 {"start": ..., "end": ..., "score": ...}，score 为 1.0 表示逐字一致；找不到返回 None。
+        """
+        q, _ = _normalize(quote or "")
+        if not q:
+            return None
+
+        # 逐字一致的先精确查找：3GPP 文稿里 "Proposal N: Support ..." 这类句式大量重复，
+        # 它们的 gram 超过 MAX_POSTINGS 不参与投票，逐字引用也可能凑不够 MIN_SCORE
+        pos = self.norm.find(q)
+        if pos >= 0:
+            start, end = self._span(pos, len(q))
+            return {"start": start, "end": end, "score": 1.0}
+        if len(q) < GRAM * 2:
+            return None # 太短没法投票
+
+        votes = defaultdict(int)
+        n_grams = len(q) - GRAM + 1
+        for j in range(n_grams):
+            postings = self.grams.get(q[j:j + GRAM])
+            if not postings or len(postings) > MAX_POSTINGS:
+                continue
+            for p in postings:
+                votes[p - j] += 1
+        if not votes:
+            return None
+
+        # 相近的对齐位置合并计票 (插入/删除会让后半段整体偏移几个字符)
+        best_d, best_votes = None, 0
+        for d in votes:
+            total = sum(votes.get(d + k, 0) for k in range(-SLACK, SLACK + 1))
+            if total > best_votes or (total == best_votes and votes[d] > votes.get(best_d, 0)):
+                best_d, best_votes = d, total
+
+        score = min(1.0, best_votes / n_grams)
+        if score < MIN_SCORE:
+            return None
+        span = self._span(best_d, len(q))
+        if span is None:
+            return None
+        return {"start": span[0], "end": span[1], "score": round(score, 3)}
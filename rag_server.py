@@ -0,0 +1,324 @@
+import os
+import json
+import time
+import asyncio
+import threading
+from collections import deque
+from urllib.parse import urlsplit, parse_qs
+from concurrent.futures import ThreadPoolExecutor
+from colorama import init, Fore
+from embed_cache import get_embedding_function
+from llm_cache import LLMCache
+from answer_cache import SemanticAnswerCache, kb_version, fingerprint
+from context_packer import pack_context
+from chat import (DB_PATH, MODEL_NAME, LLM_CACHE_MODE, SEARCH_WORKERS, open_collections, open_lexical,
+                  lexical_only, parse_filters, embed_query, retrieve, build_prompt, generate_answer)
+
+init(autoreset=True)
+
+# === DeepSpec RAG 常驻服务 ===
+# 模型、Chroma 客户端、倒排索引、缓存只在启动时加载一次，所有分析师共用一个进程：
+#   POST /ask   {"question": "..."}  (或 GET /ask?q=...)  -> text/event-stream
+#               event: meta  检索结果、过滤条件、检索耗时
+#               event: token 回答片段 (JSON 字符串)
+#               event: done  各阶段耗时
+#   GET /metrics  排队深度、在途生成数、各阶段延迟分位数
+#   GET /health
+# 生成阶段有界：最多 GEN_CONCURRENCY 个同时生成；已受理但还没拿到生成名额的请求超过 QUEUE_LIMIT 时直接返回 503 (带 Retry-After)。
+# DEEPSPEC_RAG_LLM=stub 时用假的流式生成器代替 Ollama，不需要 GPU 就能压测 / 联调。
+# 用法: curl -N -X POST http://127.0.0.1:8765/ask -d '{"question": "DMRS 怎么定义的? vendor:Huawei"}'
+
+# === 配置 ===
+HOST = os.environ.get("DEEPSPEC_RAG_HOST", "127.0.0.1")
+PORT = int(os.environ.get("DEEPSPEC_RAG_PORT", "8765"))
+LLM_MODE = os.environ.get("DEEPSPEC_RAG_LLM", "ollama") # ollama / stub
+GEN_CONCURRENCY = 2     # 同时生成的回答数 (与 OLLAMA_NUM_PARALLEL 一致)
+QUEUE_LIMIT = 16        # 等待生成的请求上限，超出返回 503
+METRICS_WINDOW = 200    # 延迟分位数统计最近多少个请求
+MAX_BODY = 64 * 1024
+STUB_TOKENS = 40        # stub 回答的片段数
+STUB_DELAY = 0.02       # stub 每个片段的间隔 (秒)
+
+def stub_generate(prompt, cache=None):
+    """假的流式生成：不调用模型，按固定节奏吐出片段。"""
+    time.sleep(STUB_DELAY * 5) # 模拟 prefill
+    for i in range(STUB_TOKENS):
+        time.sleep(STUB_DELAY)
+        yield f"[stub {i}] "
+
+def _percentiles(values):
+    if not values:
+        return {"p50": None, "p95": None, "max": None}
+    s = sorted(values)
+    pick = lambda q: round(s[min(len(s) - 1, int(q * len(s)))], 4)
+    return {"p50": pick(0.5), "p95": pick(0.95), "max": round(s[-1], 4)}
+
+class Metrics:
+    def __init__(self, window=METRICS_WINDOW):
+        self.started = time.time()
+        self.requests = 0
+        self.completed = 0
+        self.rejected = 0
+        self.errors = 0
+        self.cache_hits = 0
+        self.waiting = 0
+        self.generating = 0
+        self._recent = {k: deque(maxlen=window) for k in ("queue_wait", "retrieval", "ttft", "total")}
+
+    def observe(self, timings):
+        for key, values in self._recent.items():
+            if timings.get(key) is not None:
+                values.append(timings[key])
+
+    def snapshot(self):
+        return {
+            "uptime": round(time.time() - self.started, 1),
+            "requests": self.requests,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "errors": self.errors,
+            "answer_cache_hits": self.cache_hits,
+            "queue_depth": self.waiting,
+            "generating": self.generating,
+            "latency": {k: _percentiles(list(v)) for k, v in self._recent.items()},
+        }
+
+class RagEngine:
+    """启动时加载一次：Embedding 模型、Chroma 集合、倒排索引、两级缓存。"""
+
+    def __init__(self, llm_mode=LLM_MODE):
+        t0 = time.perf_counter()
+        import chromadb
+        self.client = chromadb.PersistentClient(path=DB_PATH)
+        self.ef = get_embedding_function("all-MiniLM-L6-v2")
+        self.coll_specs, self.coll_tdocs = open_collections(self.client, self.ef)
+        self.lexical = open_lexical([self.coll_specs] + self.coll_tdocs)
+        self.llm_cache = LLMCache(mode=LLM_CACHE_MODE)
+        self.answer_cache = SemanticAnswerCache()
+        self.executor = ThreadPoolExecutor(max_workers=SEARCH_WORKERS)
+        self.generate = stub_generate if llm_mode == "stub" else generate_answer
+        self.llm_mode = llm_mode
+        # Embedding 缓存全命中时模型是懒加载的，这里提前加载，避免第一个用户等模型
+        if hasattr(self.ef, "_model"):
+            self.ef._model()
+        self.load_time = time.perf_counter() - t0
+
+    def collection_names(self):
+        return [self.coll_specs.name] + [c.name for c in self.coll_tdocs]
+
+    def prepare(self, raw_query):
+        """检索 + 打包 (在线程里运行)。返回 dict: query / where / embedding / hits / blocks / fp / kb / timings。"""
+        t0 = time.perf_counter()
+        query, where = parse_filters(raw_query)
+        if lexical_only(query, self.lexical, [self.coll_specs] + self.coll_tdocs):
+            embedding, embed_time = None, None
+        else:
+            embedding, embed_time = embed_query(self.ef, query)
+        spec_hits, tdoc_hits, timings = retrieve(query, embedding, self.coll_specs, self.coll_tdocs,
+                                                 self.executor, self.lexical, where)
+        timings["embed"] = embed_time
+        fp = fingerprint(MODEL_NAME if self.llm_mode != "stub" else "stub", [h["id"] for h in spec_hits + tdoc_hits])
+        kb = kb_version(DB_PATH, self.collection_names())
+        cached = self.answer_cache.lookup(embedding, fp, kb) if embedding is not None else None
+        spec_blocks, tdoc_blocks, pack_stats = pack_context(spec_hits, tdoc_hits)
+        timings["retrieval"] = time.perf_counter() - t0
+        return {"query": query, "where": where, "embedding": embedding, "fp": fp, "kb": kb, "cached": cached,
+                "spec_blocks": spec_blocks, "tdoc_blocks": tdoc_blocks, "pack": pack_stats, "timings": timings}
+
+def _sources(blocks):
+    return [{"filename": b["metadata"].get("filename"), "section": b["metadata"].get("section"),
+             "vendor": b["metadata"].get("vendor"), "meeting": b["metadata"].get("meeting"), "chunks": b["ids"]}
+            for b in blocks]
+
+class RagServer:
+    def __init__(self, engine, gen_concurrency=GEN_CONCURRENCY, queue_limit=QUEUE_LIMIT):
+        self.engine = engine
+        self.metrics = Metrics()
+        self.gen_concurrency = gen_concurrency
+        self.queue_limit = queue_limit
+        self._gen_slots = asyncio.Semaphore(gen_concurrency)
+
+    # --- HTTP ---
+    async def handle(self, reader, writer):
+        try:
+            request_line = await reader.readline()
+            if not request_line:
+                return
+            method, target, _ = request_line.decode("latin-1").split(" ", 2)
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                k, _, v = line.decode("latin-1").partition(":")
+                headers[k.strip().lower()] = v.strip()
+            length = int(headers.get("content-length", 0) or 0)
+            if length > MAX_BODY:
+                return await self._send_json(writer, 413, {"error": "请求体过大"})
+            body = await reader.readexactly(length) if length else b""
+
+            url = urlsplit(target)
+            if url.path == "/health":
+                await self._send_json(writer, 200, {"status": "ok", "llm": self.engine.llm_mode})
+            elif url.path == "/metrics":
+                await self._send_json(writer, 200, dict(self.metrics.snapshot(), gen_concurrency=self.gen_concurrency,
+                                                         queue_limit=self.queue_limit))
+            elif url.path == "/ask" and method in ("GET", "POST"):
+                if method == "POST":
+                    payload = json.loads(body or b"{}")
+                    if not isinstance(payload, dict):
+                        return await self._send_json(writer, 400, {"error": "请求体必须是 JSON 对象"})
+                    question = payload.get("question", "")
+                else:
+                    question = parse_qs(url.query).get("q", [""])[0]
+                if not isinstance(question, str) or not question.strip():
+                    return await self._send_json(writer, 400, {"error": "缺少 question"})
+                await self._ask(writer, question)
+            else:
+                await self._send_json(writer, 404, {"error": "not found"})
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass # 客户端断开
+        except (ValueError, json.JSONDecodeError) as e:
+            await self._send_json(writer, 400, {"error": str(e)})
+        finally:
+            try:
+                writer.close()
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    async def _send_json(self, writer, status, payload, extra_headers=""):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        reason = {200: "OK", 400: "Bad Request", 404: "Not Found", 413: "Payload Too Large",
+                  503: "Service Unavailable"}.get(status, "OK")
+        writer.write(f"HTTP/1.1 {status} {reason}\r\nContent-Type: application/json; charset=utf-8\r\n"
+                     f"Content-Length: {len(body)}\r\n{extra_headers}Connection: close\r\n\r\n".encode("latin-1") + body)
+        await writer.drain()
+
+    async def _event(self, writer, event, data):
+        writer.write(f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n".encode("utf-8"))
+        await writer.drain()
+
+    # --- 问答 ---
+    async def _ask(self, writer, question):
+        m = self.metrics
+        m.requests += 1
+        if m.waiting >= self.queue_limit:
+            m.rejected += 1
+            return await self._send_json(writer, 503, {"error": "生成队列已满，请稍后重试", "queue_depth": m.waiting},
+                                         extra_headers="Retry-After: 5\r\n")
+        # 从受理开始就计入排队深度 (检索 + 等待生成名额)，拿到名额、命中缓存或出错时离开队列
+        m.waiting += 1
+        queued = [True]
+        def leave_queue():
+            if queued[0]:
+                queued[0] = False
+                m.waiting -= 1
+        try:
+            await self._answer(writer, question, leave_queue)
+        finally:
+            leave_queue()
+
+    async def _answer(self, writer, question, leave_queue):
+        m = self.metrics
+        t0 = time.perf_counter()
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream; charset=utf-8\r\n"
+                     b"Cache-Control: no-cache\r\nConnection: close\r\n\r\n")
+        try:
+            ctx = await asyncio.to_thread(self.engine.prepare, question)
+        except Exception as e:
+            m.errors += 1
+            return await self._event(writer, "error", repr(e))
+        timings = ctx["timings"]
+        await self._event(writer, "meta", {
+            "query": ctx["query"], "filters": ctx["where"], "context": ctx["pack"],
+            "sources": {"spec": _sources(ctx["spec_blocks"]), "tdoc": _sources(ctx["tdoc_blocks"])},
+            "cached": bool(ctx["cached"]),
+        })
+
+        if ctx["cached"]:
+            leave_queue()
+            m.cache_hits += 1
+            timings["ttft"] = time.perf_counter() - t0
+            await self._event(writer, "token", ctx["cached"]["answer"])
+        else:
+            # 排队拿生成名额
+            t_wait = time.perf_counter()
+            await self._gen_slots.acquire()
+            leave_queue()
+            timings["queue_wait"] = time.perf_counter() - t_wait
+            m.generating += 1
+            try:
+                answer = await self._stream_answer(writer, ctx, t0)
+            except Exception as e:
+                m.errors += 1
+                await self._event(writer, "error", repr(e))
+                return
+            finally:
+                m.generating -= 1
+                self._gen_slots.release()
+            if answer and ctx["embedding"] is not None:
+                self.engine.answer_cache.put(ctx["query"], ctx["embedding"], ctx["fp"], ctx["kb"], answer)
+
+        timings["total"] = time.perf_counter() - t0
+        m.completed += 1
+        m.observe(timings)
+        await self._event(writer, "done", {k: round(v, 4) for k, v in timings.items()
+                                           if isinstance(v, (int, float))})
+
+    async def _stream_answer(self, writer, ctx, t0):
+        """同步的流式生成器放在线程里跑，片段经 asyncio.Queue 转发给客户端；客户端断开时通知线程停止。"""
+        loop = asyncio.get_running_loop()
+        pieces = asyncio.Queue()
+        stop = threading.Event()
+        done = object()
+        prompt = build_prompt(ctx["query"], ctx["spec_blocks"], ctx["tdoc_blocks"])
+
+        def produce():
+            try:
+                for piece in self.engine.generate(prompt, self.engine.llm_cache):
+                    loop.call_soon_threadsafe(pieces.put_nowait, piece)
+                    if stop.is_set():
+                        break
+                loop.call_soon_threadsafe(pieces.put_nowait, done)
+            except Exception as e:
+                loop.call_soon_threadsafe(pieces.put_nowait, e)
+
+        producer = loop.run_in_executor(None, produce)
+        parts = []
+        try:
+            while True:
+                piece = await pieces.get()
+                if piece is done:
+                    break
+                if isinstance(piece, Exception):
+                    raise piece
+                if not parts:
+                    ctx["timings"]["ttft"] = time.perf_counter() - t0
+                parts.append(piece)
+                await self._event(writer, "token", piece)
+        except BaseException:
+            stop.set()
+            raise
+        await producer
+        return "".join(parts)
+
+async def serve(engine, host=HOST, port=PORT):
+    server = RagServer(engine)
+    srv = await asyncio.start_server(server.handle, host, port)
+    print(f"{Fore.GREEN}✅ DeepSpec RAG 服务已启动: http://{host}:{port} (LLM: {engine.llm_mode}，"
+          f"生成并发 {GEN_CONCURRENCY}，队列上限 {QUEUE_LIMIT})")
+    async with srv:
+        await srv.serve_forever()
+
+def main():
+    print(f"{Fore.CYAN}=== DeepSpec RAG 服务 ===")
+    engine = RagEngine()
+    print(f"模型和索引加载完成，用时 {engine.load_time:.1f}s | 集合: {', '.join(engine.collection_names())}")
+    try:
+        asyncio.run(serve(engine))
+    except KeyboardInterrupt:
+        print("服务已停止")
+
+if __name__ == "__main__":
+    main()
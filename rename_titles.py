@@ -1,5 +1,5 @@
 import os
-import fitz  # PyMuPDF
+from doc_cache import load_pdf_first_page
 import re
 
 def sanitize_filename(name):
@@ -19,43 +19,41 @@ def sanitize_filename(name):
 
 def extract_title_from_pdf(file_path):
     try:
-        with fitz.open(file_path) as doc:
-            if len(doc) < 1:
-                return None
-            
-            # 获取第一页文本
-            text = doc[0].get_text()
-            
-            # === 3GPP 标题提取逻辑 ===
-            
-            # 1. 寻找 Title 的开始位置
-            match_start = re.search(r'Title\s*[:：]', text, re.IGNORECASE)
-            if not match_start:
-                return None
-            
-            start_index = match_start.end()
-            remaining_text = text[start_index:]
-            
-            # 2. 定义结束关键词
-            stop_words = [
-                r'Document\s+for\s*[:：]', 
-                r'Agenda\s+Item\s*[:：]', 
-                r'Source\s*[:：]', 
-                r'Contact\s*[:：]'
-            ]
-            
-            min_end_index = len(remaining_text)
-            
-            # 寻找最近的一个结束关键词
-            for pattern in stop_words:
-                match_end = re.search(pattern, remaining_text, re.IGNORECASE)
-                if match_end:
-                    if match_end.start() < min_end_index:
-                        min_end_index = match_end.start()
-            
-            # 3. 截取并清洗
-            raw_title = remaining_text[:min_end_index]
-            return sanitize_filename(raw_title)
+        # 获取第一页文本 (按内容哈希缓存，重命名后仍然命中)
+        text = load_pdf_first_page(file_path)
+        if text is None:
+            return None
+        
+        # === 3GPP 标题提取逻辑 ===
+        
+        # 1. 寻找 Title 的开始位置
+        match_start = re.search(r'Title\s*[:：]', text, re.IGNORECASE)
+        if not match_start:
+            return None
+        
+        start_index = match_start.end()
+        remaining_text = text[start_index:]
+        
+        # 2. 定义结束关键词
+        stop_words = [
+            r'Document\s+for\s*[:：]', 
+            r'Agenda\s+Item\s*[:：]', 
+            r'Source\s*[:：]', 
+            r'Contact\s*[:：]'
+        ]
+        
+        min_end_index = len(remaining_text)
+        
+        # 寻找最近的一个结束关键词
+        for pattern in stop_words:
+            match_end = re.search(pattern, remaining_text, re.IGNORECASE)
+            if match_end:
+                if match_end.start() < min_end_index:
+                    min_end_index = match_end.start()
+        
+        # 3. 截取并清洗
+        raw_title = remaining_text[:min_end_index]
+        return sanitize_filename(raw_title)
             
     except Exception as e:
         print(f"[读取错误] {os.path.basename(file_path)}: {e}")
@@ -0,0 +1,53 @@
+import re
+
+# === 3GPP 协议版本号 ===
+# 协议 zip 的文件名形如 38211-i40.zip：横线后面是版本号，每位一个 base36 字符 (0-9, a=10 ... i=18, j=19)，
+# 依次是 主版本 (= Release)、技术版本、编辑版本，即 38211-i40 = V18.4.0 (Rel-18)。
+# 任一位超过 35 时改用 6 位十进制，每个字段两位：38331-190000 = V19.0.0。
+# 全是 3 位小写时按字符串排序碰巧对，但 6 位写法 "190000" 会排在 "i40" 前面，大小写混用也会乱序；
+# 按 Release 挑版本本来也要先解析出主版本号，所以统一解析成 (主, 技术, 编辑) 元组再比较。
+
+_SPEC_ZIP = re.compile(r"^(\d{4,5})-([0-9a-z]{3}|\d{6})(?:[_-][^.]*)?\.zip$", re.IGNORECASE)
+
+def parse_version_code(code):
+    """版本号 "i40" -> (18, 4, 0)；"190000" -> (19, 0, 0)；无法解析返回 None。"""
+    code = code.lower()
+    if len(code) == 6 and code.isdigit():
+        return int(code[0:2]), int(code[2:4]), int(code[4:6])
+    if len(code) == 3 and re.fullmatch(r"[0-9a-z]{3}", code):
+        return tuple(int(c, 36) for c in code)
+    return None
+
+def format_version(version):
+    return "V" + ".".join(str(v) for v in version)
+
+def parse_spec_zip(filename):
+    """
+    "38211-i40.zip" -> {"spec": "38211", "code": "i40", "version": (18, 4, 0), "release": 18, "filename": ...}
+    不是协议版本 zip 时返回 None。
+    """
+    m = _SPEC_ZIP.match(filename)
+    if not m:
+        return None
+    version = parse_version_code(m.group(2))
+    if version is None:
+        return None
+    return {"spec": m.group(1), "code": m.group(2).lower(), "version": version, "release": version[0],
+            "filename": filename}
+
+def select_versions(entries, release=None, all_versions=False):
+    """
+    从一个协议的全部版本里挑要下载的：
+      release=None               -> 最新版本
+      release=18                 -> Rel-18 里最新的版本
+      release=19, all_versions   -> Rel-19 的全部版本 (按版本号从旧到新)
+    entries 为 parse_spec_zip 的结果列表 (可以带其他字段，例如 url)。
+    """
+    if release is not None:
+        entries = [e for e in entries if e["release"] == release]
+    entries = sorted(entries, key=lambda e: e["version"])
+    if not entries:
+        return []
+    if all_versions and release is not None:
+        return entries
+    return entries[-1:]
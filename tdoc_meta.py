@@ -0,0 +1,157 @@
+import os
+import re
+from doc_cache import load_docx
+
+# === TDoc 元数据 ===
+# 文档层级 (README 的权力金字塔)：
+#   Report  Chairman Notes / Minutes (定义结论与方向)
+#   FLS     Feature Lead Summary (定义争议点与阵营)
+#   TDoc    普通提案 (技术细节与仿真数据)
+# 索引和分析共用同一套分类规则：先看文件名，文件名看不出来再嗅探文档开头几段 (Title / Source 行)。
+# 厂商 / 会议 / 议题号同样从文档开头解析 (厂商映射表原来在 classify_docs.py，现在三处共用)。
+
+DOC_TYPES = ("Report", "FLS", "TDoc")
+HEADER_PARAGRAPHS = 15 # 只看开头这么多段，3GPP 模板的 Source / Title / Agenda 都在这里
+META_VERSION = 2       # 分类 / 元数据规则变了就加一，索引会按新规则重建元数据
+
+# 静态厂商列表 (全部小写)，这是所有有效厂商的“原始”列表
+RAW_VENDORS = [
+    'huawei', 'ericsson', 'nokia', 'zte', 'catt', 'samsung',
+    'qualcomm', 'mediatek', 'intel', 'nvidia',
+    'apple', 'oppo', 'vivo', 'xiaomi', 'telstra ',
+    'ntt dcm', 'cmcc', 'vdf', 'dt'
+]
+# 键是所有可能的名称 (小写)，值是标准化后的名称 (首字母大写，移除空格)
+VENDOR_MAPPING = {vendor: vendor.title().replace(' ', '') for vendor in RAW_VENDORS}
+# 别名或其他不规范的名称
+VENDOR_MAPPING['hisilicon'] = 'Huawei'
+VENDOR_MAPPING['nttdcm'] = 'NttDcm'
+VENDOR_MAPPING['china mobile'] = 'CMCC'
+
+SOURCE_PATTERN = re.compile(r'Source:\s*(.+)', re.IGNORECASE)
+_MEETING = re.compile(r"TSG[\s_-]*RAN[\s_-]*WG\s*(\d)\D{0,20}?#\s*(\d+(?:[\s-]?(?:bis|e))?)", re.I)
+_MEETING_FOLDER = re.compile(r"(?:TSGR|RAN)(\d)_(\d+(?:bis|e)?)", re.I)
+_AGENDA = re.compile(r"Agenda\s*item\s*:?\s*(\d+(?:\.\d+)*)", re.I)
+
+_REPORT_HEADER = re.compile(
+    r"chair(?:man)?['’]?s?\s+notes?|\bminutes\b|draft report|final report|report of (?:the )?(?:3gpp )?tsg", re.I)
+_FLS_HEADER = re.compile(
+    r"feature\s+lead\s+summary|\bFL\s+summary|moderator['’]?s?\s+summary|summary\s+(?:#\s*\d+\s+)?(?:of|on|for)\b", re.I)
+_SOURCE = re.compile(r"^\s*source\s*:\s*(.+)", re.I)
+_TITLE = re.compile(r"^\s*title\s*:\s*(.+)", re.I)
+_CHAIR_SOURCE = re.compile(r"\b(?:chair(?:man)?|vice[- ]chair(?:man)?|MCC)\b", re.I)
+_MODERATOR_SOURCE = re.compile(r"\b(?:moderator|feature lead)\b", re.I)
+
+def classify_by_filename(filename):
+    """indexer 原来的规则：文件名含 report/minutes -> Report，含 summary -> FLS。看不出来返回 None。"""
+    name = filename.lower()
+    if "report" in name or "minutes" in name:
+        return "Report"
+    if "summary" in name:
+        return "FLS"
+    return None
+
+def classify_by_header(lines):
+    """根据开头几段的 Title / Source 行判断层级，看不出来返回 None。"""
+    title = source = None
+    for line in lines[:HEADER_PARAGRAPHS]:
+        if title is None and (m := _TITLE.match(line)):
+            title = m.group(1)
+        elif source is None and (m := _SOURCE.match(line)):
+            source = m.group(1)
+    if title:
+        if _REPORT_HEADER.search(title):
+            return "Report"
+        if _FLS_HEADER.search(title):
+            return "FLS"
+    if source:
+        if _CHAIR_SOURCE.search(source):
+            return "Report"
+        if _MODERATOR_SOURCE.search(source):
+            return "FLS"
+    return None
+
+def classify_doc_type(filename, header_lines=None):
+    """返回 "Report" / "FLS" / "TDoc"。header_lines 为文档开头的段落文本 (可选)。"""
+    return classify_by_filename(filename) or classify_by_header(header_lines or []) or "TDoc"
+
+def extract_vendors(lines):
+    """
+    从 Source 行解析厂商。返回 (标准化厂商名集合, 不认识的名字列表)。
+    "Source: Huawei, HiSilicon" -> ({"Huawei"}, [])；"Source: Moderator (Ericsson)" -> ({"Ericsson"}, ["Moderator"])
+    """
+    found, unknown = set(), []
+    for line in lines[:HEADER_PARAGRAPHS]:
+        match = SOURCE_PATTERN.search(line)
+        if not match:
+            continue
+        vendors_str = match.group(1).lower()
+        for vendor_name in re.findall(r'[a-zA-Z0-9]+', vendors_str):
+            final_vendor_name = VENDOR_MAPPING.get(vendor_name)
+            if final_vendor_name:
+                found.add(final_vendor_name)
+            else:
+                unknown.append(vendor_name)
+        # 多词厂商名 ("china mobile"、"ntt dcm") 按整体再匹配一次
+        for alias, name in VENDOR_MAPPING.items():
+            if " " in alias.strip() and alias.strip() in vendors_str:
+                found.add(name)
+                unknown = [w for w in unknown if w not in alias.split()]
+        break
+    return found, unknown
+
+def normalize_meeting(wg, number):
+    return f"RAN{wg}#{number.replace(' ', '').replace('-', '').lower()}"
+
+def extract_meeting(lines, folder=None):
+    """"3GPP TSG RAN WG1 #123" -> "RAN1#123"；文档里没写时按文件夹名 (tdocs/RAN1_123) 推断。"""
+    for line in lines[:HEADER_PARAGRAPHS]:
+        if m := _MEETING.search(line):
+            return normalize_meeting(*m.groups())
+    if folder and (m := _MEETING_FOLDER.search(os.path.basename(os.path.normpath(folder)))):
+        return normalize_meeting(*m.groups())
+    return None
+
+def extract_agenda(lines):
+    for line in lines[:HEADER_PARAGRAPHS]:
+        if m := _AGENDA.search(line):
+            return m.group(1)
+    return None
+
+def vendor_key(vendor):
+    """Chroma 的元数据只能是标量，每个厂商单独一个布尔键，检索时 where={"vendor_Huawei": True}。"""
+    return f"vendor_{vendor}"
+
+def tdoc_metadata(file_path, filename=None, folder=None):
+    """
+    一篇 TDoc 的文档级元数据 (每个切片共用)：
+    {"type", "vendor": "Huawei, ZTE", "vendor_Huawei": True, ..., "meeting": "RAN1#123", "agenda": "9.1.1"}
+    Chroma 不接受 None 值，解析不到的字段不出现。
+    """
+    filename = filename or os.path.basename(file_path)
+    header = read_header(file_path) or []
+    meta = {"type": classify_doc_type(filename, header)}
+    vendors, _ = extract_vendors(header)
+    meta["vendor"] = ", ".join(sorted(vendors)) if vendors else "Unknown"
+    for vendor in vendors:
+        meta[vendor_key(vendor)] = True
+    meeting = extract_meeting(header, folder or os.path.dirname(file_path))
+    if meeting:
+        meta["meeting"] = meeting
+    agenda = extract_agenda(header)
+    if agenda:
+        meta["agenda"] = agenda
+    return meta
+
+def read_header(file_path):
+    """文档开头的段落文本 (不过滤短行，"Source: LG" 这种也要保留)；读不了返回 None。"""
+    try:
+        return [p["text"] for p in load_docx(file_path)["paragraphs"][:HEADER_PARAGRAPHS]]
+    except Exception:
+        return None
+
+def sniff_doc_type(file_path, filename=None):
+    filename = filename or os.path.basename(file_path)
+    if doc_type := classify_by_filename(filename):
+        return doc_type
+    return classify_doc_type(filename, read_header(file_path))
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# 仓库是平铺的脚本模块，没有包结构：把仓库根目录放进 sys.path，从任何目录运行 pytest 都能 import
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
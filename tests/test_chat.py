@@ -0,0 +1,27 @@
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("numpy")
+pytest.importorskip("colorama")
+pytest.importorskip("docx")
+
+from chat import lexical_only
+
+SPECS, TDOCS = SimpleNamespace(name="ran1_specs"), SimpleNamespace(name="ran1_docs")
+
+
+def test_identifier_query_skips_embedding_when_every_collection_has_bm25():
+    lexical = {"ran1_specs": object(), "ran1_docs": object()}
+    assert lexical_only("R1-2501234", lexical, [SPECS, TDOCS])
+
+
+def test_identifier_query_still_embeds_when_a_collection_lacks_bm25():
+    # TDoc 集合没有倒排索引：只查倒排会让它什么都返回不了
+    assert not lexical_only("R1-2501234", {"ran1_specs": object()}, [SPECS, TDOCS])
+    assert not lexical_only("R1-2501234", {}, [SPECS, TDOCS])
+
+
+def test_natural_language_query_always_embeds():
+    lexical = {"ran1_specs": object(), "ran1_docs": object()}
+    assert not lexical_only("how is DMRS defined in 38.211?", lexical, [SPECS, TDOCS])
@@ -0,0 +1,21 @@
+import os
+
+import file_manifest
+from file_manifest import file_sha256
+
+
+def test_file_sha256_is_memoized_until_the_file_changes(tmp_path, monkeypatch):
+    calls = []
+    real = file_manifest.hashlib.sha256
+    monkeypatch.setattr(file_manifest.hashlib, "sha256", lambda *a: calls.append(1) or real(*a))
+    path = tmp_path / "R1-2501234.docx"
+    path.write_bytes(b"a" * 1000)
+
+    first = file_sha256(str(path))
+    assert file_sha256(str(path)) == first
+    assert len(calls) == 1
+
+    path.write_bytes(b"b" * 1001)
+    os.utime(path, ns=(0, 10 ** 9))
+    assert file_sha256(str(path)) != first
+    assert len(calls) == 2
@@ -0,0 +1,33 @@
+from quote_index import QuoteIndex
+
+
+def boilerplate(n):
+    return [f"Proposal {i}: Support the working assumption on CSI reporting for case {i % 7}." for i in range(n)]
+
+
+def test_exact_quote_in_repetitive_text():
+    # 大量重复句式：几乎所有 gram 都超过 MAX_POSTINGS，逐字引用仍要定位到正确的那一行
+    paras = boilerplate(2000)
+    text = "\n".join(paras)
+    match = QuoteIndex(text).locate(paras[5])
+    assert match is not None
+    assert match["score"] == 1.0
+    assert text[match["start"]:match["end"]] == paras[5]
+
+
+def test_fuzzy_quote_tolerates_whitespace_and_hyphenation():
+    text = "Intro.\nProposal 3: The UE supports up-\nlink DMRS with 4 ports per layer group.\nEnd."
+    match = QuoteIndex(text).locate("Proposal 3: The UE supports uplink DMRS with 4 ports per layer group.")
+    assert match is not None
+    assert text[match["start"]:match["end"]].startswith("Proposal 3")
+
+
+def test_fuzzy_quote_with_small_edit():
+    text = "Observation 2: Beam failure recovery latency is reduced by 30 percent in FR2 scenarios."
+    match = QuoteIndex(text).locate("Observation 2: Beam failure recovery latency is reduced by 30 % in FR2 scenarios.")
+    assert match is not None and match["score"] < 1.0
+
+
+def test_unrelated_quote_is_rejected():
+    text = "\n".join(boilerplate(50))
+    assert QuoteIndex(text).locate("The gNB shall configure SRS resources for antenna switching.") is None
@@ -0,0 +1,110 @@
+import asyncio
+import json
+import threading
+
+import pytest
+
+pytest.importorskip("numpy")
+pytest.importorskip("colorama")
+pytest.importorskip("docx")
+
+import rag_server
+from rag_server import RagServer, stub_generate
+
+
+class StubEngine:
+    """不加载模型和知识库：检索返回空结果，生成走 rag_server.stub_generate，并记录同时生成的个数。"""
+    llm_mode = "stub"
+    llm_cache = None
+
+    def __init__(self):
+        self.active = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+
+    def prepare(self, raw_query):
+        return {"query": raw_query, "where": None, "embedding": None, "fp": "fp", "kb": "kb", "cached": None,
+                "spec_blocks": [], "tdoc_blocks": [], "pack": {}, "timings": {}}
+
+    def generate(self, prompt, cache=None):
+        with self._lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        try:
+            yield from stub_generate(prompt, cache)
+        finally:
+            with self._lock:
+                self.active -= 1
+
+
+@pytest.fixture(autouse=True)
+def fast_stub(monkeypatch):
+    monkeypatch.setattr(rag_server, "STUB_TOKENS", 5)
+    monkeypatch.setattr(rag_server, "STUB_DELAY", 0.01)
+
+
+async def request(port, method, path, body=b""):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(f"{method} {path} HTTP/1.1\r\nHost: test\r\nContent-Length: {len(body)}\r\n\r\n".encode() + body)
+    await writer.drain()
+    raw = await reader.read()
+    writer.close()
+    head, _, payload = raw.partition(b"\r\n\r\n")
+    return int(head.split()[1]), payload.decode("utf-8")
+
+
+def events(payload):
+    out = []
+    for block in payload.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        out.append((lines["event"], json.loads(lines["data"])))
+    return out
+
+
+def run_with_server(engine, scenario, **server_args):
+    async def main():
+        server = RagServer(engine, **server_args)
+        srv = await asyncio.start_server(server.handle, "127.0.0.1", 0)
+        port = srv.sockets[0].getsockname()[1]
+        async with srv:
+            return await scenario(port, server)
+    return asyncio.run(main())
+
+
+def test_ask_streams_stub_answer():
+    async def scenario(port, server):
+        return await request(port, "POST", "/ask", json.dumps({"question": "DMRS?"}).encode())
+
+    status, payload = run_with_server(StubEngine(), scenario)
+    assert status == 200
+    evs = events(payload)
+    assert evs[0][0] == "meta" and evs[-1][0] == "done"
+    tokens = [data for name, data in evs if name == "token"]
+    assert tokens == [f"[stub {i}] " for i in range(5)]
+
+
+@pytest.mark.parametrize("body", [b"[]", b'"x"', b"1", b"{not json", b"{}", b'{"question": 5}', b'{"question": "  "}'])
+def test_ask_rejects_bad_input(body):
+    async def scenario(port, server):
+        return await request(port, "POST", "/ask", body)
+
+    status, payload = run_with_server(StubEngine(), scenario)
+    assert status == 400
+    assert "error" in json.loads(payload)
+
+
+def test_generation_is_bounded_and_overflow_gets_503():
+    engine = StubEngine()
+
+    async def scenario(port, server):
+        body = json.dumps({"question": "q"}).encode()
+        results = await asyncio.gather(*(request(port, "POST", "/ask", body) for _ in range(8)))
+        _, metrics = await request(port, "GET", "/metrics")
+        return results, json.loads(metrics)
+
+    results, metrics = run_with_server(engine, scenario, gen_concurrency=2, queue_limit=3)
+    statuses = sorted(status for status, _ in results)
+    assert engine.peak <= 2
+    assert statuses.count(200) >= 3 and 503 in statuses
+    assert metrics["rejected"] == statuses.count(503)
+    assert metrics["queue_depth"] == 0 and metrics["generating"] == 0
@@ -0,0 +1,56 @@
+from doc_sections import split_sections, merge_points
+
+
+def covered(sections, total):
+    """区间并集是否覆盖 [0, total)；段落之间的 "\n" 可以落在区间外。"""
+    reach = 0
+    for start, end in sorted(sections):
+        if start > reach + 1:
+            return False
+        reach = max(reach, end)
+    return reach >= total
+
+
+def test_short_document_is_one_section():
+    paragraphs = [("a" * 50, False), ("b" * 50, False)]
+    assert split_sections(paragraphs, max_chars=1000, overlap=100) == [(0, 101)]
+
+
+def test_sections_respect_limit_and_cover_text():
+    paragraphs = [(f"paragraph {i} " + "x" * 80, i % 10 == 0) for i in range(100)]
+    total = sum(len(t) for t, _ in paragraphs) + len(paragraphs) - 1
+    sections = split_sections(paragraphs, max_chars=1000, overlap=150)
+    assert len(sections) > 1
+    assert all(end - start <= 1000 for start, end in sections)
+    assert covered(sections, total)
+
+
+def test_oversized_paragraph_is_split_into_overlapping_windows():
+    # 一个远超 max_chars 的段落 (大表格 / 没有分段的正文) 夹在普通段落中间
+    paragraphs = [("intro " * 20, False), ("T" * 5000, False), ("tail " * 20, False)]
+    total = sum(len(t) for t, _ in paragraphs) + len(paragraphs) - 1
+    sections = split_sections(paragraphs, max_chars=1000, overlap=100)
+    assert all(end - start <= 1000 for start, end in sections)
+    assert covered(sections, total)
+    # 超长段落内部相邻窗口有重叠
+    big_start = len(paragraphs[0][0]) + 1
+    inside = [s for s in sections if s[0] >= big_start and s[1] <= big_start + 5000]
+    assert any(b[0] < a[1] for a, b in zip(inside, inside[1:]))
+
+
+def point(start, end, score, topic="t", argument="a"):
+    return {"quote_start": start, "quote_end": end, "quote_score": score,
+            "topic": topic, "stance": "Support", "key_argument": argument}
+
+
+def test_merge_points_keeps_best_of_overlapping_quotes():
+    # 相邻两段的重叠区里同一条证据被提取两次，只留匹配度高的那条
+    points = [point(100, 200, 0.8, argument="x"), point(120, 210, 1.0, argument="y"),
+              point(500, 560, 0.9, topic="other", argument="z")]
+    merged = merge_points(points)
+    assert [(p["quote_start"], p["quote_score"]) for p in merged] == [(120, 1.0), (500, 0.9)]
+
+
+def test_merge_points_dedupes_same_argument_at_different_places():
+    points = [point(0, 50, 0.7, topic="DMRS  density"), point(900, 950, 0.9, topic="dmrs density")]
+    assert len(merge_points(points)) == 1
@@ -0,0 +1,46 @@
+from collections import deque
+
+# === 分层优先队列 ===
+# 平滑加权轮询 (smooth weighted round robin，nginx upstream 同款)：
+# 每次出队时各非空层的 current += weight，取 current 最大的层出队，再减去本轮总权重。
+# 权重 6:3:1 时每 10 个名额里 Report 6 个、FLS 3 个、TDoc 1 个，且交错分布 (不会连续饿死低层)；
+# 某层空了，它的份额自动分给其他层。
+
+class TierQueue:
+    """
+    用法:
+        q = TierQueue({"Report": 6, "FLS": 3, "TDoc": 1})
+        q.put("Report", item)
+        tier, item = q.get()   # 全部为空时返回 None
+    """
+
+    def __init__(self, weights):
+        if not weights or any(w <= 0 for w in weights.values()):
+            raise ValueError(f"层级权重必须为正数: {weights}")
+        self.weights = dict(weights)
+        self._queues = {tier: deque() for tier in self.weights}
+        self._current = {tier: 0 for tier in self.weights}
+
+    def put(self, tier, item):
+        if tier not in self._queues:
+            raise KeyError(f"未配置权重的层级: {tier}")
+        self._queues[tier].append(item)
+
+    def get(self):
+        active = [t for t, q in self._queues.items() if q]
+        if not active:
+            return None
+        total = 0
+        for t in active:
+            self._current[t] += self.weights[t]
+            total += self.weights[t]
+        # 并列时按配置顺序 (高层在前)
+        best = max(active, key=lambda t: self._current[t])
+        self._current[best] -= total
+        return best, self._queues[best].popleft()
+
+    def __len__(self):
+        return sum(len(q) for q in self._queues.values())
+
+    def sizes(self):
+        return {t: len(q) for t, q in self._queues.items()}
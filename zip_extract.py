@@ -0,0 +1,119 @@
+import os
+import re
+import shutil
+import tempfile
+import threading
+import zipfile
+
+# === zip 解压 ===
+# 下载脚本原来先把整个 zip 写盘，再 extractall 读回来，最后删掉 zip；包里的杂项 (__MACOSX、~$ 临时文件、
+# 图片、xlsx ...) 也全部解压，成员路径也不检查 (zip-slip: "../../x" 可以写到目录外面)。
+# 现在：
+#   - 小 zip 下载进 SpooledTemporaryFile 直接在内存里解压，超过 SPOOL_MAX 才落到磁盘 (同盘临时文件)；
+#   - 只解压 KEEP_SUFFIXES 的成员，路径逃出目标目录的成员直接拒绝；
+#   - 每个成员先写同目录临时文件，读完 (zipfile 在读到结尾时校验 CRC) 且大小一致后 os.replace 原子替换，
+#     中途出错不会留下半个 docx；
+#   - 统计省下的磁盘读写：内存里处理的 zip 省了一次写 + 一次读，跳过的成员省了一次写。
+
+SPOOL_MAX = 32 * 1024 * 1024 # 超过这个大小的 zip 落盘处理 (字节)
+KEEP_SUFFIXES = (".docx", ".doc", ".pdf")
+COPY_BUFFER = 1024 * 1024
+
+_JUNK = re.compile(r"(^|/)(__MACOSX/|\._|~\$)")
+
+def spooled_buffer(save_dir):
+    """下载 zip 用的缓冲区：SPOOL_MAX 以内在内存里，超出后自动转存到 save_dir 下的临时文件。"""
+    return tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX, dir=save_dir)
+
+def safe_target(save_dir, member_name):
+    """成员在 save_dir 下的落盘路径；绝对路径、盘符、".." 等逃出目录的成员返回 None。"""
+    name = member_name.replace("\\", "/")
+    if name.startswith("/") or re.match(r"^[A-Za-z]:", name):
+        return None
+    parts = [p for p in name.split("/") if p not in ("", ".")]
+    if not parts or ".." in parts:
+        return None
+    root = os.path.abspath(save_dir)
+    target = os.path.abspath(os.path.join(root, *parts))
+    if os.path.commonpath([root, target]) != root:
+        return None
+    return target
+
+def wanted(member_name):
+    name = member_name.replace("\\", "/")
+    return name.lower().endswith(KEEP_SUFFIXES) and not _JUNK.search(name)
+
+def _write_atomic(zf, info, target):
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(target), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as out, zf.open(info) as src:
+            shutil.copyfileobj(src, out, COPY_BUFFER)
+        if os.path.getsize(tmp_path) != info.file_size:
+            raise zipfile.BadZipFile(f"解压结果不完整: {info.filename}")
+        os.replace(tmp_path, target)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+class ExtractStats:
+    """多线程共用的解压统计，format() 给出一行汇总。"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.archives = 0
+        self.in_memory = 0
+        self.kept = 0
+        self.skipped = 0
+        self.unsafe = 0
+        self.kept_bytes = 0
+        self.io_saved = 0
+
+    def add(self, archive_bytes, in_memory, kept, kept_bytes, skipped, skipped_bytes, unsafe):
+        with self._lock:
+            self.archives += 1
+            self.in_memory += in_memory
+            self.kept += kept
+            self.kept_bytes += kept_bytes
+            self.skipped += skipped
+            self.unsafe += unsafe
+            # 内存里处理的 zip：少写一次、少读一次；跳过的成员：少写一次
+            self.io_saved += (2 * archive_bytes if in_memory else 0) + skipped_bytes
+
+    def format(self):
+        return (f"解压: {self.archives} 个 zip (内存中 {self.in_memory}) | 保留 {self.kept} 个文件 "
+                f"{self.kept_bytes / 1e6:.1f}MB | 跳过 {self.skipped} 个无关成员 | 拒绝 {self.unsafe} 个越界路径 | "
+                f"省下磁盘读写 {self.io_saved / 1e6:.1f}MB")
+
+def extract_archive(source, save_dir, stats=None, in_memory=False):
+    """
+    source 为 zip 路径或已下载好的文件对象 (例如 spooled_buffer)。
+    只解压 KEEP_SUFFIXES 成员，返回解压出的相对路径列表；zip 损坏 / CRC 不符抛 zipfile.BadZipFile。
+    """
+    if isinstance(source, (str, os.PathLike)):
+        archive_bytes = os.path.getsize(source)
+    else:
+        source.seek(0, os.SEEK_END)
+        archive_bytes = source.tell()
+        source.seek(0)
+    extracted = []
+    kept_bytes = skipped = skipped_bytes = unsafe = 0
+    with zipfile.ZipFile(source, "r") as zf:
+        for info in zf.infolist():
+            if info.is_dir():
+                continue
+            if not wanted(info.filename):
+                skipped += 1
+                skipped_bytes += info.file_size
+                continue
+            target = safe_target(save_dir, info.filename)
+            if target is None:
+                unsafe += 1
+                continue
+            _write_atomic(zf, info, target)
+            extracted.append(os.path.relpath(target, save_dir))
+            kept_bytes += info.file_size
+    if stats is not None:
+        stats.add(archive_bytes, in_memory, len(extracted), kept_bytes, skipped, skipped_bytes, unsafe)
+    return extracted